@@ -0,0 +1,206 @@
+"""
+Warm ETL worker processes for the data refresh.
+
+Instead of spawning a Python interpreter per job, the API keeps up to
+ETL_WORKER_PROCESSES long-lived worker processes. Each one imports the ETL code
+from ETL_JOBS_DIR once and keeps its Odoo session and PostgreSQL connection open
+between runs, so a refresh starts immediately. Jobs are `account_move_upsert.run(config)`
+calls whose results come back as dicts over a pipe (no stdout parsing); their
+progress events (treasury_etl.ProgressReporter) are streamed over the same pipe
+while the job runs. Cancelling a `run()` kills the process running it: PostgreSQL
+rolls its open transaction back and releases its advisory locks.
+"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from typing import Awaitable, Callable, Dict, Optional
+
+ETL_JOBS_DIR = os.getenv("ETL_JOBS_DIR", "/etl_jobs")
+ETL_WORKER_PROCESSES = int(os.getenv("ETL_WORKER_PROCESSES", "2"))
+
+
+class EtlJobError(Exception):
+    """An ETL run raised inside the worker; the message carries its traceback."""
+
+
+def _worker_main(conn, jobs_dir: str, env: Dict[str, str]) -> None:
+    """
+    Worker process loop: receive a config, send ("progress", event) messages while
+    it runs, then ("result", dict) or ("error", str).
+    """
+    sys.path.insert(0, jobs_dir)
+    os.environ.update(env)
+    import account_move_upsert  # noqa: E402 - imported once, kept warm
+
+    while True:
+        try:
+            config = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            result = account_move_upsert.run(config, on_progress=lambda event: conn.send(("progress", event)))
+            conn.send(("result", result))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+
+class EtlWorker:
+    """One long-lived ETL process and the parent end of its pipe."""
+
+    def __init__(self, context):
+        # The ETL scripts read PG* variables; in the API container they come from DB_*
+        env = {
+            'PGHOST': os.getenv('DB_HOST', 'postgres'),
+            'PGPORT': os.getenv('DB_PORT', '5432'),
+        }
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, ETL_JOBS_DIR, env), name="etl-worker", daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+
+    def call(self, config: dict, timeout: float, on_event: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Run one job, blocking until its result (raises TimeoutError / EtlJobError);
+        progress events are passed to `on_event` as they arrive.
+        """
+        self._conn.send(config)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not self._conn.poll(remaining):
+                raise TimeoutError(f"ETL job exceeded {timeout:.0f}s")
+            kind, payload = self._conn.recv()
+            if kind == "result":
+                return payload
+            if kind == "error":
+                raise EtlJobError(payload)
+            if kind == "progress" and on_event is not None:
+                on_event(payload)
+
+    def terminate(self) -> None:
+        self.process.kill()
+        self.process.join(5)
+        self._conn.close()
+
+
+class EtlWorkerPool:
+    """Up to `size` warm workers; a worker that times out or dies is replaced lazily."""
+
+    def __init__(self, size: int = ETL_WORKER_PROCESSES):
+        self.size = max(size, 1)
+        # spawn: the API process runs threads, forking it is not safe
+        self._context = multiprocessing.get_context("spawn")
+        self._idle: "queue.Queue[EtlWorker]" = queue.Queue()
+        self._started = 0
+        self._lock = threading.Lock()
+        self._workers: list = []
+
+    def _acquire(self) -> EtlWorker:
+        while True:
+            with self._lock:
+                if self._idle.empty() and self._started < self.size:
+                    self._started += 1
+                    worker = EtlWorker(self._context)
+                    self._workers.append(worker)
+                    return worker
+            worker = self._idle.get()
+            if worker is not None:
+                return worker
+            # None: a worker was discarded, its slot is free again
+
+    def _release(self, worker: Optional[EtlWorker]) -> None:
+        if worker is None:
+            with self._lock:
+                self._started -= 1
+        self._idle.put(worker)
+
+    def _run_blocking(self, config: dict, timeout: float, on_event=None, call: Optional[dict] = None) -> dict:
+        worker = self._acquire()
+        if call is not None:
+            with self._lock:
+                if call.get('cancelled'):
+                    self._release(worker)
+                    raise asyncio.CancelledError()
+                call['worker'] = worker
+        try:
+            return worker.call(config, timeout, on_event)
+        except (TimeoutError, EOFError, OSError):
+            # Stuck or dead process: kill it so its transaction and locks are released
+            worker.terminate()
+            with self._lock:
+                self._workers.remove(worker)
+            worker = None
+            raise
+        finally:
+            self._release(worker)
+
+    async def run(self, config: dict, timeout: float = 600,
+                  on_event: Optional[Callable[[dict], Awaitable[None]]] = None) -> dict:
+        """
+        Run one job; `on_event` is awaited in order, on the event loop, for each
+        progress event. If the caller is cancelled, the worker process is killed.
+        """
+        call: dict = {}
+        job = None
+        try:
+            if on_event is None:
+                return await asyncio.to_thread(self._run_blocking, config, timeout, None, call)
+            loop = asyncio.get_running_loop()
+            events: asyncio.Queue = asyncio.Queue()
+            job = asyncio.ensure_future(asyncio.to_thread(
+                self._run_blocking, config, timeout,
+                lambda event: loop.call_soon_threadsafe(events.put_nowait, event), call
+            ))
+            while not job.done():
+                next_event = asyncio.ensure_future(events.get())
+                await asyncio.wait({job, next_event}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event.done():
+                    await on_event(next_event.result())
+                else:
+                    next_event.cancel()
+            # Events queued before the job finished are scheduled ahead of its completion
+            while not events.empty():
+                await on_event(events.get_nowait())
+            return job.result()
+        except asyncio.CancelledError:
+            with self._lock:
+                call['cancelled'] = True
+                worker = call.get('worker')
+            if worker is not None:
+                # The blocking call then fails on the closed pipe and discards the worker
+                worker.terminate()
+            if job is not None:
+                job.add_done_callback(lambda done: done.cancelled() or done.exception())
+            raise
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for worker in self._workers:
+                worker.terminate()
+            self._workers.clear()
+            self._started = 0
+        self._idle = queue.Queue()
+
+
+_pool: Optional[EtlWorkerPool] = None
+
+
+def get_pool() -> EtlWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = EtlWorkerPool()
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
@@ -0,0 +1,139 @@
+"""
+Durable job queue in PostgreSQL (table `job_queue`).
+
+The API enqueues work (`enqueue`) instead of running it in its own process; the
+standalone worker (app/job_worker.py) claims jobs with `SELECT ... FOR UPDATE
+SKIP LOCKED`, so any number of workers can consume the queue without claiming
+the same job twice. A claimed job is leased for JOB_VISIBILITY_TIMEOUT seconds,
+extended by the worker while it runs (`heartbeat`): if the worker dies, the
+lease expires and another worker picks the job up again. Failed jobs are
+retried with an exponential backoff until `max_attempts`. A cancelled job
+(`cancel`) loses its lease: its worker notices on the next heartbeat and stops it.
+
+Handlers are registered per job kind with `handler(kind)`; a job's
+`singleton_key` allows at most one queued or running job per key (e.g. one
+data refresh at a time), enforced by a unique partial index.
+"""
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "120"))
+# First retry delay in seconds, doubled on each further attempt
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", "30"))
+
+# kind -> (handler(payload) -> result, on_failure(payload, error) or None)
+HANDLERS: Dict[str, tuple] = {}
+
+
+def handler(kind: str, on_failure: Optional[Callable[[Dict, str], Any]] = None):
+    """
+    Register the function running jobs of `kind` (called with the payload, may be
+    async); `on_failure` is called once the job has failed for good
+    """
+    def register(func):
+        HANDLERS[kind] = (func, on_failure)
+        return func
+    return register
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def enqueue(db: Session, kind: str, payload: Optional[Dict] = None, priority: int = 0,
+            max_attempts: int = 3, singleton_key: Optional[str] = None,
+            run_at: Optional[datetime] = None) -> Optional[models.JobQueue]:
+    """
+    Add a job in the caller's transaction (committed by the caller). Returns None,
+    without touching the rest of the transaction, if `singleton_key` already has a
+    queued or running job.
+    """
+    job = models.JobQueue(
+        kind=kind, payload=payload or {}, status='queued', priority=priority,
+        max_attempts=max_attempts, singleton_key=singleton_key, run_at=run_at or _now(), attempts=0
+    )
+    try:
+        with db.begin_nested():
+            db.add(job)
+    except IntegrityError:
+        return None
+    return job
+
+
+def claim(db: Session, worker_id: str, kinds: Optional[List[str]] = None,
+          visibility: int = JOB_VISIBILITY_TIMEOUT) -> Optional[models.JobQueue]:
+    """
+    Lease the next job (highest priority, then oldest): a queued job that is due,
+    or a running one whose lease expired. Committed before returning.
+    """
+    now = _now()
+    query = db.query(models.JobQueue).filter(or_(
+        (models.JobQueue.status == 'queued') & (models.JobQueue.run_at <= now),
+        (models.JobQueue.status == 'running') & (models.JobQueue.locked_until < now)
+    ))
+    if kinds:
+        query = query.filter(models.JobQueue.kind.in_(kinds))
+    job = query.order_by(
+        models.JobQueue.priority.desc(), models.JobQueue.run_at, models.JobQueue.job_id
+    ).with_for_update(skip_locked=True).first()
+    if job is None:
+        db.rollback()
+        return None
+    job.status = 'running'
+    job.attempts += 1
+    job.locked_by = worker_id
+    job.locked_until = now + timedelta(seconds=visibility)
+    job.started_at = now
+    db.commit()
+    return job
+
+
+def heartbeat(db: Session, job_id: int, worker_id: str, visibility: int = JOB_VISIBILITY_TIMEOUT) -> bool:
+    """Extend a running job's lease; False if the worker lost it (expired and reclaimed, or cancelled)"""
+    updated = db.query(models.JobQueue).filter(
+        models.JobQueue.job_id == job_id,
+        models.JobQueue.status == 'running',
+        models.JobQueue.locked_by == worker_id
+    ).update({'locked_until': _now() + timedelta(seconds=visibility)}, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+
+def complete(db: Session, job: models.JobQueue, result: Any = None) -> None:
+    job.status = 'done'
+    job.result = result
+    job.locked_until = None
+    job.finished_at = _now()
+    db.commit()
+
+
+def fail(db: Session, job: models.JobQueue, error: str) -> bool:
+    """
+    Record a failed attempt: the job is queued again after a backoff, or failed
+    for good once `max_attempts` is reached. Returns True if it will be retried.
+    """
+    job.last_error = error[-2000:]
+    job.locked_until = None
+    retry = job.attempts < job.max_attempts
+    if retry:
+        job.status = 'queued'
+        job.run_at = _now() + timedelta(seconds=JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+    else:
+        job.status = 'failed'
+        job.finished_at = _now()
+    db.commit()
+    return retry
+
+
+def cancel(db: Session, job: models.JobQueue) -> None:
+    """Cancel a queued or running job (committed by the caller)"""
+    job.status = 'cancelled'
+    job.locked_until = None
+    job.finished_at = _now()
@@ -0,0 +1,152 @@
+"""
+Standalone worker consuming the job queue (app/job_queue.py).
+
+Run with `python -m app.job_worker` (the `worker` service of docker-compose), as
+many replicas as needed: each one runs up to JOB_WORKER_CONCURRENCY jobs at a
+time, claimed with SKIP LOCKED, so heavy work (ETL refreshes) never runs in the
+API processes. While a job runs its lease is renewed every
+JOB_HEARTBEAT_INTERVAL seconds; if the lease is lost (the job was cancelled, or
+it expired and another worker took the job over) the handler is cancelled: an
+async handler receives CancelledError at its current await. On SIGTERM the worker
+stops claiming and lets the jobs in flight finish.
+"""
+import asyncio
+import importlib
+import inspect
+import os
+import signal
+import socket
+import threading
+import traceback
+from typing import List, Optional
+
+from app import job_queue
+from app.database import SessionLocal
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "1"))
+# Seconds between two polls of an empty queue
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# Seconds between two lease renewals of a running job (also how fast a cancellation is noticed)
+JOB_HEARTBEAT_INTERVAL = min(float(os.getenv("JOB_HEARTBEAT_INTERVAL", "5")), job_queue.JOB_VISIBILITY_TIMEOUT / 3)
+# Modules registering job handlers (job_queue.handler) when imported
+JOB_HANDLER_MODULES = ("app.routers.data_refresh",)
+
+
+class _HandlerCall:
+    """A running handler, cancellable from the heartbeat thread"""
+
+    def __init__(self):
+        self.lost = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+
+    def run(self, func, payload: dict):
+        result = func(payload)
+        if inspect.isawaitable(result):
+            # One event loop per job: handlers may await worker-pool calls and broadcasts
+            result = asyncio.run(self._watch(result))
+        return result
+
+    async def _watch(self, awaitable):
+        with self._lock:
+            self._loop, self._task = asyncio.get_running_loop(), asyncio.current_task()
+            if self.lost.is_set():
+                raise asyncio.CancelledError()
+        return await awaitable
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.lost.set()
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._task.cancel)
+
+
+def _keep_leased(job_id: int, worker_id: str, done: threading.Event, call: _HandlerCall) -> None:
+    db = SessionLocal()
+    try:
+        while not done.wait(max(JOB_HEARTBEAT_INTERVAL, 0.1)):
+            if not job_queue.heartbeat(db, job_id, worker_id):
+                print(f"Job {job_id}: lease lost (cancelled or taken over), stopping it")
+                call.cancel()
+                return
+    finally:
+        db.close()
+
+
+def run_one(worker_id: str, kinds: Optional[List[str]] = None) -> bool:
+    """Claim and run one job; False if there was none to run"""
+    db = SessionLocal()
+    try:
+        job = job_queue.claim(db, worker_id, kinds)
+        if job is None:
+            return False
+        func, on_failure = job_queue.HANDLERS.get(job.kind, (None, None))
+        error = None
+        if job.attempts > job.max_attempts:
+            # Leased by workers that died (or hung) on every attempt
+            error = f"Délai de visibilité expiré après {job.max_attempts} tentatives"
+        elif func is None:
+            error = f"Aucun gestionnaire pour les tâches « {job.kind} »"
+            job.attempts = job.max_attempts
+        if error is None:
+            done, call = threading.Event(), _HandlerCall()
+            heartbeat = threading.Thread(target=_keep_leased, args=(job.job_id, worker_id, done, call), daemon=True)
+            heartbeat.start()
+            try:
+                result = call.run(func, dict(job.payload or {}))
+            except asyncio.CancelledError:
+                error = traceback.format_exc()
+            except Exception:
+                error = traceback.format_exc()
+            finally:
+                done.set()
+                heartbeat.join()
+            if call.lost.is_set():
+                # The job is no longer ours: whoever cancelled or took it over records its outcome
+                print(f"Job {job.job_id} ({job.kind}) stopped")
+                return True
+            if error is None:
+                job_queue.complete(db, job, result)
+                return True
+        print(f"Job {job.job_id} ({job.kind}) failed: {error.strip().splitlines()[-1]}")
+        if not job_queue.fail(db, job, error) and on_failure is not None:
+            on_failure(dict(job.payload or {}), error)
+        return True
+    finally:
+        db.close()
+
+
+def work(worker_id: str, stop: threading.Event, kinds: Optional[List[str]] = None) -> None:
+    while not stop.is_set():
+        try:
+            ran = run_one(worker_id, kinds)
+        except Exception:
+            traceback.print_exc()
+            ran = False
+        if not ran:
+            stop.wait(JOB_POLL_INTERVAL)
+
+
+def main() -> None:
+    for module in JOB_HANDLER_MODULES:
+        importlib.import_module(module)
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    host = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=work, args=(f"{host}:{n}", stop), name=f"job-worker-{n}")
+        for n in range(max(JOB_WORKER_CONCURRENCY, 1))
+    ]
+    print(f"Job worker {host}: {len(threads)} slot(s), handlers: {', '.join(sorted(job_queue.HANDLERS))}")
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    from app import etl_worker
+    etl_worker.shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
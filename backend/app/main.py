@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import (
@@ -14,6 +15,7 @@ from app.routers import (
     data_refresh,
     supervision
 )
+from app import etl_worker
 
 app = FastAPI(
     title="Treasury Management API",
@@ -44,6 +46,16 @@ app.include_router(analytics.router)
 app.include_router(data_refresh.router)
 app.include_router(supervision.router)
 
+@app.on_event("startup")
+async def start_refresh_relay():
+    # Refreshes run in the job worker: relay what it publishes to this process's WebSockets
+    app.state.refresh_relay = asyncio.create_task(data_refresh.relay_refresh_events())
+
+@app.on_event("shutdown")
+def stop_etl_workers():
+    app.state.refresh_relay.cancel()
+    etl_worker.shutdown_pool()
+
 @app.get("/")
 def root():
     return {
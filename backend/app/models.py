@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Numeric, Date, Text, ForeignKey, TIMESTAMP, Index, CheckConstraint, UniqueConstraint, JSON, Boolean
+from sqlalchemy import Column, Integer, SmallInteger, String, Numeric, Date, Text, ForeignKey, TIMESTAMP, Index, CheckConstraint, UniqueConstraint, JSON, Boolean
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from app.database import Base
 
 class User(Base):
@@ -23,6 +23,7 @@ class Company(Base):
     
     company_id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False)
+    currency = Column(String(3), nullable=True)
     
     movements = relationship("Movement", back_populates="company")
     exceptions = relationship("Exception", back_populates="company")
@@ -74,6 +75,13 @@ class Movement(Base):
     archive_reason = Column(Text, nullable=True)
     archive_version = Column(Integer, nullable=False, server_default="1")
     exclude_from_analytics = Column(Boolean, nullable=False, server_default="false")
+    # Import purchases: Odoo rate, currency and amount (open residual) before conversion
+    exchange_rate = Column(Numeric(18, 6), nullable=True)
+    currency = Column(String(3), nullable=True)
+    amount_currency = Column(Numeric(18, 2), nullable=True)
+    # Odoo identity of ETL rows (NULL for manual entries), the key of the ETL merge
+    odoo_id = Column(Integer, nullable=True)
+    installment = Column(SmallInteger, nullable=False, server_default="1")
     
     company = relationship("Company", back_populates="movements")
     manual_entry = relationship("ManualEntry", back_populates="movements")
@@ -87,6 +95,8 @@ class Movement(Base):
         Index("IX_Movement_archived_by", "archived_by"),
         Index("IX_Movement_disabled_by", "disabled_by"),
         UniqueConstraint("company_id", "reference_type", "reference", "archive_version", name="UX_Movement_reference"),
+        Index("UX_Movement_odoo", "company_id", "reference_type", "odoo_id", "installment", "archive_version",
+              unique=True, postgresql_where=text("odoo_id IS NOT NULL"), sqlite_where=text("odoo_id IS NOT NULL")),
     )
 
 class UserCompany(Base):
@@ -122,8 +132,13 @@ class Exception(Base):
     status = Column(String(20), nullable=False)
     exclude_from_analytics = Column(Boolean, nullable=False, server_default="false")
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    odoo_id = Column(Integer, nullable=True)
     
     company = relationship("Company", back_populates="exceptions")
+    
+    __table_args__ = (
+        Index("IX_Exception_type_odoo", "type", "company_id", "reference_type", "odoo_id"),
+    )
 
 class TreasuryBalance(Base):
     __tablename__ = "treasury_balance"
@@ -202,7 +217,7 @@ class DataRefreshExecution(Base):
     
     execution_id = Column(Integer, primary_key=True, index=True)
     status = Column(String(20), nullable=False)
-    started_by = Column(Integer, ForeignKey("User.user_id"), nullable=False)
+    started_by = Column(Integer, ForeignKey("User.user_id"), nullable=True)  # NULL: started by the scheduler
     started_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     completed_at = Column(TIMESTAMP(timezone=True), nullable=True)
     duration_seconds = Column(Integer, nullable=True)
@@ -211,6 +226,10 @@ class DataRefreshExecution(Base):
     progress_percentage = Column(Integer, nullable=False, server_default="0")
     current_step = Column(String(100), nullable=True)
     details = Column(JSON, nullable=True)
+    metrics = Column(JSON, nullable=True)  # Per-phase ETL wall / CPU / memory, per job
+    trigger = Column(String(20), nullable=False, server_default="manual")  # manual | schedule | probe
+    sources = Column(JSON, nullable=True)  # Source keys refreshed, NULL: all
+    scope = Column(JSON, nullable=True)  # {companies, dateFrom, dateTo}, NULL: everything
     created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
     
     starter = relationship("User", foreign_keys=[started_by])
@@ -221,6 +240,89 @@ class DataRefreshExecution(Base):
         Index("IX_data_refresh_execution_started_at", "started_at"),
         CheckConstraint("status IN ('running', 'completed', 'failed', 'cancelled')", name="CK_data_refresh_status"),
         CheckConstraint("progress_percentage >= 0 AND progress_percentage <= 100", name="CK_data_refresh_progress"),
+        CheckConstraint("trigger IN ('manual', 'schedule', 'probe')", name="ck_data_refresh_trigger"),
+    )
+
+class DataRefreshSourceLock(Base):
+    __tablename__ = "data_refresh_source_lock"
+    
+    source = Column(String(50), primary_key=True)  # ETL job key held by a running refresh
+    execution_id = Column(Integer, ForeignKey("data_refresh_execution.execution_id", ondelete="CASCADE"), nullable=False)
+    locked_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+class EtlSyncState(Base):
+    __tablename__ = "etl_sync_state"
+    
+    source = Column(String(100), primary_key=True)
+    last_write_date = Column(TIMESTAMP(timezone=False), nullable=True)
+    last_id = Column(Integer, nullable=False, server_default="0")
+    record_count = Column(Integer, nullable=False, server_default="0")
+    last_full_sync_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    last_sync_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+class EtlScanCursor(Base):
+    __tablename__ = "etl_scan_cursor"
+    
+    job = Column(String(200), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    position = Column(JSON, nullable=False)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+
+class EtlRawMove(Base):
+    __tablename__ = "etl_raw_move"
+    
+    etl_type = Column(String(100), primary_key=True)
+    odoo_id = Column(Integer, primary_key=True)
+    company_id = Column(Integer, nullable=True)
+    write_date = Column(TIMESTAMP(timezone=False), nullable=True)
+    payload = Column(JSON, nullable=False)
+    fetched_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_etl_raw_move_company", "etl_type", "company_id"),
+    )
+
+class CurrencyRate(Base):
+    __tablename__ = "currency_rate"
+    
+    odoo_id = Column(Integer, primary_key=True)
+    currency = Column(String(3), nullable=False)
+    company_id = Column(Integer, nullable=True)
+    rate_date = Column(Date, nullable=False)
+    rate = Column(Numeric(24, 12), nullable=False)
+    write_date = Column(TIMESTAMP(timezone=False), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_currency_rate_lookup", "currency", "company_id", "rate_date"),
+    )
+
+class JobQueue(Base):
+    __tablename__ = "job_queue"
+    
+    job_id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSON, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, server_default="queued")
+    priority = Column(Integer, nullable=False, server_default="0")
+    singleton_key = Column(String(100), nullable=True)
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False, server_default="3")
+    run_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    locked_by = Column(String(100), nullable=True)
+    locked_until = Column(TIMESTAMP(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    result = Column(JSON, nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    finished_at = Column(TIMESTAMP(timezone=True), nullable=True)
+    
+    __table_args__ = (
+        Index("ix_job_queue_ready", "priority", "run_at", "job_id", postgresql_where=text("status = 'queued'")),
+        Index("ix_job_queue_leases", "locked_until", postgresql_where=text("status = 'running'")),
+        Index("ux_job_queue_singleton", "singleton_key", unique=True,
+              postgresql_where=text("status IN ('queued', 'running')"),
+              sqlite_where=text("status IN ('queued', 'running')")),
+        CheckConstraint("status IN ('queued', 'running', 'done', 'failed', 'cancelled')", name="ck_job_queue_status"),
     )
 
 class SupervisionLog(Base):
@@ -248,5 +350,5 @@ class SupervisionLog(Base):
         Index("IX_supervision_log_action", "action"),
         Index("IX_supervision_log_company", "company_id"),
         CheckConstraint("entity_type IN ('movement', 'manual_entry', 'data_refresh')", name="CK_supervision_entity_type"),
-        CheckConstraint("action IN ('include', 'exclude', 'insert', 'update', 'delete', 'refresh', 'create', 'modify')", name="CK_supervision_action"),
+        CheckConstraint("action IN ('include', 'exclude', 'insert', 'update', 'delete', 'refresh', 'create', 'modify', 'cancel')", name="CK_supervision_action"),
     )
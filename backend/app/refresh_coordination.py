@@ -0,0 +1,167 @@
+"""
+Data refresh coordination across processes (API replicas, job workers,
+scheduler), through PostgreSQL.
+
+- Starts are serialized (`serialize_starts`): a transaction-level advisory lock
+  taken before the sources are checked and locked, so two processes cannot both
+  find them free.
+- Runs are exclusive (`hold_sources`): the worker running a refresh holds a
+  session advisory lock per source until it is done, on a dedicated connection.
+  A refresh whose sources were freed early (cancelled, its ETL still dying)
+  cannot overlap the next one: that one waits for the locks. If the worker
+  dies, PostgreSQL drops its session and the locks with it.
+- Progress is published with NOTIFY (`publish`), in the transaction that
+  writes it: PostgreSQL delivers it on commit, to every listening connection.
+  Each API process runs `listen`, which hands the messages to its own
+  WebSocket clients, so they see every refresh whichever replica they are
+  connected to.
+
+NOTIFY payloads are limited to 8000 bytes: a larger message is published as its
+type and execution id (`reload`), for the listener to rebuild it from the row.
+Off PostgreSQL (tests on sqlite) nothing is locked nor published.
+"""
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import engine
+
+CHANNEL = 'data_refresh'
+# NOTIFY payload limit is 8000 bytes, keep a margin
+MAX_PAYLOAD = 7900
+LOCK_PREFIX = 'data_refresh:'
+# Seconds between two attempts to take the sources of a refresh
+LOCK_RETRY_INTERVAL = 1
+# Seconds before reconnecting a lost listener
+LISTEN_RECONNECT_DELAY = 5
+
+
+def _on_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == 'postgresql'
+
+
+def serialize_starts(db: Session) -> None:
+    """Wait for the other refresh starts to commit; held until this transaction ends"""
+    if _on_postgres(db):
+        db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {'key': LOCK_PREFIX + 'start'})
+
+
+def publish(db: Session, message: Dict) -> None:
+    """NOTIFY `message` to every API process once the current transaction commits"""
+    if not _on_postgres(db):
+        return
+    payload = json.dumps(message, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD:
+        payload = json.dumps({'type': message['type'], 'executionId': message['executionId'], 'reload': True})
+    db.execute(text("SELECT pg_notify(:channel, :payload)"), {'channel': CHANNEL, 'payload': payload})
+
+
+def _dedicated_connection():
+    """A psycopg2 connection of its own, in autocommit (its session ends when it is closed)"""
+    raw = engine.raw_connection()
+    raw.detach()
+    connection = raw.dbapi_connection
+    connection.autocommit = True
+    return connection
+
+
+def _try_lock(connection, keys: List[str]) -> bool:
+    """Take the advisory locks of all `keys` or none of them"""
+    with connection.cursor() as cur:
+        for key in keys:
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (LOCK_PREFIX + key,))
+            if not cur.fetchone()[0]:
+                cur.execute("SELECT pg_advisory_unlock_all()")
+                return False
+    return True
+
+
+async def hold_sources(keys: List[str], on_wait: Optional[Callable[[], Awaitable[None]]] = None):
+    """
+    Take the run locks of the sources `keys`, retrying every LOCK_RETRY_INTERVAL
+    seconds while another refresh holds one of them (`on_wait` is awaited once,
+    when the first attempt fails). Returns their connection, to pass to `release`
+    """
+    if engine.dialect.name != 'postgresql':
+        return None
+    connection = await asyncio.to_thread(_dedicated_connection)
+    try:
+        waiting = False
+        while not await asyncio.to_thread(_try_lock, connection, sorted(keys)):
+            if not waiting and on_wait is not None:
+                waiting = True
+                await on_wait()
+            await asyncio.sleep(LOCK_RETRY_INTERVAL)
+        return connection
+    except BaseException:
+        connection.close()
+        raise
+
+
+def release(connection) -> None:
+    """Free the sources taken by `hold_sources` (closing the session drops its locks)"""
+    if connection is not None:
+        connection.close()
+
+
+def _listen_connection():
+    connection = _dedicated_connection()
+    with connection.cursor() as cur:
+        cur.execute(f"LISTEN {CHANNEL}")
+    return connection
+
+
+def _drain(connection, received: asyncio.Queue) -> None:
+    """Queue the notifications waiting on `connection` (or the error that broke it)"""
+    try:
+        connection.poll()
+        while connection.notifies:
+            received.put_nowait(json.loads(connection.notifies.pop(0).payload))
+    except Exception as e:
+        received.put_nowait(e)
+
+
+async def listen(on_message: Callable[[Dict], Awaitable[None]],
+                 on_connect: Callable[[Optional[datetime]], Awaitable[None]]) -> None:
+    """
+    Await `on_message` for each published message, for ever, reconnecting when
+    the connection is lost. `on_connect(since)` is awaited on each connection,
+    with when the previous one was lost (None the first time), to catch up with
+    what was published meanwhile
+    """
+    if engine.dialect.name != 'postgresql':
+        return
+    loop = asyncio.get_running_loop()
+    lost_at: Optional[datetime] = None
+    while True:
+        connection, fd = None, None
+        try:
+            connection = await asyncio.to_thread(_listen_connection)
+            received: asyncio.Queue = asyncio.Queue()
+            fd = connection.fileno()
+            loop.add_reader(fd, _drain, connection, received)
+            await on_connect(lost_at)
+            lost_at = None
+            while True:
+                message = await received.get()
+                if isinstance(message, Exception):
+                    raise message
+                try:
+                    await on_message(message)
+                except Exception as e:
+                    print(f"Refresh event error: {e}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Refresh events listener error: {e}")
+            lost_at = lost_at or datetime.now(timezone.utc)
+            await asyncio.sleep(LISTEN_RECONNECT_DELAY)
+        finally:
+            if fd is not None:
+                loop.remove_reader(fd)
+            if connection is not None:
+                connection.close()
@@ -0,0 +1,158 @@
+"""
+Refresh scheduler: keeps the Odoo data fresh without manual refreshes.
+
+Run with `python -m app.refresh_scheduler` (the `scheduler` service of
+docker-compose, one replica). Every REFRESH_SCHEDULER_TICK seconds it starts a
+refresh of the sources that are due:
+
+- by cadence: ETL_SCHEDULE gives each source its interval in seconds, e.g.
+  "ventes_locales=600,achats_locaux=1800,achat_importation=3600"; a source is due
+  once its last unscoped refresh (whatever started it, see data_refresh_execution)
+  is older;
+- by upstream change: every ETL_PROBE_INTERVAL seconds the scheduled sources not
+  due yet are probed (two Odoo search_count each, etl_jobs/change_probe.py) and
+  those with changed or removed invoices are refreshed right away.
+
+The due sources of a tick share one execution (one Odoo extraction), queued like
+a manual refresh (data_refresh.queue_refresh). A source that a queued or
+running refresh holds is skipped; once it is free, everything that became due
+meanwhile is refreshed together by the next tick. Executions are recorded with their trigger
+('schedule' or 'probe').
+"""
+import asyncio
+import os
+import signal
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+from app.etl_worker import get_pool, shutdown_pool
+from app.routers.data_refresh import ETL_JOBS, locked_sources, queue_refresh
+
+# Seconds between two scheduling decisions
+REFRESH_SCHEDULER_TICK = float(os.getenv("REFRESH_SCHEDULER_TICK", "30"))
+# Seconds between two upstream change probes (0: cadence only)
+ETL_PROBE_INTERVAL = float(os.getenv("ETL_PROBE_INTERVAL", "60"))
+ETL_PROBE_TIMEOUT = 60
+
+
+def parse_schedule(value: str) -> Dict[str, int]:
+    """"key=seconds,..." -> {source key: seconds}; raises ValueError on unknown keys"""
+    known = {job['key'] for job in ETL_JOBS}
+    schedule = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        key, _, seconds = item.partition("=")
+        key = key.strip()
+        if key not in known:
+            raise ValueError(f"Source inconnue dans ETL_SCHEDULE : {key} (attendu : {', '.join(sorted(known))})")
+        schedule[key] = int(seconds)
+    return schedule
+
+
+def last_refreshes(db: Session, keys: List[str], since: datetime) -> Dict[str, datetime]:
+    """
+    Start of the last refresh of each source since `since` (failed ones too, so
+    they are not retried every tick; not the ones scoped to companies or dates)
+    """
+    executions = db.query(models.DataRefreshExecution).filter(
+        models.DataRefreshExecution.started_at >= since
+    ).all()
+    last: Dict[str, datetime] = {}
+    for execution in executions:
+        if execution.scope:
+            continue
+        for key in execution.sources or keys:
+            if key in keys and (key not in last or execution.started_at > last[key]):
+                last[key] = execution.started_at
+    return last
+
+
+class RefreshScheduler:
+    """Scheduling state between ticks: the cadences and when sources were last probed"""
+
+    def __init__(self, schedule: Dict[str, int], probe_interval: float = ETL_PROBE_INTERVAL):
+        self.schedule = schedule
+        self.probe_interval = probe_interval
+        self.last_probe: Optional[datetime] = None
+
+    def due(self, db: Session, keys: List[str], now: datetime) -> List[str]:
+        last = last_refreshes(db, keys, now - timedelta(seconds=max(self.schedule.values())))
+        return [key for key in keys if key not in last or now - last[key] >= timedelta(seconds=self.schedule[key])]
+
+    async def changed(self, keys: List[str], now: datetime) -> List[str]:
+        """Sources among `keys` with invoices changed in Odoo, if a probe is due"""
+        if not keys or not self.probe_interval:
+            return []
+        if self.last_probe and now - self.last_probe < timedelta(seconds=self.probe_interval):
+            return []
+        self.last_probe = now
+        result = await get_pool().run({'probe': True, 'sources': keys}, timeout=ETL_PROBE_TIMEOUT)
+        # None: never synced yet
+        return [key for key, count in result['changes'].items() if count is None or count > 0]
+
+    async def tick(self) -> Optional[models.DataRefreshExecution]:
+        """Start the refresh of the free sources due now, if any"""
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            busy = locked_sources(db)
+            free = [key for key in self.schedule if key not in busy]
+            if not free:
+                return None
+            due = self.due(db, free, now)
+            db.rollback()  # No transaction left open during the probe
+            try:
+                changed = await self.changed([key for key in free if key not in due], now)
+            except Exception as e:
+                print(f"Change probe failed: {e}")
+                changed = []
+            if not due and not changed:
+                return None
+            sources = [job['key'] for job in ETL_JOBS if job['key'] in due or job['key'] in changed]
+            execution = queue_refresh(db, None, trigger='schedule' if due else 'probe', sources=sources)
+            if execution is not None:
+                print(f"Refresh {execution.execution_id} queued ({execution.trigger}): {', '.join(sources)}")
+            return execution
+        finally:
+            db.close()
+
+
+async def run(scheduler: RefreshScheduler, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            await scheduler.tick()
+        except Exception as e:
+            print(f"Refresh scheduler error: {e}")
+        try:
+            await asyncio.wait_for(stop.wait(), REFRESH_SCHEDULER_TICK)
+        except asyncio.TimeoutError:
+            pass
+
+
+def main() -> None:
+    schedule = parse_schedule(os.getenv("ETL_SCHEDULE", ""))
+    if not schedule:
+        print("ETL_SCHEDULE is empty: no scheduled refresh")
+    stop = asyncio.Event()
+
+    async def start():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, stop.set)
+        print(f"Refresh scheduler: {schedule}, probe every {ETL_PROBE_INTERVAL:g}s")
+        if schedule:
+            await run(RefreshScheduler(schedule), stop)
+        else:
+            await stop.wait()
+
+    try:
+        asyncio.run(start())
+    finally:
+        shutdown_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,38 @@
 """
 Data Refresh API Router
 Allows administrators to refresh data from Odoo with real-time progress tracking
+
+A refresh covers all sources or a subset (`sources`), optionally scoped to some
+companies and an invoice date window (`scope`); each source it covers is locked
+(data_refresh_source_lock) until it ends, so refreshes of different sources may
+run concurrently. A refresh can be cancelled (`cancel_data_refresh`): its sources
+are freed at once and the worker kills its ETL processes. It is enqueued as a
+'data_refresh' job (app/job_queue.py) and run by the
+standalone job worker (app/job_worker.py), which writes its progress on the
+execution row and publishes it (app/refresh_coordination.py); every API process
+relays what is published to its own WebSocket clients (`relay_refresh_events`).
+Starts are serialized and runs of the same source exclusive across processes
+through PostgreSQL advisory locks.
 """
 import asyncio
 import os
-import sys
 import time
 from datetime import datetime, timezone
-from pathlib import Path
-from typing import List, Dict, Optional
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, BackgroundTasks
+from typing import Awaitable, Callable, List, Dict, Optional
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, or_
+from sqlalchemy.exc import IntegrityError
 
 from app.database import get_db
 from app.auth_utils import get_current_admin_user
-from app import models, schemas
+from app import job_queue, models, refresh_coordination, schemas
 from app.routers.supervision import create_supervision_log
+from app.etl_worker import ETL_WORKER_PROCESSES, EtlJobError, get_pool
 
 router = APIRouter(prefix="/data-refresh", tags=["Data Refresh"])
 
-# WebSocket connection manager for real-time updates
+# WebSocket connection manager for real-time updates (this process's clients)
 class ConnectionManager:
     def __init__(self):
         self.active_connections: List[WebSocket] = []
@@ -48,139 +60,303 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
-# ETL job configurations
+# ETL job configurations; `etl_type`: the movement / exception type (and
+# etl_sync_state source) the job loads; `depends_on` (optional): keys of the
+# jobs that must succeed before this one starts, when they are part of the same refresh
 ETL_JOBS = [
     {
         'name': 'Achats Importés',
         'key': 'achat_importation',
-        'script': 'etl_jobs/achat_importation_upsert.py',
+        'etl_type': 'Achat Importation',
         'description': 'Importation des achats depuis Odoo'
     },
     {
         'name': 'Ventes Locales',
         'key': 'ventes_locales',
-        'script': 'etl_jobs/ventes_locales_upsert.py',
+        'etl_type': 'Ventes locales',
         'description': 'Importation des ventes locales depuis Odoo'
     },
     {
         'name': 'Achats Locaux',
         'key': 'achats_locaux',
-        'script': 'etl_jobs/achats_locaux_echeance_upsert.py',
+        'etl_type': 'Achats locaux avec échéance',
         'description': 'Importation des achats locaux avec échéances'
     }
 ]
 
+# The sources above share one account.move extraction: a single process fetches
+# the union of their domains once and routes each invoice to its source
+ETL_EXTRACT_JOB = {
+    'name': 'Factures Odoo',
+    'key': 'account_move',
+    'description': 'Extraction des factures Odoo pour toutes les sources'
+}
+
+ETL_JOB_TIMEOUT = 600  # 10 minute timeout per job
+
+# Jobs of a refresh run concurrently, at most this many at once
+ETL_REFRESH_PARALLELISM = int(os.getenv('ETL_REFRESH_PARALLELISM', str(ETL_WORKER_PROCESSES)))
+# false: one job (and one Odoo scan) per source instead of the shared extraction
+ETL_REFRESH_SHARED_EXTRACTION = os.getenv('ETL_REFRESH_SHARED_EXTRACTION', 'true').lower() != 'false'
+# Attempts of a refresh whose worker died (a retry resumes the interrupted Odoo scans)
+ETL_REFRESH_ATTEMPTS = int(os.getenv('ETL_REFRESH_ATTEMPTS', '2'))
+
+
+def check_job_graph(jobs: List[Dict]) -> None:
+    """Raise ValueError on duplicate keys, unknown dependencies or dependency cycles"""
+    by_key = {job['key']: job for job in jobs}
+    if len(by_key) != len(jobs):
+        raise ValueError("Clés de tâches ETL en double")
+    visiting, visited = set(), set()
+
+    def visit(key: str, path: List[str]):
+        if key in visited:
+            return
+        if key in visiting:
+            raise ValueError(f"Dépendance circulaire : {' -> '.join(path + [key])}")
+        visiting.add(key)
+        for dep in by_key[key].get('depends_on', []):
+            if dep not in by_key:
+                raise ValueError(f"Dépendance inconnue pour {key} : {dep}")
+            visit(dep, path + [key])
+        visiting.discard(key)
+        visited.add(key)
+
+    for job in jobs:
+        visit(job['key'], [])
+
+
+# A misconfigured graph fails at startup, not in the middle of a refresh
+check_job_graph(ETL_JOBS)
+
+
+def build_refresh_jobs(sources: Optional[List[str]] = None, scope: Optional[Dict] = None) -> List[Dict]:
+    """
+    Jobs of one refresh of `sources` (keys of ETL_JOBS, default: all), within
+    `scope` (companies / dateFrom / dateTo, default: everything): each has a
+    worker `config` and the keys of the jobs it `depends_on` among them.
+    With ETL_REFRESH_SHARED_EXTRACTION (the default) this is a single job, the
+    shared extraction: the parallelism limit and the dependencies only apply
+    to the per-source jobs, when it is turned off
+    """
+    selected = [job for job in ETL_JOBS if sources is None or job['key'] in sources]
+    scoped = {}
+    if scope:
+        if scope.get('companies'):
+            scoped['companies'] = scope['companies']
+        if scope.get('dateFrom'):
+            scoped['date_from'] = scope['dateFrom']
+        if scope.get('dateTo'):
+            scoped['date_to'] = scope['dateTo']
+    if ETL_REFRESH_SHARED_EXTRACTION:
+        return [dict(ETL_EXTRACT_JOB, config=dict(scoped, sources=[job['key'] for job in selected]), depends_on=[])]
+    keys = {job['key'] for job in selected}
+    return [
+        dict(job, config=dict(scoped, sources=[job['key']]),
+             depends_on=[dep for dep in job.get('depends_on', []) if dep in keys])
+        for job in selected
+    ]
+
 
-async def run_single_etl_job(job_config: Dict, execution_id: int, db: Session) -> Dict:
-    """Run a single ETL job and return results"""
+async def run_single_etl_job(job_config: Dict,
+                             on_event: Optional[Callable[[Dict], Awaitable[None]]] = None) -> Dict:
+    """Run an ETL job in a warm worker process and return results; progress events go to `on_event`"""
     job_name = job_config['name']
-    script_path = job_config['script']
-    
-    # Check if script exists
-    # etl_jobs is mounted at /etl_jobs in the container
-    full_script_path = Path(f"/{script_path}")
-    
-    if not full_script_path.exists():
+    start_time = time.time()
+    try:
+        run_result = await get_pool().run(job_config['config'], timeout=ETL_JOB_TIMEOUT, on_event=on_event)
+        return {
+            'name': job_name,
+            'key': job_config['key'],
+            'success': True,
+            'duration': time.time() - start_time,
+            'records': sum(s['records'] for s in run_result['sources'].values()),
+            'sources': run_result['sources'],
+            'metrics': run_result.get('metrics')
+        }
+    except TimeoutError:
         return {
             'name': job_name,
             'key': job_config['key'],
             'success': False,
-            'error': f'Script introuvable : {script_path}',
-            'duration': 0,
+            'error': f'Délai dépassé : Opération trop longue (>{ETL_JOB_TIMEOUT // 60} minutes)',
+            'duration': time.time() - start_time,
+            'records': 0
+        }
+    except EtlJobError as e:
+        return {
+            'name': job_name,
+            'key': job_config['key'],
+            'success': False,
+            'error': str(e)[-500:],  # Keep the end of the traceback
+            'duration': time.time() - start_time,
             'records': 0
         }
-    
-    start_time = time.time()
-    try:
-        # Prepare environment variables for ETL script
-        # Copy current environment and override with correct database host
-        etl_env = os.environ.copy()
-        etl_env['PGHOST'] = os.getenv('DB_HOST', 'postgres')  # Use DB_HOST from docker-compose
-        etl_env['PGPORT'] = os.getenv('DB_PORT', '5432')
-        
-        # Run ETL script with proper environment
-        process = await asyncio.create_subprocess_exec(
-            sys.executable, str(full_script_path),
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE,
-            env=etl_env
-        )
-        
-        # Wait for completion with timeout
-        try:
-            stdout, stderr = await asyncio.wait_for(
-                process.communicate(),
-                timeout=600  # 10 minute timeout per job
-            )
-        except asyncio.TimeoutError:
-            process.kill()
-            await process.wait()
-            duration = time.time() - start_time
-            return {
-                'name': job_name,
-                'key': job_config['key'],
-                'success': False,
-                'error': 'Délai dépassé : Opération trop longue (>10 minutes)',
-                'duration': duration,
-                'records': 0
-            }
-        
-        duration = time.time() - start_time
-        stdout_str = stdout.decode('utf-8') if stdout else ''
-        stderr_str = stderr.decode('utf-8') if stderr else ''
-        
-        if process.returncode == 0:
-            # Try to extract record count from output
-            records_processed = 0
-            for line in stdout_str.split('\n'):
-                if 'records' in line.lower() or 'rows' in line.lower():
-                    try:
-                        # Look for numbers in the line
-                        import re
-                        numbers = re.findall(r'\d+', line)
-                        if numbers:
-                            records_processed = int(numbers[0])
-                            break
-                    except:
-                        pass
-            
-            return {
-                'name': job_name,
-                'key': job_config['key'],
-                'success': True,
-                'duration': duration,
-                'records': records_processed,
-                'output': stdout_str[:500]  # Limit output size
-            }
-        else:
-            error_msg = stderr_str or stdout_str
-            return {
-                'name': job_name,
-                'key': job_config['key'],
-                'success': False,
-                'error': error_msg[:500],  # Limit error message size
-                'duration': duration,
-                'records': 0
-            }
-            
     except Exception as e:
-        duration = time.time() - start_time
         return {
             'name': job_name,
             'key': job_config['key'],
             'success': False,
             'error': f"Erreur inattendue : {str(e)}",
-            'duration': duration,
+            'duration': time.time() - start_time,
             'records': 0
         }
 
 
+async def run_etl_jobs(jobs: List[Dict],
+                       on_update: Callable[[Dict, str, Optional[Dict]], Awaitable[None]],
+                       parallelism: int = ETL_REFRESH_PARALLELISM) -> List[Dict]:
+    """
+    Run jobs concurrently, at most `parallelism` at once, each one once the jobs
+    it `depends_on` have finished (checked up front: ValueError on unknown or
+    cyclic dependencies). A job whose dependency failed is not run and is
+    reported as failed. `on_update(job, status, event)` is awaited when a job
+    starts ('running'), for each progress event it emits ('running', event) and
+    when it ends ('completed' / 'failed'). Returns the results in `jobs` order.
+    """
+    check_job_graph(jobs)
+    semaphore = asyncio.Semaphore(max(parallelism, 1))
+    finished = {job['key']: asyncio.Event() for job in jobs}
+    results: Dict[str, Dict] = {}
+
+    async def run(job: Dict):
+        deps = job.get('depends_on', [])
+        # Waiting jobs hold no slot: only started ones count against `parallelism`
+        for dep in deps:
+            await finished[dep].wait()
+        failed_deps = [dep for dep in deps if not results[dep]['success']]
+        if failed_deps:
+            results[job['key']] = {
+                'name': job['name'],
+                'key': job['key'],
+                'success': False,
+                'error': f"Dépendance échouée : {', '.join(failed_deps)}",
+                'duration': 0,
+                'records': 0
+            }
+        else:
+            async with semaphore:
+                await on_update(job, 'running', None)
+                results[job['key']] = await run_single_etl_job(job, lambda event: on_update(job, 'running', event))
+        await on_update(job, 'completed' if results[job['key']]['success'] else 'failed', None)
+        finished[job['key']].set()
+
+    await asyncio.gather(*(run(job) for job in jobs))
+    return [results[job['key']] for job in jobs]
+
+
+def progress_metrics(event: Dict) -> Dict:
+    """
+    Job metrics from an ETL progress event (treasury_etl.ProgressReporter):
+    totals over its sources, throughput and the per-source breakdown
+    """
+    sources = event['sources']
+    fetched = sum(s['fetched'] for s in sources.values())
+    return {
+        'phase': event['phase'],
+        'elapsed': event['elapsed'],
+        'fetched': fetched,
+        'written': sum(s['written'] for s in sources.values()),
+        'exceptions': sum(s['exceptions'] for s in sources.values()),
+        'bytes': sum(s['bytes'] for s in sources.values()),
+        'rate': round(fetched / event['elapsed']) if event['elapsed'] else 0,
+        'sources': sources
+    }
+
+
+def job_progress(state: Dict) -> int:
+    """
+    Estimated completion of a running job, averaged over its sources (one per
+    company shard), each by its own phase: planning 0-5%, extraction 5-90%
+    (records fetched against the plan's estimate), published 100%
+    """
+    sources = list(state.get('sources', {}).values())
+    if not sources:
+        return 0
+
+    def source_progress(source: Dict) -> float:
+        if source['phase'] == 'publish':
+            return 100
+        if source['phase'] != 'extract' or source['expected'] is None:
+            return 5
+        if not source['expected']:
+            return 90
+        return 5 + 85 * min(1, source['fetched'] / source['expected'])
+
+    return int(sum(source_progress(s) for s in sources) / len(sources))
+
+
+def execution_metrics(jobs: List[Dict], results: List[Dict], wall: float) -> Dict:
+    """
+    Metrics stored on the execution: each job's ETL metrics (etl_jobs/metrics.py,
+    wall / CPU / memory per phase, per page and per COPY batch) and their totals
+    """
+    job_metrics = {
+        job['key']: result['metrics'] for job, result in zip(jobs, results) if result.get('metrics')
+    }
+    totals = [m['total'] for m in job_metrics.values()]
+    execution = {
+        'wall': round(wall, 3),
+        'cpu': round(sum(t['cpu'] for t in totals), 3),
+        'max_rss_mb': max((t['max_rss_mb'] for t in totals), default=None)
+    }
+    peaks = [t['peak_mb'] for t in totals if 'peak_mb' in t]
+    if peaks:
+        execution['peak_mb'] = max(peaks)
+    return {'execution': execution, 'jobs': job_metrics}
+
+
+def source_results(job: Dict, result: Dict) -> List[Dict]:
+    """Per-source results of a job (a shared extraction feeds several sources)"""
+    sources = result.get('sources', {})
+    rows = []
+    for source_job in ETL_JOBS:
+        if source_job['key'] not in job['config']['sources']:
+            continue
+        source = sources.get(source_job['key'], {})
+        row = {
+            'name': source_job['name'],
+            'key': source_job['key'],
+            'success': result['success'],
+            'duration': result['duration'],
+            'records': source.get('records', 0),
+            'inserted': source.get('inserted', 0),
+            'updated': source.get('updated', 0),
+            'deleted': source.get('deleted', 0)
+        }
+        # Odoo read_group totals against local ones (etl_jobs/reconcile.py)
+        if 'reconciliation' in source:
+            row['reconciliation'] = source['reconciliation']
+        if not result['success']:
+            row['error'] = result.get('error')
+        rows.append(row)
+    return rows
+
+
+def update_running(db: Session, execution_id: int, **values) -> Optional[models.DataRefreshExecution]:
+    """
+    Write `values` on an execution only if it is still running, in one conditional
+    UPDATE (a concurrent cancel or completion is never overwritten). Returns the
+    updated execution, or None when nothing was written (uncommitted either way)
+    """
+    updated = db.query(models.DataRefreshExecution).filter(
+        models.DataRefreshExecution.execution_id == execution_id,
+        models.DataRefreshExecution.status == 'running'
+    ).update(values, synchronize_session=False)
+    if not updated:
+        return None
+    execution = db.get(models.DataRefreshExecution, execution_id)
+    db.refresh(execution)
+    return execution
+
+
 async def execute_data_refresh(execution_id: int, db_connection_string: str):
     """
     Background task to execute all ETL jobs and update progress
     """
     from app.database import SessionLocal
     db = SessionLocal()
+    source_locks = None
     
     try:
         execution = db.query(models.DataRefreshExecution).filter(
@@ -190,125 +366,342 @@ async def execute_data_refresh(execution_id: int, db_connection_string: str):
         if not execution:
             return
         
-        total_jobs = len(ETL_JOBS)
-        job_results = []
-        total_records = 0
-        
-        # Execute each job sequentially
-        for idx, job in enumerate(ETL_JOBS, 1):
-            # Update progress
-            progress = int((idx - 1) / total_jobs * 100)
-            execution.progress_percentage = progress
-            execution.current_step = job['description']
+        jobs = build_refresh_jobs(execution.sources, execution.scope)
+        job_states = {
+            job['key']: {'name': job['name'], 'key': job['key'], 'status': 'pending', 'progress': 0}
+            for job in jobs
+        }
+
+        async def on_update(job: Dict, status: str, event: Optional[Dict]):
+            state = job_states[job['key']]
+            state['status'] = status
+            if event is not None:
+                state.update(progress_metrics(event))
+            state['progress'] = job_progress(state) if status == 'running' else 100
+            running = [s['name'] for s in job_states.values() if s['status'] == 'running']
+            progress = int(sum(s['progress'] for s in job_states.values()) / len(job_states))
+            step = f"En cours : {', '.join(running)}" if running else 'Finalisation...'
+            # Nothing written nor published once cancelled, until the worker stops the task
+            current = update_running(
+                db, execution_id,
+                progress_percentage=progress,
+                current_step=step[:100],
+                total_records_processed=sum(s.get('written', 0) for s in job_states.values()),
+                details={'progress': [dict(s) for s in job_states.values()]}
+            )
+            if current is not None:
+                refresh_coordination.publish(db, execution_message(current))
+            db.commit()
+
+        async def on_wait():
+            current = update_running(
+                db, execution_id, current_step='En attente de la fin de l\'actualisation précédente...'
+            )
+            if current is not None:
+                refresh_coordination.publish(db, execution_message(current))
             db.commit()
-            
-            # Broadcast progress
-            await manager.broadcast({
-                'type': 'progress',
-                'executionId': execution_id,
-                'progressPercentage': progress,
-                'currentStep': job['description'],
-                'status': 'running'
-            })
-            
-            # Run the job
-            result = await run_single_etl_job(job, execution_id, db)
-            job_results.append(result)
-            total_records += result.get('records', 0)
-            
-            # If job failed, log but continue with other jobs
+
+        # A cancelled refresh of the same sources may still be stopping
+        source_locks = await refresh_coordination.hold_sources(
+            execution.sources or [job['key'] for job in ETL_JOBS], on_wait
+        )
+        started = time.time()
+        results = await run_etl_jobs(jobs, on_update)
+        metrics = execution_metrics(jobs, results, time.time() - started)
+
+        job_results = []
+        for job, result in zip(jobs, results):
             if not result['success']:
                 print(f"Job {job['name']} failed: {result.get('error')}")
-        
-        # Update final status
+            job_results.extend(source_results(job, result))
+        total_records = sum(r['records'] for r in job_results)
+
+        # Update final status (unless cancelled meanwhile: its outcome is already recorded)
         all_successful = all(r['success'] for r in job_results)
-        execution.status = 'completed' if all_successful else 'failed'
-        execution.completed_at = datetime.now(timezone.utc)
-        execution.duration_seconds = int((datetime.now(timezone.utc) - execution.started_at).total_seconds())
-        execution.progress_percentage = 100
-        execution.current_step = 'Toutes les sources de données ont été actualisées avec succès' if all_successful else 'Certaines sources de données ont échoué'
-        execution.total_records_processed = total_records
-        execution.details = {'jobs': job_results}
-        
+        completed_at = datetime.now(timezone.utc)
+        final = dict(
+            status='completed' if all_successful else 'failed',
+            completed_at=completed_at,
+            duration_seconds=int((completed_at - execution.started_at).total_seconds()),
+            progress_percentage=100,
+            current_step='Toutes les sources de données ont été actualisées avec succès' if all_successful else 'Certaines sources de données ont échoué',
+            total_records_processed=total_records,
+            details={'jobs': job_results, 'progress': [dict(s) for s in job_states.values()]},
+            metrics=metrics
+        )
         if not all_successful:
             failed_jobs = [r['name'] for r in job_results if not r['success']]
-            execution.error_message = f"Sources échouées : {', '.join(failed_jobs)}"
-        
+            final['error_message'] = f"Sources échouées : {', '.join(failed_jobs)}"
+        execution = update_running(db, execution_id, **final)
+        if execution is not None:
+            release_sources(db, execution_id)
+            # Publish completion
+            refresh_coordination.publish(db, execution_message(execution))
         db.commit()
         
-        # Broadcast completion
-        await manager.broadcast({
-            'type': 'complete',
-            'executionId': execution_id,
-            'progressPercentage': 100,
-            'status': execution.status,
-            'totalRecordsProcessed': total_records,
-            'details': {'jobs': job_results}
-        })
-        
     except Exception as e:
         # Handle unexpected errors
-        execution = db.query(models.DataRefreshExecution).filter(
-            models.DataRefreshExecution.execution_id == execution_id
-        ).first()
-        
-        if execution:
-            execution.status = 'failed'
-            execution.completed_at = datetime.now(timezone.utc)
-            execution.duration_seconds = int((datetime.now(timezone.utc) - execution.started_at).total_seconds())
-            execution.error_message = f"Erreur système : {str(e)}"
-            execution.progress_percentage = 0
-            db.commit()
-            
-            await manager.broadcast({
-                'type': 'error',
-                'executionId': execution_id,
-                'status': 'failed',
-                'errorMessage': str(e)
-            })
+        db.rollback()
+        execution = db.get(models.DataRefreshExecution, execution_id)
+        if execution is not None:
+            completed_at = datetime.now(timezone.utc)
+            execution = update_running(
+                db, execution_id,
+                status='failed',
+                completed_at=completed_at,
+                duration_seconds=int((completed_at - execution.started_at).total_seconds()),
+                error_message=f"Erreur système : {str(e)}",
+                progress_percentage=0
+            )
+        if execution is not None:
+            release_sources(db, execution_id)
+            refresh_coordination.publish(db, execution_message(execution))
+        db.commit()
     
     finally:
+        refresh_coordination.release(source_locks)
         db.close()
 
 
+def mark_refresh_failed(payload: Dict, error: str) -> None:
+    """The refresh job failed for good (its worker died on every attempt): close the execution"""
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        execution = db.get(models.DataRefreshExecution, payload['execution_id'])
+        if execution is not None:
+            completed_at = datetime.now(timezone.utc)
+            execution = update_running(
+                db, payload['execution_id'],
+                status='failed',
+                completed_at=completed_at,
+                duration_seconds=int((completed_at - execution.started_at).total_seconds()),
+                error_message=f"Erreur système : {error.strip().splitlines()[-1]}"
+            )
+        if execution is not None:
+            refresh_coordination.publish(db, execution_message(execution))
+        release_sources(db, payload['execution_id'])
+        db.commit()
+    finally:
+        db.close()
+
+
+@job_queue.handler('data_refresh', on_failure=mark_refresh_failed)
+async def run_refresh_job(payload: Dict) -> None:
+    """Job worker entry point of a refresh enqueued by `start_data_refresh`"""
+    from app.database import DATABASE_URL
+    await execute_data_refresh(payload['execution_id'], str(DATABASE_URL))
+
+
+def execution_message(execution: models.DataRefreshExecution) -> Dict:
+    """WebSocket message of an execution's current state"""
+    if execution.status == 'cancelled':
+        return {'type': 'cancelled', 'executionId': execution.execution_id, 'status': 'cancelled',
+                'currentStep': execution.current_step}
+    if execution.status == 'failed' and not (execution.details or {}).get('jobs'):
+        return {'type': 'error', 'executionId': execution.execution_id,
+                'status': 'failed', 'errorMessage': execution.error_message}
+    message = {
+        'executionId': execution.execution_id,
+        'progressPercentage': execution.progress_percentage,
+        'status': execution.status,
+        'totalRecordsProcessed': execution.total_records_processed,
+        'details': execution.details
+    }
+    if execution.status == 'running':
+        message.update(type='progress', currentStep=execution.current_step)
+    else:
+        message.update(type='complete', metrics=execution.metrics)
+    return message
+
+
+def _execution_messages(execution_id: Optional[int] = None, since: Optional[datetime] = None) -> List[Dict]:
+    """
+    Messages of one execution, or of the running ones and those finished since
+    `since` (what a relay missed while disconnected)
+    """
+    from app.database import SessionLocal
+    db = SessionLocal()
+    try:
+        query = db.query(models.DataRefreshExecution)
+        if execution_id is not None:
+            query = query.filter(models.DataRefreshExecution.execution_id == execution_id)
+        elif since is not None:
+            query = query.filter(or_(
+                models.DataRefreshExecution.status == 'running',
+                models.DataRefreshExecution.completed_at >= since
+            ))
+        else:
+            query = query.filter(models.DataRefreshExecution.status == 'running')
+        return [execution_message(execution) for execution in query.all()]
+    finally:
+        db.close()
+
+
+async def relay_refresh_events() -> None:
+    """
+    Broadcast the refresh messages published by any process to this process's
+    WebSocket clients (started with the app); after a lost connection, the
+    state of the executions that changed meanwhile is sent again
+    """
+    async def on_message(message: Dict):
+        if message.get('reload'):
+            for current in await asyncio.to_thread(_execution_messages, message['executionId']):
+                await manager.broadcast(current)
+        else:
+            await manager.broadcast(message)
+
+    async def on_connect(since: Optional[datetime]):
+        if since is not None and manager.active_connections:
+            for current in await asyncio.to_thread(_execution_messages, None, since):
+                await manager.broadcast(current)
+
+    await refresh_coordination.listen(on_message, on_connect)
+
+
+def locked_sources(db: Session) -> Dict[str, models.DataRefreshExecution]:
+    """Sources held by a queued or running refresh, with its execution"""
+    rows = db.query(models.DataRefreshSourceLock, models.DataRefreshExecution).join(
+        models.DataRefreshExecution,
+        models.DataRefreshExecution.execution_id == models.DataRefreshSourceLock.execution_id
+    ).all()
+    return {lock.source: execution for lock, execution in rows}
+
+
+def release_sources(db: Session, execution_id: int) -> None:
+    """Free the sources of an execution that is over (committed by the caller)"""
+    db.query(models.DataRefreshSourceLock).filter(
+        models.DataRefreshSourceLock.execution_id == execution_id
+    ).delete(synchronize_session=False)
+
+
+def queue_refresh(db: Session, started_by: Optional[int], trigger: str = 'manual',
+                  sources: Optional[List[str]] = None,
+                  scope: Optional[Dict] = None) -> Optional[models.DataRefreshExecution]:
+    """
+    Create a running execution, lock its sources and enqueue its 'data_refresh'
+    job in one transaction. Returns None, writing nothing, if one of the sources is
+    locked by another refresh: concurrent starts (API processes, scheduler) are
+    serialized, the lock's primary key stays as a backstop
+    """
+    refresh_coordination.serialize_starts(db)
+    keys = sources or [job['key'] for job in ETL_JOBS]
+    if any(key in keys for key in locked_sources(db)):
+        db.rollback()
+        return None
+    execution = models.DataRefreshExecution(
+        status='running',
+        started_by=started_by,
+        started_at=datetime.now(timezone.utc),
+        progress_percentage=0,
+        current_step='Initialisation de l\'actualisation des données...',
+        total_records_processed=0,
+        trigger=trigger,
+        sources=sources,
+        scope=scope
+    )
+    db.add(execution)
+    db.flush()
+    try:
+        with db.begin_nested():
+            for key in keys:
+                db.add(models.DataRefreshSourceLock(source=key, execution_id=execution.execution_id))
+    except IntegrityError:
+        db.rollback()
+        return None
+    job_queue.enqueue(
+        db, 'data_refresh', {'execution_id': execution.execution_id}, max_attempts=ETL_REFRESH_ATTEMPTS
+    )
+    db.commit()
+    db.refresh(execution)
+    return execution
+
+
+def starter_name(db: Session, execution: models.DataRefreshExecution) -> tuple:
+    """(display name, email) of who started an execution"""
+    if execution.started_by is None:
+        return "Planificateur", ""
+    starter = db.query(models.User).filter(models.User.user_id == execution.started_by).first()
+    return (starter.display_name, starter.email) if starter else ("Unknown", "")
+
+
+def execution_response(db: Session, execution: models.DataRefreshExecution) -> schemas.DataRefreshExecutionResponse:
+    """API view of an execution"""
+    started_by, started_by_email = starter_name(db, execution)
+    return schemas.DataRefreshExecutionResponse(
+        executionId=execution.execution_id,
+        status=execution.status,
+        startedBy=started_by,
+        startedByEmail=started_by_email,
+        startedAt=execution.started_at.isoformat(),
+        completedAt=execution.completed_at.isoformat() if execution.completed_at else None,
+        durationSeconds=execution.duration_seconds,
+        totalRecordsProcessed=execution.total_records_processed,
+        errorMessage=execution.error_message,
+        progressPercentage=execution.progress_percentage,
+        currentStep=execution.current_step,
+        details=execution.details,
+        metrics=execution.metrics,
+        trigger=execution.trigger,
+        sources=execution.sources,
+        scope=execution.scope
+    )
+
+
+def refresh_scope(request: schemas.DataRefreshStartRequest) -> Optional[Dict]:
+    """Execution scope of a start request (None: every company, no date window)"""
+    scope = {}
+    if request.companyIds:
+        scope['companies'] = sorted(set(request.companyIds))
+    if request.dateFrom:
+        scope['dateFrom'] = request.dateFrom.isoformat()
+    if request.dateTo:
+        scope['dateTo'] = request.dateTo.isoformat()
+    return scope or None
+
+
 @router.post("/start", response_model=schemas.DataRefreshStartResponse)
 async def start_data_refresh(
-    background_tasks: BackgroundTasks,
+    request: Optional[schemas.DataRefreshStartRequest] = None,
     current_user: models.User = Depends(get_current_admin_user),
     db: Session = Depends(get_db)
 ):
     """
-    Start a new data refresh operation (admin only)
-    Checks if another refresh is already running
+    Start a new data refresh operation (admin only), of all sources or of a
+    subset, optionally restricted to some companies and an invoice date window
+    Checks that none of these sources is already being refreshed
     """
-    # Check if there's already a running refresh
-    running_execution = db.query(models.DataRefreshExecution).filter(
-        models.DataRefreshExecution.status == 'running'
-    ).first()
+    request = request or schemas.DataRefreshStartRequest()
+    keys = [job['key'] for job in ETL_JOBS]
+    unknown = [key for key in request.sources or [] if key not in keys]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sources inconnues : {', '.join(unknown)}. Sources disponibles : {', '.join(keys)}"
+        )
+    if request.dateFrom and request.dateTo and request.dateFrom > request.dateTo:
+        raise HTTPException(status_code=400, detail="La date de début doit précéder la date de fin")
+    # All sources in ETL_JOBS order, or the requested ones
+    sources = [key for key in keys if key in request.sources] if request.sources else None
+    scope = refresh_scope(request)
+
+    # Check if one of these sources is already being refreshed
+    busy = locked_sources(db)
+    running_execution = next((busy[key] for key in sources or keys if key in busy), None)
     
     if running_execution:
-        starter = db.query(models.User).filter(
-            models.User.user_id == running_execution.started_by
-        ).first()
-        
         raise HTTPException(
             status_code=409,
-            detail=f"Une actualisation des données est déjà en cours. Démarrée par {starter.display_name} à {running_execution.started_at.strftime('%H:%M')}. Veuillez attendre qu'elle se termine."
+            detail=f"Une actualisation des données est déjà en cours. Démarrée par {starter_name(db, running_execution)[0]} à {running_execution.started_at.strftime('%H:%M')}. Veuillez attendre qu'elle se termine."
         )
     
-    # Create new execution record
-    new_execution = models.DataRefreshExecution(
-        status='running',
-        started_by=current_user.user_id,
-        started_at=datetime.now(timezone.utc),
-        progress_percentage=0,
-        current_step='Initialisation de l\'actualisation des données...',
-        total_records_processed=0
-    )
-    
-    db.add(new_execution)
-    db.commit()
-    db.refresh(new_execution)
+    # Create new execution record and its job (the source locks close the race past the check above)
+    new_execution = queue_refresh(db, current_user.user_id, sources=sources, scope=scope)
+    if new_execution is None:
+        raise HTTPException(
+            status_code=409,
+            detail="Une actualisation des données est déjà en cours. Veuillez attendre qu'elle se termine."
+        )
     
     # Log the data refresh start
     create_supervision_log(
@@ -320,22 +713,20 @@ async def start_data_refresh(
         description=f"Démarré l'actualisation des données depuis Odoo",
         details={
             "execution_id": new_execution.execution_id,
-            "jobs": [job['name'] for job in ETL_JOBS]
+            "jobs": [job['name'] for job in ETL_JOBS if sources is None or job['key'] in sources],
+            "scope": scope
         }
     )
     
-    # Start background task
-    from app.database import DATABASE_URL
-    background_tasks.add_task(execute_data_refresh, new_execution.execution_id, str(DATABASE_URL))
-    
-    # Broadcast start event
-    await manager.broadcast({
+    # Publish start event
+    refresh_coordination.publish(db, {
         'type': 'started',
         'executionId': new_execution.execution_id,
         'status': 'running',
         'startedBy': current_user.display_name,
         'startedAt': new_execution.started_at.isoformat()
     })
+    db.commit()
     
     return schemas.DataRefreshStartResponse(
         message="Actualisation des données démarrée avec succès",
@@ -344,48 +735,120 @@ async def start_data_refresh(
     )
 
 
+@router.post("/{execution_id}/cancel", response_model=schemas.DataRefreshStartResponse)
+async def cancel_data_refresh(
+    execution_id: int,
+    current_user: models.User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Cancel a running data refresh (admin only)
+    Its sources are free again at once; its job is cancelled, so the job worker
+    stops it and kills its ETL processes (their open transactions roll back)
+    """
+    execution = db.query(models.DataRefreshExecution).filter(
+        models.DataRefreshExecution.execution_id == execution_id
+    ).first()
+    if not execution:
+        raise HTTPException(status_code=404, detail="Actualisation introuvable")
+    if execution.status != 'running':
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cette actualisation n'est pas en cours (statut : {execution.status})"
+        )
+
+    jobs = [
+        job for job in db.query(models.JobQueue).filter(
+            models.JobQueue.kind == 'data_refresh',
+            models.JobQueue.status.in_(['queued', 'running'])
+        ).all()
+        if (job.payload or {}).get('execution_id') == execution_id
+    ]
+    was_running = any(job.status == 'running' for job in jobs)
+    for job in jobs:
+        job_queue.cancel(db, job)
+    completed_at = datetime.now(timezone.utc)
+    cancelled = update_running(
+        db, execution_id,
+        status='cancelled',
+        completed_at=completed_at,
+        duration_seconds=int((completed_at - execution.started_at).total_seconds()),
+        current_step=f"Annulée par {current_user.display_name}"[:100]
+    )
+    if cancelled is None:
+        # Finished between the check above and this update
+        db.rollback()
+        db.refresh(execution)
+        raise HTTPException(
+            status_code=409,
+            detail=f"Cette actualisation n'est pas en cours (statut : {execution.status})"
+        )
+    execution = cancelled
+    release_sources(db, execution_id)
+    db.commit()
+
+    create_supervision_log(
+        db=db,
+        entity_type="data_refresh",
+        entity_id=execution_id,
+        action="cancel",
+        user=current_user,
+        description="Annulé l'actualisation des données depuis Odoo",
+        details={
+            "execution_id": execution_id,
+            "progress": execution.progress_percentage,
+            "sources": execution.sources,
+            "scope": execution.scope,
+            # False: still queued, no ETL work had started
+            "was_running": was_running
+        }
+    )
+
+    refresh_coordination.publish(db, execution_message(execution))
+    db.commit()
+
+    return schemas.DataRefreshStartResponse(
+        message="Actualisation des données annulée",
+        executionId=execution_id,
+        status='cancelled'
+    )
+
+
 @router.get("/status", response_model=schemas.DataRefreshStatusResponse)
 async def get_refresh_status(
     db: Session = Depends(get_db)
 ):
     """
     Get current refresh status (available to all authenticated users)
+    Scoped refreshes of distinct sources run side by side: all of them are
+    returned, latest started first
     """
-    running_execution = db.query(models.DataRefreshExecution).filter(
+    running_executions = db.query(models.DataRefreshExecution).filter(
         models.DataRefreshExecution.status == 'running'
-    ).first()
-    
-    if not running_execution:
-        return schemas.DataRefreshStatusResponse(
-            isRunning=False,
-            currentExecution=None
-        )
+    ).order_by(
+        desc(models.DataRefreshExecution.started_at),
+        desc(models.DataRefreshExecution.execution_id)
+    ).all()
     
-    starter = db.query(models.User).filter(
-        models.User.user_id == running_execution.started_by
-    ).first()
-    
-    execution_response = schemas.DataRefreshExecutionResponse(
-        executionId=running_execution.execution_id,
-        status=running_execution.status,
-        startedBy=starter.display_name if starter else "Unknown",
-        startedByEmail=starter.email if starter else "",
-        startedAt=running_execution.started_at.isoformat(),
-        completedAt=running_execution.completed_at.isoformat() if running_execution.completed_at else None,
-        durationSeconds=running_execution.duration_seconds,
-        totalRecordsProcessed=running_execution.total_records_processed,
-        errorMessage=running_execution.error_message,
-        progressPercentage=running_execution.progress_percentage,
-        currentStep=running_execution.current_step,
-        details=running_execution.details
-    )
+    executions = [execution_response(db, execution) for execution in running_executions]
     
     return schemas.DataRefreshStatusResponse(
-        isRunning=True,
-        currentExecution=execution_response
+        isRunning=bool(executions),
+        currentExecution=executions[0] if executions else None,
+        runningExecutions=executions
     )
 
 
+@router.get("/sources", response_model=List[schemas.DataRefreshSourceResponse])
+async def get_refresh_sources(
+    current_user: models.User = Depends(get_current_admin_user)
+):
+    """
+    Sources a refresh can be restricted to (admin only)
+    """
+    return [schemas.DataRefreshSourceResponse(**job) for job in ETL_JOBS]
+
+
 @router.get("/history", response_model=List[schemas.DataRefreshExecutionResponse])
 async def get_refresh_history(
     limit: int = 20,
@@ -399,28 +862,7 @@ async def get_refresh_history(
         desc(models.DataRefreshExecution.started_at)
     ).limit(limit).all()
     
-    results = []
-    for execution in executions:
-        starter = db.query(models.User).filter(
-            models.User.user_id == execution.started_by
-        ).first()
-        
-        results.append(schemas.DataRefreshExecutionResponse(
-            executionId=execution.execution_id,
-            status=execution.status,
-            startedBy=starter.display_name if starter else "Unknown",
-            startedByEmail=starter.email if starter else "",
-            startedAt=execution.started_at.isoformat(),
-            completedAt=execution.completed_at.isoformat() if execution.completed_at else None,
-            durationSeconds=execution.duration_seconds,
-            totalRecordsProcessed=execution.total_records_processed,
-            errorMessage=execution.error_message,
-            progressPercentage=execution.progress_percentage,
-            currentStep=execution.current_step,
-            details=execution.details
-        ))
-    
-    return results
+    return [execution_response(db, execution) for execution in executions]
 
 
 @router.websocket("/ws")
@@ -1,8 +1,10 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
+from sqlalchemy import func, or_
 from typing import List
 from app.database import get_db
 from app import models, schemas
+from app.routers.data_refresh import ETL_JOBS
 from datetime import datetime
 
 router = APIRouter(prefix="/exceptions", tags=["exceptions"])
@@ -34,7 +36,17 @@ def get_exceptions(db: Session = Depends(get_db)):
 
 @router.get("/last-refresh", response_model=schemas.LastRefreshResponse)
 def get_last_refresh(db: Session = Depends(get_db)):
-    # Get the latest created_at timestamp from system-detected exceptions (not manual)
+    # ETL merges keep created_at of unchanged exceptions, so prefer the last sync time
+    # of the sources (unsharded or per company), not of the currency rates
+    source = models.EtlSyncState.source
+    last_sync = db.query(func.max(models.EtlSyncState.last_sync_at)).filter(or_(*(
+        condition
+        for job in ETL_JOBS
+        for condition in (source == job['etl_type'], source.like(f"{job['etl_type']} / company %"))
+    ))).scalar()
+    if last_sync:
+        return {"lastRefresh": last_sync.isoformat()}
+    # Fallback: latest created_at timestamp from system-detected exceptions (not manual)
     latest = db.query(models.Exception).order_by(models.Exception.created_at.desc()).first()
     if latest:
         return {"lastRefresh": latest.created_at.isoformat()}
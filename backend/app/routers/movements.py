@@ -60,7 +60,10 @@ def get_movements(
             updatedAt=m.updated_at.isoformat() if m.updated_at else None,
             deactivatedAt=m.disabled_at.isoformat() if m.disabled_at else None,
             deactivationReason=m.disable_reason,
-            excludeFromAnalytics=m.exclude_from_analytics
+            excludeFromAnalytics=m.exclude_from_analytics,
+            exchangeRate=float(m.exchange_rate) if m.exchange_rate is not None else None,
+            currency=m.currency,
+            amountCurrency=float(m.amount_currency) if m.amount_currency is not None else None
         )
         for m in movements
     ]
@@ -173,5 +176,8 @@ def get_movement(id: str, db: Session = Depends(get_db)):
         updatedAt=movement.updated_at.isoformat() if movement.updated_at else None,
         deactivatedAt=movement.disabled_at.isoformat() if movement.disabled_at else None,
         deactivationReason=movement.disable_reason,
-        excludeFromAnalytics=movement.exclude_from_analytics
+        excludeFromAnalytics=movement.exclude_from_analytics,
+        exchangeRate=float(movement.exchange_rate) if movement.exchange_rate is not None else None,
+        currency=movement.currency,
+        amountCurrency=float(movement.amount_currency) if movement.amount_currency is not None else None
     )
@@ -130,6 +130,9 @@ class MovementResponse(BaseModel):
     deactivatedAt: Optional[str] = None
     deactivationReason: Optional[str] = None
     excludeFromAnalytics: bool = False
+    exchangeRate: Optional[float] = None
+    currency: Optional[str] = None
+    amountCurrency: Optional[float] = None
 
     class Config:
         from_attributes = True
@@ -322,10 +325,25 @@ class DataRefreshExecutionResponse(BaseModel):
     progressPercentage: int = 0
     currentStep: Optional[str] = None
     details: Optional[dict] = None
+    metrics: Optional[dict] = None
+    trigger: str = 'manual'  # manual | schedule | probe
+    sources: Optional[List[str]] = None  # None: all sources
+    scope: Optional[dict] = None  # companies / dateFrom / dateTo, None: everything
 
     class Config:
         from_attributes = True
 
+class DataRefreshSourceResponse(BaseModel):
+    key: str
+    name: str
+    description: str
+
+class DataRefreshStartRequest(BaseModel):
+    sources: Optional[List[str]] = None  # ETL job keys, None: all
+    companyIds: Optional[List[int]] = None  # None: every company
+    dateFrom: Optional[date] = None  # Invoice date window (inclusive)
+    dateTo: Optional[date] = None
+
 class DataRefreshStartResponse(BaseModel):
     message: str
     executionId: int
@@ -333,7 +351,8 @@ class DataRefreshStartResponse(BaseModel):
 
 class DataRefreshStatusResponse(BaseModel):
     isRunning: bool
-    currentExecution: Optional[DataRefreshExecutionResponse] = None
+    currentExecution: Optional[DataRefreshExecutionResponse] = None  # Latest started of runningExecutions
+    runningExecutions: List[DataRefreshExecutionResponse] = []  # Scoped refreshes can run side by side
 
 # Supervision Log schemas
 class SupervisionLogResponse(BaseModel):
@@ -0,0 +1,8 @@
+-- Migration: Add data_refresh_execution.metrics
+-- Date: October 17, 2026
+-- Description: Per-phase ETL metrics of each data refresh (wall / CPU seconds, memory), written by backend/app/routers/data_refresh.py
+
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS metrics jsonb;
+
+-- Note: This migration is backward-compatible
+-- Executions recorded before this migration keep metrics NULL
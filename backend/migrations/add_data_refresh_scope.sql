@@ -0,0 +1,14 @@
+-- Migration: Add data_refresh_execution.scope and data_refresh_source_lock table
+-- Date: October 17, 2026
+-- Description: Selective refreshes: the scope of an execution and one lock per source (backend/app/routers/data_refresh.py)
+
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS scope jsonb;  -- {companies, dateFrom, dateTo}, NULL: everything
+
+CREATE TABLE IF NOT EXISTS data_refresh_source_lock (
+    source VARCHAR(50) PRIMARY KEY,               -- ETL job key, e.g. 'achat_importation'
+    execution_id INTEGER NOT NULL REFERENCES data_refresh_execution(execution_id) ON DELETE CASCADE,
+    locked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Note: This migration is backward-compatible
+-- Existing executions are recorded as unscoped refreshes
@@ -0,0 +1,18 @@
+-- Migration: Add etl_raw_move table
+-- Date: October 17, 2026
+-- Description: Raw account.move payloads each ETL source was last built from, for the retransform mode (etl_jobs/treasury_etl.py)
+
+CREATE TABLE IF NOT EXISTS etl_raw_move (
+    etl_type VARCHAR(100) NOT NULL,               -- ETL type of the source, e.g. 'Ventes locales'
+    company_id INTEGER,                           -- Odoo company of the record
+    odoo_id INTEGER NOT NULL,                     -- Odoo account.move id
+    write_date TIMESTAMP,                         -- Odoo write_date of the payload
+    payload JSONB NOT NULL,                       -- Fields read by the scan, as returned by Odoo
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (etl_type, odoo_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_etl_raw_move_company ON etl_raw_move (etl_type, company_id);
+
+-- Note: This migration is backward-compatible
+-- The table fills on the next full sync of each source; until then a retransform refuses to run
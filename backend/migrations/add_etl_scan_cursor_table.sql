@@ -0,0 +1,13 @@
+-- Migration: Add etl_scan_cursor table
+-- Date: October 17, 2026
+-- Description: Checkpoints of ETL scans still in progress, so an interrupted scan resumes (etl_jobs/treasury_etl.py)
+
+CREATE TABLE IF NOT EXISTS etl_scan_cursor (
+    job VARCHAR(200) PRIMARY KEY,                 -- Sources and company of the scan, e.g. 'achat_importation+ventes_locales / company 1'
+    fingerprint VARCHAR(64) NOT NULL,             -- Hash of the scan's plan: a checkpoint only resumes an identical scan
+    position JSONB NOT NULL,                      -- Keyset ranges still to read, per-source watermarks and staged row counts
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Note: This migration is backward-compatible
+-- An empty table simply makes the next scan start from the beginning
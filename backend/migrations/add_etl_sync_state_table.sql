@@ -0,0 +1,15 @@
+-- Migration: Add etl_sync_state table
+-- Date: October 17, 2026
+-- Description: Per-source high-water marks used by the incremental Odoo sync (etl_jobs/sync_state.py)
+
+CREATE TABLE IF NOT EXISTS etl_sync_state (
+    source VARCHAR(100) PRIMARY KEY,              -- ETL type, e.g. 'Ventes locales'
+    last_write_date TIMESTAMP,                    -- Odoo account.move write_date (UTC, naive as in Odoo)
+    last_id INTEGER NOT NULL DEFAULT 0,           -- Odoo id tie-breaker for equal write_date
+    record_count INTEGER NOT NULL DEFAULT 0,      -- Number of Odoo records matching the source domain
+    last_full_sync_at TIMESTAMPTZ,
+    last_sync_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Note: This migration is backward-compatible
+-- An empty table simply makes the next run of each ETL a full resync
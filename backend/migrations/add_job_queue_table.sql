@@ -0,0 +1,31 @@
+-- Migration: Add job_queue table
+-- Date: October 17, 2026
+-- Description: Durable job queue consumed by the refresh worker (backend/app/job_queue.py, backend/app/job_worker.py)
+
+CREATE TABLE IF NOT EXISTS job_queue (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL,                    -- Handler registered by the worker, e.g. 'data_refresh'
+    payload JSONB NOT NULL DEFAULT '{}'::jsonb,   -- Handler arguments
+    status VARCHAR(20) NOT NULL DEFAULT 'queued',
+    priority SMALLINT NOT NULL DEFAULT 0,         -- Higher runs first
+    singleton_key VARCHAR(100),                   -- At most one queued or running job per key
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT now(),    -- Not claimed before (retry backoff)
+    locked_by VARCHAR(100),                       -- Worker running the job
+    locked_until TIMESTAMPTZ,                     -- Visibility timeout: reclaimed by another worker after it
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    CONSTRAINT ck_job_queue_status CHECK (status IN ('queued', 'running', 'done', 'failed', 'cancelled'))
+);
+
+CREATE INDEX IF NOT EXISTS ix_job_queue_ready ON job_queue (priority DESC, run_at, job_id) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS ix_job_queue_leases ON job_queue (locked_until) WHERE status = 'running';
+CREATE UNIQUE INDEX IF NOT EXISTS ux_job_queue_singleton ON job_queue (singleton_key)
+    WHERE status IN ('queued', 'running');
+
+-- Note: This migration is backward-compatible
+-- Refreshes are queued once the worker service is deployed
@@ -0,0 +1,36 @@
+-- Migration: Key ETL movements and exceptions on their Odoo id
+-- Date: October 17, 2026
+-- Description: The ETL merge mode (etl_jobs/loader.py) matches rows on the Odoo
+-- record id instead of the reference, so renamed invoices keep their movement_id
+
+ALTER TABLE movement
+    ADD COLUMN IF NOT EXISTS odoo_id INTEGER,
+    ADD COLUMN IF NOT EXISTS installment SMALLINT NOT NULL DEFAULT 1;
+
+ALTER TABLE "Exception" ADD COLUMN IF NOT EXISTS odoo_id INTEGER;
+
+COMMENT ON COLUMN movement.odoo_id IS 'Id Odoo de la pièce (account.move), NULL pour les saisies manuelles';
+COMMENT ON COLUMN movement.installment IS 'Numéro de l''échéance de la pièce (1 sans échéancier)';
+
+-- Rows loaded before: references end with " (ID:<id>)", installments are "<name> <k>/<n> (ID:<id>)"
+UPDATE movement
+SET odoo_id = substring(reference from '\(ID:(\d+)\)$')::int,
+    installment = coalesce(substring(reference from ' (\d+)/\d+ \(ID:\d+\)$')::int, 1)
+WHERE source = 'Odoo' AND odoo_id IS NULL;
+
+UPDATE "Exception"
+SET odoo_id = substring(reference from '\(ID:(\d+)\)$')::int
+WHERE odoo_id IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_movement_odoo
+ON movement (company_id, reference_type, odoo_id, installment, archive_version)
+WHERE odoo_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_exception_type_odoo
+ON "Exception" (type, company_id, reference_type, odoo_id);
+
+-- Replaces the reference lookup index the merge used before matching on odoo_id
+DROP INDEX IF EXISTS ix_exception_type_reference;
+
+-- Note: This migration is backward-compatible
+-- Existing rows get their odoo_id from the "(ID:<id>)" suffix of their reference
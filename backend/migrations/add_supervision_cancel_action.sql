@@ -0,0 +1,11 @@
+-- Migration: Allow the 'cancel' supervision action
+-- Date: October 17, 2026
+-- Description: Cancelled data refreshes are logged with action 'cancel' (POST /data-refresh/{id}/cancel)
+
+ALTER TABLE supervision_log DROP CONSTRAINT IF EXISTS ck_supervision_action;
+ALTER TABLE supervision_log ADD CONSTRAINT ck_supervision_action CHECK (
+    action IN ('include', 'exclude', 'insert', 'update', 'delete', 'refresh', 'create', 'modify', 'cancel')
+);
+
+-- Note: This migration is backward-compatible
+-- The constraint only gains a value: existing rows still satisfy it
@@ -0,0 +1,160 @@
+"""
+Tests for the durable job queue (app/job_queue.py)
+Tests: claim order, lease expiry and reclaim, retries with backoff, singleton jobs, cancellation
+"""
+import pytest
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app import job_queue, models
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """Fresh in-memory database for each test (the singleton index is declared for sqlite too)"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def expire_lease(db, job):
+    """What a dead worker leaves behind: a running job whose lease is over"""
+    job.locked_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def make_due(db, job):
+    job.run_at = datetime.now(timezone.utc) - timedelta(seconds=1)
+    db.commit()
+
+
+def as_utc(value):
+    # sqlite gives timestamps back without their time zone
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class TestJobQueue:
+    """Test suite for the job queue"""
+
+    def test_claim_highest_priority_then_oldest(self, db_session):
+        """Jobs are claimed by priority, then in order of creation"""
+        first = job_queue.enqueue(db_session, "refresh", {"n": 1})
+        second = job_queue.enqueue(db_session, "refresh", {"n": 2})
+        urgent = job_queue.enqueue(db_session, "refresh", {"n": 3}, priority=10)
+        db_session.commit()
+
+        claimed = [job_queue.claim(db_session, "worker-a").job_id for _ in range(3)]
+
+        assert claimed == [urgent.job_id, first.job_id, second.job_id]
+        assert job_queue.claim(db_session, "worker-a") is None
+
+    def test_claim_leases_the_job(self, db_session):
+        """A claimed job is running, counted as an attempt and leased to its worker"""
+        job_queue.enqueue(db_session, "refresh")
+        db_session.commit()
+
+        job = job_queue.claim(db_session, "worker-a", visibility=60)
+
+        assert job.status == 'running'
+        assert job.attempts == 1
+        assert job.locked_by == "worker-a"
+        assert as_utc(job.locked_until) > datetime.now(timezone.utc) + timedelta(seconds=50)
+        # Leased: no other worker gets it
+        assert job_queue.claim(db_session, "worker-b") is None
+
+    def test_claim_skips_jobs_not_due_and_other_kinds(self, db_session):
+        """Jobs scheduled later, or of kinds the worker does not run, are left queued"""
+        job_queue.enqueue(db_session, "refresh", run_at=datetime.now(timezone.utc) + timedelta(hours=1))
+        job_queue.enqueue(db_session, "report")
+        db_session.commit()
+
+        assert job_queue.claim(db_session, "worker-a", kinds=["refresh"]) is None
+        assert job_queue.claim(db_session, "worker-a", kinds=["report"]).kind == "report"
+
+    def test_expired_lease_is_claimed_again(self, db_session):
+        """A job whose worker died is retried by another worker once its lease expires"""
+        job_queue.enqueue(db_session, "refresh")
+        db_session.commit()
+        job = job_queue.claim(db_session, "worker-a")
+        assert job_queue.heartbeat(db_session, job.job_id, "worker-a")
+
+        expire_lease(db_session, job)
+        reclaimed = job_queue.claim(db_session, "worker-b")
+
+        assert reclaimed.job_id == job.job_id
+        assert reclaimed.attempts == 2
+        assert reclaimed.locked_by == "worker-b"
+        # The first worker lost the job, the second one keeps it
+        assert not job_queue.heartbeat(db_session, job.job_id, "worker-a")
+        assert job_queue.heartbeat(db_session, job.job_id, "worker-b")
+
+    def test_failed_job_retried_after_backoff_then_failed(self, db_session):
+        """A failed attempt is queued again after the backoff, until max_attempts"""
+        job_queue.enqueue(db_session, "refresh", max_attempts=2)
+        db_session.commit()
+        job = job_queue.claim(db_session, "worker-a")
+
+        before = datetime.now(timezone.utc)
+        assert job_queue.fail(db_session, job, "Odoo unreachable") is True
+        assert job.status == 'queued'
+        assert job.last_error == "Odoo unreachable"
+        assert as_utc(job.run_at) >= before + timedelta(seconds=job_queue.JOB_RETRY_DELAY)
+        # Not before the backoff
+        assert job_queue.claim(db_session, "worker-a") is None
+
+        make_due(db_session, job)
+        retried = job_queue.claim(db_session, "worker-b")
+        assert retried.job_id == job.job_id
+        assert retried.attempts == 2
+
+        assert job_queue.fail(db_session, retried, "Odoo unreachable") is False
+        assert retried.status == 'failed'
+        assert retried.finished_at is not None
+        make_due(db_session, retried)
+        assert job_queue.claim(db_session, "worker-a") is None
+
+    def test_backoff_doubles_per_attempt(self, db_session):
+        """The retry delay doubles on each further attempt"""
+        job_queue.enqueue(db_session, "refresh", max_attempts=5)
+        db_session.commit()
+        delays = []
+        for _ in range(3):
+            job = job_queue.claim(db_session, "worker-a")
+            before = datetime.now(timezone.utc)
+            job_queue.fail(db_session, job, "boom")
+            delays.append((as_utc(job.run_at) - before).total_seconds())
+            make_due(db_session, job)
+
+        base = job_queue.JOB_RETRY_DELAY
+        assert [round(delay) for delay in delays] == [base, 2 * base, 4 * base]
+
+    def test_singleton_key_allows_one_active_job(self, db_session):
+        """A singleton key has at most one queued or running job"""
+        job = job_queue.enqueue(db_session, "refresh", singleton_key="data_refresh")
+        db_session.commit()
+
+        assert job_queue.enqueue(db_session, "refresh", singleton_key="data_refresh") is None
+        db_session.commit()
+        job_queue.complete(db_session, job_queue.claim(db_session, "worker-a"), {"records": 3})
+
+        again = job_queue.enqueue(db_session, "refresh", singleton_key="data_refresh")
+        db_session.commit()
+        assert again is not None and again.job_id != job.job_id
+        assert db_session.get(models.JobQueue, job.job_id).result == {"records": 3}
+
+    def test_cancelled_job_is_not_claimed_again(self, db_session):
+        """A cancelled job loses its lease and is never picked up again"""
+        job_queue.enqueue(db_session, "refresh")
+        db_session.commit()
+        job = job_queue.claim(db_session, "worker-a")
+
+        job_queue.cancel(db_session, job)
+        db_session.commit()
+
+        assert not job_queue.heartbeat(db_session, job.job_id, "worker-a")
+        assert job_queue.claim(db_session, "worker-b") is None
@@ -0,0 +1,107 @@
+"""
+Tests for the jobs of a data refresh (app/routers/data_refresh.py)
+Tests: jobs built per mode, dependency ordering, parallelism limit, failed and invalid dependencies
+"""
+import asyncio
+import pytest
+from app.routers import data_refresh
+
+
+def job(key, depends_on=()):
+    return {'name': key, 'key': key, 'config': {'sources': [key]}, 'depends_on': list(depends_on)}
+
+
+@pytest.fixture
+def runs(monkeypatch):
+    """Fake ETL runs: records when each job starts and ends; jobs named 'fail*' fail"""
+    events = []
+
+    async def run_single_etl_job(job_config, on_event=None):
+        events.append(('start', job_config['key']))
+        await asyncio.sleep(0.01)
+        events.append(('end', job_config['key']))
+        success = not job_config['key'].startswith('fail')
+        return {'name': job_config['name'], 'key': job_config['key'], 'success': success, 'duration': 0.01,
+                'records': 1 if success else 0, 'error': None if success else 'boom'}
+
+    monkeypatch.setattr(data_refresh, "run_single_etl_job", run_single_etl_job)
+    return events
+
+
+def run_jobs(jobs, parallelism=4):
+    updates = []
+
+    async def on_update(job, status, event):
+        updates.append((job['key'], status))
+
+    results = asyncio.run(data_refresh.run_etl_jobs(jobs, on_update, parallelism))
+    return results, updates
+
+
+class TestRefreshJobs:
+    """Test suite for running the jobs of a refresh"""
+
+    def test_jobs_start_after_their_dependencies(self, runs):
+        """A job starts only once every job it depends on has ended"""
+        jobs = [job('c', ['a', 'b']), job('b', ['a']), job('a'), job('d')]
+
+        results, _ = run_jobs(jobs)
+
+        assert [r['key'] for r in results] == ['c', 'b', 'a', 'd']
+        assert all(r['success'] for r in results)
+        position = {event: index for index, event in enumerate(runs)}
+        assert position[('end', 'a')] < position[('start', 'b')]
+        assert position[('end', 'b')] < position[('start', 'c')]
+        # Independent jobs do not wait
+        assert position[('start', 'd')] < position[('end', 'a')]
+
+    def test_parallelism_limit(self, runs):
+        """At most `parallelism` jobs run at once"""
+        run_jobs([job(key) for key in 'abcde'], parallelism=2)
+
+        running = peak = 0
+        for kind, _ in runs:
+            running += 1 if kind == 'start' else -1
+            peak = max(peak, running)
+        assert peak == 2
+
+    def test_failed_dependency_skips_the_job(self, runs):
+        """A job whose dependency failed is reported failed without running"""
+        results, updates = run_jobs([job('fail'), job('b', ['fail'])])
+
+        assert ('start', 'b') not in runs
+        assert results[1]['success'] is False
+        assert 'fail' in results[1]['error']
+        assert ('b', 'failed') in updates
+
+    @pytest.mark.parametrize("jobs, message", [
+        ([job('a', ['missing'])], "Dépendance inconnue"),
+        ([job('a', ['b']), job('b', ['a'])], "Dépendance circulaire"),
+        ([job('a'), job('a')], "en double"),
+    ])
+    def test_invalid_graph_is_rejected_up_front(self, runs, jobs, message):
+        """Unknown, cyclic or duplicate jobs are refused before anything runs"""
+        with pytest.raises(ValueError, match=message):
+            run_jobs(jobs)
+        assert runs == []
+
+    def test_shared_extraction_is_a_single_job(self, monkeypatch):
+        monkeypatch.setattr(data_refresh, "ETL_REFRESH_SHARED_EXTRACTION", True)
+
+        jobs = data_refresh.build_refresh_jobs(["ventes_locales", "achats_locaux"])
+
+        assert [j['key'] for j in jobs] == [data_refresh.ETL_EXTRACT_JOB['key']]
+        assert jobs[0]['config']['sources'] == ["ventes_locales", "achats_locaux"]
+
+    def test_per_source_jobs_keep_dependencies_within_the_refresh(self, monkeypatch):
+        """Dependencies on sources outside the refresh are dropped"""
+        monkeypatch.setattr(data_refresh, "ETL_REFRESH_SHARED_EXTRACTION", False)
+        monkeypatch.setattr(data_refresh, "ETL_JOBS", [
+            {'name': 'A', 'key': 'a'}, {'name': 'B', 'key': 'b', 'depends_on': ['a']},
+            {'name': 'C', 'key': 'c', 'depends_on': ['a', 'b']},
+        ])
+
+        jobs = data_refresh.build_refresh_jobs(['b', 'c'], {'companies': [1]})
+
+        assert [(j['key'], j['depends_on']) for j in jobs] == [('b', []), ('c', ['b'])]
+        assert jobs[1]['config'] == {'companies': [1], 'sources': ['c']}
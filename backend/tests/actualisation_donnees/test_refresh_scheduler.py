@@ -0,0 +1,141 @@
+"""
+Tests for the refresh scheduler (app/refresh_scheduler.py)
+Tests: ETL_SCHEDULE parsing, due sources around their cadence boundaries, scheduler tick
+"""
+import asyncio
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app import models, refresh_scheduler
+from app.refresh_scheduler import RefreshScheduler, parse_schedule
+
+# sqlite gives timestamps back without their time zone: tests use naive UTC times
+T0 = datetime(2026, 10, 17, 8, 0, 0)
+SCHEDULE = {"ventes_locales": 600, "achats_locaux": 1800}
+
+
+@pytest.fixture(scope="function")
+def session_factory():
+    """Fresh in-memory database for each test"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def db_session(session_factory):
+    db = session_factory()
+    yield db
+    db.close()
+
+
+def add_execution(db, started_at, sources=None, scope=None, status='completed'):
+    db.add(models.DataRefreshExecution(
+        status=status, started_at=started_at, trigger='schedule', sources=sources, scope=scope,
+        progress_percentage=0, total_records_processed=0
+    ))
+    db.commit()
+
+
+class TestParseSchedule:
+    """Test suite for ETL_SCHEDULE parsing"""
+
+    def test_parse_schedule(self):
+        """Cadences per source key, spaces and empty items ignored"""
+        assert parse_schedule(" ventes_locales=600, achats_locaux = 1800,") == {
+            "ventes_locales": 600, "achats_locaux": 1800
+        }
+
+    def test_parse_empty_schedule(self):
+        """An empty ETL_SCHEDULE schedules nothing"""
+        assert parse_schedule("") == {}
+
+    def test_parse_unknown_source(self):
+        """An unknown source key is refused"""
+        with pytest.raises(ValueError, match="Source inconnue"):
+            parse_schedule("ventes=600")
+
+    def test_parse_invalid_cadence(self):
+        """A cadence must be a number of seconds"""
+        with pytest.raises(ValueError):
+            parse_schedule("ventes_locales=10min")
+
+
+class TestDueSources:
+    """Test suite for the sources due at each tick"""
+
+    def test_never_refreshed_sources_are_due(self, db_session):
+        """Sources without any refresh are due at once"""
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+        assert scheduler.due(db_session, list(SCHEDULE), T0) == list(SCHEDULE)
+
+    def test_due_at_cadence_boundary(self, db_session):
+        """A source is due exactly once its cadence has elapsed since its last refresh, not before"""
+        add_execution(db_session, T0)
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+        keys = list(SCHEDULE)
+
+        assert scheduler.due(db_session, keys, T0 + timedelta(seconds=599)) == []
+        assert scheduler.due(db_session, keys, T0 + timedelta(seconds=600)) == ["ventes_locales"]
+        assert scheduler.due(db_session, keys, T0 + timedelta(seconds=1799)) == ["ventes_locales"]
+        assert scheduler.due(db_session, keys, T0 + timedelta(seconds=1800)) == keys
+
+    def test_latest_refresh_of_each_source_counts(self, db_session):
+        """A refresh of some sources only restarts their own cadence"""
+        add_execution(db_session, T0)
+        add_execution(db_session, T0 + timedelta(seconds=500), sources=["ventes_locales"])
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+
+        assert scheduler.due(db_session, list(SCHEDULE), T0 + timedelta(seconds=900)) == []
+        assert scheduler.due(db_session, list(SCHEDULE), T0 + timedelta(seconds=1100)) == ["ventes_locales"]
+
+    def test_failed_refresh_restarts_the_cadence(self, db_session):
+        """A failed refresh is not retried at every tick"""
+        add_execution(db_session, T0, status='failed')
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+
+        assert scheduler.due(db_session, list(SCHEDULE), T0 + timedelta(seconds=60)) == []
+
+    def test_scoped_refresh_does_not_count(self, db_session):
+        """A refresh restricted to companies or dates does not refresh the whole source"""
+        add_execution(db_session, T0)
+        add_execution(db_session, T0 + timedelta(seconds=500), scope={"companies": [1]})
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+
+        assert scheduler.due(db_session, list(SCHEDULE), T0 + timedelta(seconds=600)) == ["ventes_locales"]
+
+    def test_only_given_sources_are_considered(self, db_session):
+        """Busy sources left out of `keys` are never reported due"""
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+        assert scheduler.due(db_session, ["achats_locaux"], T0) == ["achats_locaux"]
+
+
+class TestSchedulerTick:
+    """Test suite for a scheduler tick"""
+
+    def test_tick_queues_due_sources_once(self, session_factory, monkeypatch):
+        """Due sources share one queued refresh; while it holds them, the next tick starts nothing"""
+        monkeypatch.setattr(refresh_scheduler, "SessionLocal", session_factory)
+        scheduler = RefreshScheduler(SCHEDULE, probe_interval=0)
+
+        execution = asyncio.run(scheduler.tick())
+
+        assert execution is not None
+        assert execution.trigger == 'schedule'
+        assert execution.sources == ["ventes_locales", "achats_locaux"]
+        assert asyncio.run(scheduler.tick()) is None
+
+        db = session_factory()
+        try:
+            jobs = db.query(models.JobQueue).all()
+            assert [(job.kind, job.payload) for job in jobs] == [
+                ('data_refresh', {'execution_id': execution.execution_id})
+            ]
+            locks = db.query(models.DataRefreshSourceLock).order_by(models.DataRefreshSourceLock.source).all()
+            assert [lock.source for lock in locks] == ["achats_locaux", "ventes_locales"]
+        finally:
+            db.close()
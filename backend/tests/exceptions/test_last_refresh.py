@@ -0,0 +1,46 @@
+"""
+Tests for the last refresh time of the exceptions (app/routers/exceptions.py)
+Tests: sync time of the ETL sources, currency rates ignored, fallback without sync state
+"""
+import pytest
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app import models
+from app.routers.exceptions import get_last_refresh
+
+
+@pytest.fixture(scope="function")
+def db_session():
+    """Fresh in-memory database for each test"""
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield db
+    db.close()
+    engine.dispose()
+
+
+def synced(db, source, day):
+    db.add(models.EtlSyncState(source=source, last_sync_at=datetime(2026, 10, day, 8, 0)))
+    db.commit()
+
+
+class TestLastRefresh:
+    """Test suite for the exceptions' last refresh time"""
+
+    def test_latest_source_sync_ignores_currency_rates(self, db_session):
+        """Company shards of a source count, the currency rates synced later do not"""
+        synced(db_session, "Ventes locales", 10)
+        synced(db_session, "Achat Importation / company 2", 12)
+        synced(db_session, "res.currency.rate", 15)
+
+        assert get_last_refresh(db_session) == {"lastRefresh": datetime(2026, 10, 12, 8, 0).isoformat()}
+
+    def test_no_source_sync_yet(self, db_session):
+        """Without a source sync, only the rates having been synced, nothing is reported"""
+        synced(db_session, "res.currency.rate", 15)
+
+        assert get_last_refresh(db_session) == {"lastRefresh": None}
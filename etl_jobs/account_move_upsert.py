@@ -0,0 +1,88 @@
+# file: etl_jobs/account_move_upsert.py
+"""
+Refresh several treasury sources from a single `account.move` extraction.
+
+Usage: python etl_jobs/account_move_upsert.py [--retransform] [source_key ...]
+(default: every source; keys: achat_importation, ventes_locales, achats_locaux)
+--retransform rebuilds the sources from their last raw Odoo snapshot (etl_raw_move)
+without calling Odoo, e.g. after a classification rule changed.
+
+`run(config)` is the importable entry point used by the refresh worker
+(backend/app/etl_worker.py), which keeps the process, the Odoo session and the
+PostgreSQL connection warm between runs.
+"""
+import sys
+import time
+from typing import Callable
+
+from dotenv import load_dotenv
+
+import achat_importation_upsert
+import achats_locaux_echeance_upsert
+import change_probe
+import ventes_locales_upsert
+from metrics import RunMetrics
+from treasury_etl import run_sources
+
+load_dotenv()
+
+SOURCES = {
+    source.key: source
+    for source in (
+        achat_importation_upsert.SOURCE,
+        ventes_locales_upsert.SOURCE,
+        achats_locaux_echeance_upsert.SOURCE,
+    )
+}
+
+
+def invoice_date_window(config: dict) -> list | None:
+    """Domain terms of the invoice date window of `config` (None: no window)."""
+    window = []
+    if config.get("date_from"):
+        window.append(("invoice_date", ">=", str(config["date_from"])))
+    if config.get("date_to"):
+        window.append(("invoice_date", "<=", str(config["date_to"])))
+    return window or None
+
+
+def run(config: dict | None = None, on_progress: Callable[[dict], None] | None = None) -> dict:
+    """Refresh the sources listed in `config["sources"]` (default: all), for the
+    Odoo companies in `config["companies"]` (default: treasury_etl.discover_companies);
+    `config["retransform"]` replays the raw snapshot instead of fetching.
+    `config["date_from"]` / `config["date_to"]` (ISO dates, either optional) only
+    refresh the invoices dated within that window (sync_state.plan_window).
+    `config["probe"]` only counts the invoices changed in Odoo since each source's
+    last run (change_probe.py) and returns {"changes": {key: count}, "duration"}.
+
+    Returns {"sources": {key: {inserted, updated, deleted, records, fetched, timings}},
+    "duration": seconds, "metrics": metrics.RunMetrics.as_dict()}. `on_progress`
+    receives the events of treasury_etl.ProgressReporter.
+    """
+    keys = list((config or {}).get("sources") or SOURCES)
+    unknown = [key for key in keys if key not in SOURCES]
+    if unknown:
+        raise ValueError(f"Unknown source(s): {', '.join(unknown)}. Expected: {', '.join(SOURCES)}")
+    started = time.perf_counter()
+    if (config or {}).get("probe"):
+        changes = change_probe.probe([SOURCES[key] for key in keys])
+        return {"changes": changes, "duration": time.perf_counter() - started}
+    with RunMetrics() as metrics:
+        results = run_sources(
+            [SOURCES[key] for key in keys], on_progress=on_progress, metrics=metrics,
+            company_ids=(config or {}).get("companies"), retransform=bool((config or {}).get("retransform")),
+            window=invoice_date_window(config or {}),
+        )
+    return {"sources": results, "duration": time.perf_counter() - started, "metrics": metrics.as_dict()}
+
+
+def main(args: list[str]) -> None:
+    keys = [arg for arg in args if arg != "--retransform"]
+    try:
+        run({"sources": keys, "retransform": "--retransform" in args})
+    except ValueError as exc:
+        raise SystemExit(str(exc))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,73 +1,43 @@
 # file: etl_jobs/achats_locaux_echeance_upsert.py
 import os
-import ssl
-from datetime import date, datetime, UTC
-import xmlrpc.client
+from datetime import date, datetime
 from dotenv import load_dotenv
 
-import psycopg2
-import psycopg2.extras
+from loader import BulkLoader
+from odoo_client import OdooClient
+from treasury_etl import Source, run_sources, split_installments
 
 load_dotenv()
 
 # --- ENV: Odoo ---
-URL = os.getenv("ODOO_URL", "").rstrip("/")
-DB = os.getenv("ODOO_DB", "")
-USER = os.getenv("ODOO_USERNAME", "")
-PASSWORD = os.getenv("ODOO_PASSWORD", "")
-COMPANY_ID = os.getenv("ODOO_COMPANY_ID")
+# Companies come from res.company: the runner shards every source per company
 DATE_FROM = os.getenv("ODOO_DATE_FROM")  # optional ISO YYYY-MM-DD
 
-if COMPANY_ID:
-    COMPANY_ID = int(COMPANY_ID)
-
-if not all([URL, DB, USER, PASSWORD]):
-    raise RuntimeError("Missing Odoo env vars. Check .env")
-
-# --- ENV: PostgreSQL ---
-PG_HOST = os.getenv("PGHOST", "127.0.0.1")
-PG_PORT = int(os.getenv("PGPORT", "5432"))
-PG_DB = os.getenv("DB_NAME", "appdb")
-PG_USER = os.getenv("POSTGRES_USER", "postgres")
-PG_PASSWORD = os.getenv("POSTGRES_PASSWORD", "")
-SYSTEM_USER_EMAIL = os.getenv("SYSTEM_USER_EMAIL", "system@local")
-SYSTEM_USER_NAME = os.getenv("SYSTEM_USER_NAME", "System")
-SYSTEM_USER_ROLE = os.getenv("SYSTEM_USER_ROLE", "Admin")
-if not PG_PASSWORD:
-    raise RuntimeError("Missing PostgreSQL POSTGRES_PASSWORD. Check .env")
-
-# --- Odoo XML-RPC connections ---
-context = ssl._create_unverified_context()
-common = xmlrpc.client.ServerProxy(f"{URL}/xmlrpc/2/common", context=context)
-uid = common.authenticate(DB, USER, PASSWORD, {})
-if not uid:
-    raise RuntimeError("Auth failed. Check creds")
-models = xmlrpc.client.ServerProxy(f"{URL}/xmlrpc/2/object", context=context)
-
-TODAY = date.today()
-NOW_ISO = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+ETL_TYPE = "Achats locaux avec échéance"
+ETL_KEY = "achats_locaux"
 
 # --- Spec: 3. Achats locaux avec échéance ---
 # Domain: in_invoice/in_refund, states draft/posted, NOT import (
 #          (invoice_origin is False) OR (invoice_origin not ilike 'CE%') ),
 #         due date strictly in the future (> today)
 
-domain = [
-    ("move_type", "in", ["in_invoice", "in_refund"]),
-    ("state", "in", ["draft", "posted"]),
-    "|",
-    ("invoice_origin", "=", False),
-    ("invoice_origin", "not ilike", "CE%"),
-    ("invoice_date_due", ">", TODAY.isoformat()),
-    ("payment_state", "!=", "paid"),  # Exclure les factures déjà payées
-]
-if COMPANY_ID:
-    domain.append(("company_id", "=", COMPANY_ID))
-if DATE_FROM:
-    domain.append(("invoice_date", ">=", DATE_FROM))
+def build_domain(today: date) -> list:
+    domain = [
+        ("move_type", "in", ["in_invoice", "in_refund"]),
+        ("state", "in", ["draft", "posted"]),
+        "|",
+        ("invoice_origin", "=", False),
+        ("invoice_origin", "not ilike", "CE%"),
+        ("invoice_date_due", ">", today.isoformat()),
+        ("payment_state", "!=", "paid"),  # Exclure les factures déjà payées
+    ]
+    if DATE_FROM:
+        domain.append(("invoice_date", ">=", DATE_FROM))
+    return domain
 
 fields = [
     "name",
+    "write_date",
     "ref",
     "move_type",
     "state",
@@ -75,6 +45,7 @@ fields = [
     "invoice_date",
     "invoice_date_due",
     "amount_total",
+    "amount_residual",
     "invoice_origin",
     "company_id",
 ]
@@ -108,160 +79,58 @@ def ref_status_from_payment_state(ps: str) -> str:
         return "Annulée"
     return "En attente"
 
-# --- Fetch Odoo records ---
-limit = 100
-offset = 0
-records = []
-while True:
-    ids = models.execute_kw(
-        DB, uid, PASSWORD,
-        "account.move", "search",
-        [domain],
-        {"limit": limit, "offset": offset, "order": "invoice_date desc, id desc"}
-    )
-    if not ids:
-        break
-    recs = models.execute_kw(
-        DB, uid, PASSWORD,
-        "account.move", "read",
-        [ids],
-        {"fields": fields}
-    )
-    records.extend(recs)
-    if len(ids) < limit:
-        break
-    offset += limit
 
-# --- Connect to PostgreSQL ---
-conn = psycopg2.connect(
-    host=PG_HOST,
-    port=PG_PORT,
-    dbname=PG_DB,
-    user=PG_USER,
-    password=PG_PASSWORD,
-)
-conn.autocommit = False
-
-# --- Ensure helpers ---
-
-def ensure_company(cur, company_id: int, company_name: str | None = None) -> None:
-    if company_id is None:
-        return
-    cur.execute(
-        'SELECT 1 FROM company WHERE company_id = %s',
-        (company_id,)
-    )
-    if not cur.fetchone():
-        cur.execute(
-            'INSERT INTO company(company_id, name) VALUES (%s, %s) ON CONFLICT (company_id) DO NOTHING',
-            (company_id, company_name or f"Company {company_id}"),
+# --- Transform: one Odoo record -> Movement or Exception ---
+# (the loader skips references already staged in this run)
+def load_record(r: dict, loader: BulkLoader, odoo: OdooClient, today: date) -> None:
+    company = r.get("company_id") or [None, None]
+    company_id = company[0]
+    company_name = company[1] if isinstance(company, (list, tuple)) and len(company) > 1 else None
+    loader.ensure_company(company_id, company_name)
+
+    mt = r.get("move_type")
+    ps = r.get("payment_state")
+    inv_date = to_date(r.get("invoice_date"))
+    due = to_date(r.get("invoice_date_due"))
+    total = float(r.get("amount_total") or 0.0)
+    odoo_id = r.get("id")
+    # Use Odoo ID in reference to ensure uniqueness (especially for "/" references)
+    base_name = r.get("name") or r.get("ref") or ""
+    name = f"{base_name} (ID:{odoo_id})" if odoo_id else base_name
+    odoo_link = odoo.record_link(odoo_id)
+
+    # Exceptions identical to point 1.2
+    reason = None
+    if due and due < today:
+        reason = "Échéance passée (< aujourd'hui)"
+    # Note: Factures payées sont maintenant exclues dans le domaine Odoo
+
+    reference_type = ref_type_from_move_type(mt)
+    sign = sign_from_move_type(mt)
+    reference_status = ref_status_from_payment_state(ps)
+
+    if reason is not None:
+        # Insert Exception
+        loader.add_exception(
+            company_id, reason, abs(total), sign, reference_type, name, reference_status, odoo_link, odoo_id,
         )
+        return
 
+    # Insert Movement (one per open installment with ETL_DUE_DATES=installments)
+    movement_date = (due or inv_date or today).isoformat()
+    installments = split_installments(r, name) or [(name, None, abs(total))]
+    for installment, (reference, maturity, amount) in enumerate(installments, start=1):
+        loader.add_movement(
+            company_id, amount, sign, maturity or movement_date, reference_type, reference, reference_status,
+            odoo_link, odoo_id, installment,
+        )
 
-def get_or_create_system_user(cur) -> int:
-    cur.execute('SELECT user_id FROM "User" WHERE email = %s', (SYSTEM_USER_EMAIL,))
-    row = cur.fetchone()
-    if row and row[0]:
-        return int(row[0])
-    cur.execute(
-        'INSERT INTO "User"(display_name, email, role) VALUES (%s,%s,%s) RETURNING user_id',
-        (SYSTEM_USER_NAME, SYSTEM_USER_EMAIL, SYSTEM_USER_ROLE),
-    )
-    new_id_row = cur.fetchone()
-    if not new_id_row or new_id_row[0] is None:
-        cur.execute('SELECT user_id FROM "User" WHERE email = %s', (SYSTEM_USER_EMAIL,))
-        new_id_row = cur.fetchone()
-    return int(new_id_row[0])
-
-# --- Delete old data then insert fresh data ---
-ETL_TYPE = "Achats locaux avec échéance"
-
-with conn.cursor() as cur:
-    created_by_id = get_or_create_system_user(cur)
-    
-    # Delete ALL movements of this ETL type to prevent conflicts with duplicate references
-    # (e.g., multiple invoices with "/" reference)
-    cur.execute('DELETE FROM movement WHERE type = %s', (ETL_TYPE,))
-    deleted_movements = cur.rowcount
-    
-    # Delete existing Exception records for this ETL type
-    cur.execute('DELETE FROM "Exception" WHERE type = %s', (ETL_TYPE,))
-    deleted_exceptions = cur.rowcount
-    
-    print(f"Deleted {deleted_movements} old movements and {deleted_exceptions} old exceptions for {ETL_TYPE}")
-    
-    # Track inserted references to avoid duplicates within same run
-    inserted_movement_refs = set()
-    inserted_exception_refs = set()
-    
-    for r in records:
-        company = r.get("company_id") or [None, None]
-        company_id = company[0]
-        company_name = company[1] if isinstance(company, (list, tuple)) and len(company) > 1 else None
-        ensure_company(cur, company_id, company_name)
-
-        mt = r.get("move_type")
-        ps = r.get("payment_state")
-        inv_date = to_date(r.get("invoice_date"))
-        due = to_date(r.get("invoice_date_due"))
-        total = float(r.get("amount_total") or 0.0)
-        odoo_id = r.get("id")
-        # Use Odoo ID in reference to ensure uniqueness (especially for "/" references)
-        base_name = r.get("name") or r.get("ref") or ""
-        name = f"{base_name} (ID:{odoo_id})" if odoo_id else base_name
-        odoo_link = f"{URL}/web#id={odoo_id}&model=account.move&view_type=form" if odoo_id else ""
-
-        # Exceptions identical to point 1.2
-        reason = None
-        if due and due < TODAY:
-            reason = "Échéance passée (< aujourd'hui)"
-        # Note: Factures payées sont maintenant exclues dans le domaine Odoo
-
-        reference_type = ref_type_from_move_type(mt)
-        sign = sign_from_move_type(mt)
-        reference_status = ref_status_from_payment_state(ps)
-        
-        # Create unique key for tracking duplicates
-        ref_key = (company_id, reference_type, name, 1)  # archive_version always 1
-
-        if reason is not None:
-            # Skip if this exception reference already inserted
-            if ref_key in inserted_exception_refs:
-                continue
-            
-            # Insert Exception
-            sql = (
-                'INSERT INTO "Exception"(company_id, category, type, exception_type, criticity, description, amount, sign, reference_type, reference, reference_status, odoo_link, status, created_at) '
-                'VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
-            )
-            params = (
-                company_id, "Achat", ETL_TYPE, "Auto", "Warning", reason, abs(total), sign, reference_type, name, reference_status, odoo_link, "Actif", NOW_ISO,
-            )
-            cur.execute(sql, params)
-            inserted_exception_refs.add(ref_key)
-            continue
 
-        # Skip if this movement reference already inserted
-        if ref_key in inserted_movement_refs:
-            continue
-        
-        # Insert Movement
-        movement_date = (due or inv_date or TODAY).isoformat()
-        amount = abs(total)
-        archive_version = 1
-        
-        insert_sql = (
-            'INSERT INTO movement (company_id, manual_entry_id, category, type, amount, sign, movement_date, reference_type, reference, reference_status, source, note, status, created_at, created_by, odoo_link, updated_at, updated_by, archive_version) '
-            'VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)'
-        )
-        params = (
-            company_id, None, "Achat", ETL_TYPE, amount, sign, movement_date, reference_type, name, reference_status, "Odoo", "", "Actif", NOW_ISO, created_by_id, odoo_link, NOW_ISO, created_by_id, archive_version,
-        )
-        cur.execute(insert_sql, params)
-        inserted_movement_refs.add(ref_key)
+# Booked per invoice for their total (installments: their open residual)
+SOURCE = Source(
+    ETL_KEY, ETL_TYPE, "Achat", fields, build_domain, load_record, installments=True, booked="amount_total",
+)
 
-    conn.commit()
 
-conn.close()
-print(f"Insert completed: {ETL_TYPE}")
-print(f"Successfully inserted {len(inserted_movement_refs)} records")
+if __name__ == "__main__":
+    run_sources([SOURCE])
@@ -0,0 +1,130 @@
+# file: etl_jobs/bench_etl.py
+"""
+Benchmark the ETL jobs against the local fake Odoo (fake_odoo.py).
+
+Generates N synthetic invoices, serves them with an injected per-RPC latency,
+then runs each source on its own and all of them from the shared extraction,
+as full syncs into a scratch PostgreSQL database: the movement and "Exception"
+rows of these sources are replaced. It must be named explicitly, with --dsn or
+BENCH_DATABASE_URL (a libpq URL or key=value string, missing credentials taken
+from POSTGRES_USER / POSTGRES_PASSWORD), and the run is refused when it is the
+application's database (PG* / DB_NAME, DB_HOST / DB_PORT or DATABASE_URL).
+Reports per-phase seconds and throughput.
+
+Usage: python etl_jobs/bench_etl.py --dsn postgresql://postgres@localhost/bench
+       [--invoices 100000] [--latency 0.02] [--seed 1]
+       [--jobs achat_importation ventes_locales achats_locaux all] [--protocol xmlrpc]
+       [--due-dates installments]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from dotenv import load_dotenv
+from psycopg2.extensions import parse_dsn
+
+PHASES = ("plan", "extract", "transform", "stage", "publish")
+LOCAL_HOSTS = ("", "localhost", "127.0.0.1", "::1")
+
+
+def _address(host: str | None, port, dbname: str | None) -> tuple[str, int, str | None]:
+    """(host, port, database) with the local host spellings made equal."""
+    host = host or ""
+    return ("localhost" if host in LOCAL_HOSTS else host), int(port or 5432), dbname
+
+
+def _app_databases() -> set[tuple[str, int, str | None]]:
+    """Databases the application is configured with: the ETL jobs' and the backend's."""
+    addresses = {
+        _address(os.getenv("PGHOST", "127.0.0.1"), os.getenv("PGPORT"), os.getenv("DB_NAME", "appdb")),
+        _address(os.getenv("DB_HOST", "postgres"), os.getenv("DB_PORT"), os.getenv("DB_NAME", "appdb")),
+    }
+    if os.getenv("DATABASE_URL"):
+        params = parse_dsn(os.getenv("DATABASE_URL").replace("postgresql+psycopg2://", "postgresql://"))
+        addresses.add(_address(params.get("host"), params.get("port"), params.get("dbname")))
+    return addresses
+
+
+def bench_database(dsn: str | None) -> dict[str, str]:
+    """ETL connection variables for the scratch database `dsn` (refused if it is the application's)."""
+    if not dsn:
+        raise SystemExit("bench_etl replaces ETL rows: name a scratch database with --dsn or BENCH_DATABASE_URL")
+    params = parse_dsn(dsn)
+    if not params.get("dbname"):
+        raise SystemExit("The bench database URL must name a database")
+    if _address(params.get("host"), params.get("port"), params["dbname"]) in _app_databases():
+        raise SystemExit(f"Refusing to benchmark into the application's database ({params['dbname']})")
+    variables = {
+        "PGHOST": params.get("host") or "127.0.0.1",
+        "PGPORT": params.get("port") or "5432",
+        "DB_NAME": params["dbname"],
+    }
+    if params.get("user"):
+        variables["POSTGRES_USER"] = params["user"]
+    if params.get("password"):
+        variables["POSTGRES_PASSWORD"] = params["password"]
+    return variables
+
+
+def _report(job: str, wall: float, results: dict) -> None:
+    fetched = sum(r["fetched"] for r in results.values())
+    written = sum(r["inserted"] + r["updated"] for r in results.values())
+    timings = {p: sum(r["timings"][p] for r in results.values()) for p in PHASES}
+    timings["extract"] = max(r["timings"]["extract"] for r in results.values())  # one shared scan (per company shard, summed)
+    cells = " ".join(f"{timings[p]:>9.2f}" for p in PHASES)
+    print(f"{job:<18} {fetched:>9} {written:>9} {cells} {wall:>8.2f} {fetched / wall if wall else 0:>10.0f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the ETL jobs against a local fake Odoo")
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--companies", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every RPC")
+    parser.add_argument("--protocol", choices=("xmlrpc", "jsonrpc"), default="xmlrpc")
+    parser.add_argument("--due-dates", choices=("invoice", "installments"), default="invoice")
+    parser.add_argument("--jobs", nargs="+", default=["achat_importation", "ventes_locales", "achats_locaux", "all"])
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="scratch database (default: BENCH_DATABASE_URL), never the application's")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Point the ETL layer at the fake and the scratch database before its modules read the environment
+    os.environ.update(bench_database(args.dsn))
+    os.environ.update(
+        ETL_SYNC_MODE="full",
+        ODOO_DB="bench", ODOO_USERNAME="bench", ODOO_PASSWORD="bench",
+        ODOO_RPC_PROTOCOL=args.protocol,
+        ETL_DUE_DATES=args.due_dates,
+        ODOO_SESSION_CACHE_DIR=tempfile.mkdtemp(prefix="odoo_bench_"),
+    )
+    from fake_odoo import FakeOdoo, InvoiceStore, serve
+    from invoice_generator import generate_invoices, generate_move_lines, generate_rates
+
+    started = time.perf_counter()
+    store = InvoiceStore(generate_invoices(args.invoices, args.seed, args.companies))
+    lines = InvoiceStore(generate_move_lines(generate_invoices(args.invoices, args.seed, args.companies), args.seed))
+    fake = FakeOdoo(store, args.latency, InvoiceStore(generate_rates(args.seed)), lines)
+    server = serve(fake)
+    os.environ["ODOO_URL"] = "http://%s:%s" % server.server_address
+    print(f"{len(store)} invoices generated in {time.perf_counter() - started:.1f}s, "
+          f"latency {args.latency * 1000:.0f} ms/RPC, {args.protocol}, due dates per {args.due_dates}")
+
+    from account_move_upsert import SOURCES
+    from treasury_etl import run_sources
+
+    print(f"{'job':<18} {'fetched':>9} {'written':>9} " + " ".join(f"{p + ' s':>9}" for p in PHASES)
+          + f" {'wall s':>8} {'rec/s':>10}")
+    for job in args.jobs:
+        sources = list(SOURCES.values()) if job == "all" else [SOURCES[job]]
+        calls_before = len(fake.calls)
+        started = time.perf_counter()
+        results = run_sources(sources)
+        _report(job, time.perf_counter() - started, results)
+        print(f"{'':<18} {len(fake.calls) - calls_before} RPC calls")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
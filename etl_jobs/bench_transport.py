@@ -0,0 +1,114 @@
+# file: etl_jobs/bench_transport.py
+"""
+Benchmark the two Odoo transports of the ETL client over HTTP.
+
+Starts the local fake Odoo (fake_odoo.py) in a child process with N synthetic
+invoices and an injected per-RPC latency, then reads all of them the way the
+ETL extraction does: `OdooClient.search_read_keyset` with the fields of every
+source, once through XML-RPC (`KeepAliveTransport`) and once through JSON-RPC
+(`JsonRpcConnection`, gzip-compressed responses). The server runs in its own
+process, so the client CPU time measured here is the ETL side's only.
+Reports, best of --repeat scans: wall seconds, client CPU seconds, RPC round
+trips and records per second.
+
+Usage: python etl_jobs/bench_transport.py [--invoices 20000] [--latency 0.02] [--repeat 3]
+       [--page-size 500] [--workers 4] [--port 8169]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from odoo_client import DEFAULT_FETCH_WORKERS, DEFAULT_PAGE_SIZE, RPC_PROTOCOLS, OdooClient
+
+MODEL = "account.move"
+# Seconds to wait for the fake Odoo to generate its invoices and listen
+STARTUP_TIMEOUT = 600
+
+
+def start_fake_odoo(invoices: int, latency: float, port: int) -> subprocess.Popen:
+    """Run fake_odoo.py in a child process and wait until it listens."""
+    server = subprocess.Popen(
+        [sys.executable, "-u", os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_odoo.py"),
+         "--invoices", str(invoices), "--port", str(port), "--latency", str(latency), "--no-rates"],
+        stdout=subprocess.PIPE, text=True,
+    )
+    deadline = time.monotonic() + STARTUP_TIMEOUT
+    while time.monotonic() < deadline:
+        line = server.stdout.readline()
+        if "listening on" in line:
+            return server
+        if not line and server.poll() is not None:
+            break
+    server.kill()
+    raise RuntimeError("The fake Odoo did not start")
+
+
+def source_fields() -> list[str]:
+    """Fields the ETL extraction reads (union over the sources)."""
+    from account_move_upsert import SOURCES
+    return list(dict.fromkeys(["write_date"] + [f for s in SOURCES.values() for f in s.fields if f != "id"]))
+
+
+def scan(url: str, protocol: str, fields: list[str], page_size: int, workers: int) -> dict:
+    """One full keyset scan through `protocol`, on a fresh client (connections included)."""
+    client = OdooClient(url, "bench", "bench", "bench", protocol)
+    client.authenticate(use_cache=False)
+    pages = records = 0
+    wall, cpu = time.perf_counter(), time.process_time()
+    cursor = client.keyset_cursor(MODEL, [], workers)
+    for page in client.search_read_keyset(MODEL, [], fields, cursor, page_size):
+        pages += 1
+        records += len(page)
+    return {
+        "protocol": protocol,
+        "records": records,
+        "rpcs": pages + (2 if workers > 1 else 0),
+        "wall_s": time.perf_counter() - wall,
+        "cpu_s": time.process_time() - cpu,
+    }
+
+
+def bench(url: str, repeat: int, page_size: int, workers: int) -> list[dict]:
+    fields = source_fields()
+    results = []
+    for protocol in RPC_PROTOCOLS:
+        runs = [scan(url, protocol, fields, page_size, workers) for _ in range(repeat)]
+        results.append(min(runs, key=lambda r: r["wall_s"]))
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--invoices", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every RPC")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_FETCH_WORKERS, help="id ranges read concurrently")
+    parser.add_argument("--port", type=int, default=8169)
+    args = parser.parse_args()
+
+    # Fresh uid cache: the fake accepts any credentials
+    os.environ["ODOO_SESSION_CACHE_DIR"] = tempfile.mkdtemp(prefix="odoo_bench_")
+    server = start_fake_odoo(args.invoices, args.latency, args.port)
+    try:
+        results = bench(f"http://127.0.0.1:{args.port}", args.repeat, args.page_size, args.workers)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{args.invoices} invoices, {args.latency * 1000:.0f} ms/RPC, pages of {args.page_size}, "
+          f"{args.workers} ranges, best of {args.repeat}")
+    print(f"{'transport':<10} {'records':>9} {'RPCs':>6} {'wall s':>8} {'client CPU s':>13} {'rec/s':>9}")
+    for r in results:
+        print(f"{r['protocol']:<10} {r['records']:>9} {r['rpcs']:>6} {r['wall_s']:>8.2f} {r['cpu_s']:>13.2f}"
+              f" {r['records'] / r['wall_s'] if r['wall_s'] else 0:>9.0f}")
+    xml, js = results
+    print(f"jsonrpc vs xmlrpc: {xml['wall_s'] / js['wall_s']:.1f}x wall, "
+          f"{xml['cpu_s'] / js['cpu_s'] if js['cpu_s'] else 0:.1f}x less client CPU")
+
+
+if __name__ == "__main__":
+    main()
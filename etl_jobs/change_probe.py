@@ -0,0 +1,63 @@
+# file: etl_jobs/change_probe.py
+"""
+Cheap upstream change probe for the refresh scheduler (backend/app/refresh_scheduler.py).
+
+Two `search_count` per source, over the companies its shards cover, the same
+way sync_state.plan_sync decides to skip a run:
+
+- the invoices of its domain written in Odoo after the oldest watermark of its
+  company shards (`etl_sync_state`, see sync_state);
+- the invoices its domain matches now, against the record counts its shards
+  saved: invoices that left the domain (paid, cancelled, deleted) match no
+  watermark, but the count drops.
+
+A positive result means the next incremental run has work to do.
+"""
+from datetime import date
+
+from odoo_client import get_client
+from sync_state import SyncState, changed_since_domain, load_state, state_company, state_key
+from treasury_etl import MODEL, Source, get_connection, release_connection
+
+
+def shard_states(cur, etl_type: str) -> list[SyncState]:
+    """Sync states of the source's company shards (else of the unsharded source, synced before sharding)."""
+    cur.execute(
+        "SELECT source FROM etl_sync_state WHERE source = %s OR source LIKE %s ORDER BY source",
+        (etl_type, state_key(etl_type, 0)[:-1] + "%"),
+    )
+    states = [load_state(cur, source) for (source,) in cur.fetchall()]
+    return [state for state in states if state_company(state.source) is not None] or states
+
+
+def oldest_state(states: list[SyncState]) -> SyncState | None:
+    """Lowest (write_date, id) mark over the states (None if one has none yet)."""
+    if not states or any(not state.last_write_date for state in states):
+        return None
+    return min(states, key=lambda state: (state.last_write_date, state.last_id))
+
+
+def probe(sources: list[Source], today: date | None = None) -> dict[str, int | None]:
+    """{source key: invoices changed or gone since its last run} (None: never synced, refresh it)."""
+    today = today or date.today()
+    odoo = get_client()
+    conn = get_connection()
+    try:
+        changes = {}
+        for source in sources:
+            with conn.cursor() as cur:
+                states = shard_states(cur, source.etl_type)
+            state = oldest_state(states)
+            if state is None:
+                changes[source.key] = None
+                continue
+            domain = list(source.build_domain(today))
+            companies = sorted({state_company(s.source) for s in states} - {None})
+            if companies:
+                domain.append(("company_id", "in", companies))
+            changed = odoo.search_count(MODEL, domain + changed_since_domain(state))
+            live = odoo.search_count(MODEL, domain)
+            changes[source.key] = changed + abs(live - sum(s.record_count for s in states))
+        return changes
+    finally:
+        release_connection(conn)
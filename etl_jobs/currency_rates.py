@@ -0,0 +1,142 @@
+# file: etl_jobs/currency_rates.py
+"""
+Odoo currency rates for the ETL jobs.
+
+`sync_rates()` copies `res.currency.rate` into the local `currency_rate` table
+once per run, together with each company's currency, then loads the whole
+history into a `RateTable`. Like the sources (see sync_state), it only fetches
+the rates written since its (write_date, id) watermark, with a full copy on the
+first run of the day that also drops the rates deleted in Odoo. Records look
+their rate up in memory, as of their date, with a bisect over one sorted date
+list per (company, currency): no Odoo round trip per record.
+
+Odoo stores `rate` as currency units per company-currency unit; lookups return
+the inverse (company-currency units per currency unit), like the invoices'
+`custom_rate`.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import date
+from typing import Iterable
+
+from psycopg2.extras import execute_values
+
+from odoo_client import OdooClient
+from sync_state import SyncPlan, SyncProgress, changed_since_domain, load_state, needs_full_resync, save_state
+
+MODEL = "res.currency.rate"
+FIELDS = ["name", "rate", "currency_id", "company_id", "write_date"]
+STATE_KEY = MODEL
+
+
+class RateTable:
+    """As-of rate lookup over a rate history (see the module docstring)."""
+
+    def __init__(self, rates: Iterable[tuple[int | None, str, date, float]],
+                 company_currencies: dict[int, str] | None = None):
+        series: dict[tuple, list[tuple[date, float]]] = defaultdict(list)
+        for company_id, currency, rate_date, rate in rates:
+            if rate and rate > 0:
+                series[(company_id, currency)].append((rate_date, float(rate)))
+        self._dates: dict[tuple, list[date]] = {}
+        self._rates: dict[tuple, list[float]] = {}
+        for key, points in series.items():
+            points.sort()
+            self._dates[key] = [d for d, _ in points]
+            # Rounded like movement.exchange_rate, so amounts match the stored rate
+            self._rates[key] = [round(1 / r, 6) for _, r in points]
+        self.company_currencies = company_currencies or {}
+
+    def __len__(self) -> int:
+        return sum(len(dates) for dates in self._dates.values())
+
+    def rate(self, company_id: int | None, currency: str | None, day: date) -> float | None:
+        """Company-currency units per `currency` unit on `day`: the company's own
+        rates first, then the shared ones (None when no rate is known by then)."""
+        if not currency:
+            return None
+        if currency == self.company_currencies.get(company_id):
+            return 1.0
+        for key in ((company_id, currency), (None, currency)):
+            dates = self._dates.get(key)
+            if dates:
+                position = bisect_right(dates, day)
+                if position:
+                    return self._rates[key][position - 1]
+        return None
+
+
+_table = RateTable([])
+
+
+def current() -> RateTable:
+    """Rates of the run in progress (set by `sync_rates` / `load_rates`)."""
+    return _table
+
+
+def load_rates(cur) -> RateTable:
+    """Build the table from the local copy only (e.g. for a retransform, without Odoo)."""
+    global _table
+    cur.execute("SELECT company_id, currency, rate_date, rate FROM currency_rate")
+    rates = cur.fetchall()
+    cur.execute("SELECT company_id, currency FROM company WHERE currency IS NOT NULL")
+    _table = RateTable(rates, dict(cur.fetchall()))
+    return _table
+
+
+def sync_rates(odoo: OdooClient, conn, today: date) -> RateTable:
+    """Fetch the rates written since the last run and the company currencies, then load the table.
+
+    `conn` is in autocommit mode; the local copy is replaced in one transaction,
+    so concurrent runs never read a partial history.
+    """
+    with conn.cursor() as cur:
+        state = load_state(cur, STATE_KEY)
+    full = bool(needs_full_resync(state, today))
+    domain = [] if full else changed_since_domain(state)
+    seen = SyncProgress()
+    # By Odoo id: a rate read twice while paging is written once (ON CONFLICT cannot update a row twice)
+    rows = {}
+    for page in odoo.search_read_pages(MODEL, domain, FIELDS, order="id", workers=1, page_size=1000):
+        for record in seen.track(page):
+            company = record.get("company_id")
+            rows[record["id"]] = (
+                record["id"], record["currency_id"][1], company[0] if company else None,
+                record["name"], record["rate"], record.get("write_date") or None,
+            )
+    companies = odoo.search_read_all("res.company", [], ["name", "currency_id"], order="id", workers=1)
+
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            if full:
+                cur.execute("DELETE FROM currency_rate")
+            # One multi-row INSERT per page of rates rather than one round trip per rate
+            execute_values(
+                cur,
+                "INSERT INTO currency_rate(odoo_id, currency, company_id, rate_date, rate, write_date) "
+                "VALUES %s ON CONFLICT (odoo_id) DO UPDATE SET "
+                "currency = EXCLUDED.currency, company_id = EXCLUDED.company_id, "
+                "rate_date = EXCLUDED.rate_date, rate = EXCLUDED.rate, write_date = EXCLUDED.write_date",
+                list(rows.values()),
+                page_size=1000,
+            )
+            cur.execute("SELECT count(*) FROM currency_rate")
+            plan = SyncPlan("full" if full else "incremental", domain, record_count=cur.fetchone()[0])
+            save_state(cur, STATE_KEY, plan, seen)
+            for company in companies:
+                currency = company.get("currency_id")
+                cur.execute(
+                    "INSERT INTO company(company_id, name, currency) VALUES (%s, %s, %s) "
+                    "ON CONFLICT (company_id) DO UPDATE SET currency = EXCLUDED.currency",
+                    (company["id"], company.get("name") or f"Company {company['id']}",
+                     currency[1] if currency else None),
+                )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+    with conn.cursor() as cur:
+        return load_rates(cur)
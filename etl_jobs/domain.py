@@ -0,0 +1,132 @@
+# file: etl_jobs/domain.py
+"""
+Odoo domain helpers for the ETL jobs.
+
+Domains use Odoo's prefix notation (implicit "&" between terms). These helpers
+combine several source domains into one fetch domain and evaluate a domain
+against an already fetched record, following Odoo's SQL semantics (negative
+operators match NULL/False, many2one values compare on their id).
+"""
+import operator
+import re
+from functools import lru_cache
+from typing import Callable
+
+_ARITY = {"&": 2, "|": 2, "!": 1}
+
+
+def _is_leaf(term) -> bool:
+    return isinstance(term, (list, tuple)) and len(term) == 3
+
+
+def _terms(domain: list) -> list[list]:
+    """Split an implicit-AND domain into its top-level terms (each in prefix form)."""
+    terms, pos = [], 0
+    while pos < len(domain):
+        start, needed = pos, 1
+        while needed:
+            token = domain[pos]
+            needed += _ARITY.get(token, 0) - 1 if not _is_leaf(token) else -1
+            pos += 1
+        terms.append(list(domain[start:pos]))
+    return terms
+
+
+def normalize(domain: list) -> list:
+    """Same domain with explicit "&" operators, so it can be nested."""
+    terms = _terms(list(domain))
+    if not terms:
+        return []
+    return ["&"] * (len(terms) - 1) + [token for term in terms for token in term]
+
+
+def domain_or(*domains: list) -> list:
+    """Records matching any of `domains` (an empty domain matches everything)."""
+    normalized = [normalize(d) for d in domains]
+    if not normalized or any(not d for d in normalized):
+        return []
+    return ["|"] * (len(normalized) - 1) + [token for d in normalized for token in d]
+
+
+def domain_fields(domain: list) -> set[str]:
+    return {term[0] for term in domain if _is_leaf(term)}
+
+
+@lru_cache(maxsize=64)
+def _like_regex(pattern: str, case_insensitive: bool) -> re.Pattern:
+    # Odoo wraps the value in %...% and leaves SQL wildcards in it active
+    body = "".join(".*" if c == "%" else "." if c == "_" else re.escape(c) for c in pattern)
+    return re.compile(f"^.*{body}.*$", re.S | (re.I if case_insensitive else 0))
+
+
+def _value(record: dict, field: str):
+    value = record.get(field)
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else False  # many2one: [id, display_name]
+    return value
+
+
+def _empty(value) -> bool:
+    return value is None or value is False
+
+
+_COMPARE = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+def _leaf(field: str, op: str, target) -> Callable[[dict], bool]:
+    if op == "=":
+        if target is False:
+            return lambda record: _empty(_value(record, field))
+        return lambda record: _value(record, field) == target
+    if op == "!=":
+        if target is False:
+            return lambda record: not _empty(_value(record, field))
+        return lambda record: _value(record, field) != target
+    if op in ("in", "not in"):
+        targets = set(t for t in target if t is not False)
+        with_empty = False in target
+        negate = op == "not in"
+
+        def member(record: dict) -> bool:
+            value = _value(record, field)
+            found = with_empty if _empty(value) else value in targets
+            return found != negate
+        return member
+    if op in ("like", "ilike", "not like", "not ilike"):
+        regex = _like_regex(str(target), op.endswith("ilike"))
+        negate = op.startswith("not")
+
+        def like(record: dict) -> bool:
+            value = _value(record, field)
+            return (not _empty(value) and regex.match(str(value)) is not None) != negate
+        return like
+    if op in _COMPARE:
+        compare = _COMPARE[op]
+
+        def ordered(record: dict) -> bool:
+            value = _value(record, field)
+            return not _empty(value) and compare(value, target)
+        return ordered
+    raise ValueError(f"Unsupported domain operator: {op!r}")
+
+
+def compile_domain(domain: list) -> Callable[[dict], bool]:
+    """Predicate equivalent to `domain`, built once for evaluation on many records."""
+    stack: list[Callable[[dict], bool]] = []
+    for token in reversed(normalize(domain)):
+        if token in ("&", "|"):
+            left, right = stack.pop(), stack.pop()
+            if token == "&":
+                stack.append(lambda record, a=left, b=right: a(record) and b(record))
+            else:
+                stack.append(lambda record, a=left, b=right: a(record) or b(record))
+        elif token == "!":
+            stack.append(lambda record, a=stack.pop(): not a(record))
+        else:
+            stack.append(_leaf(*token))
+    return stack[0] if stack else (lambda record: True)
+
+
+def matches(record: dict, domain: list) -> bool:
+    """Evaluate an Odoo domain against a record returned by search_read."""
+    return compile_domain(domain)(record)
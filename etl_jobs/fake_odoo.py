@@ -0,0 +1,315 @@
+# file: etl_jobs/fake_odoo.py
+"""
+Local stand-in for the Odoo endpoints used by the ETL jobs, for load tests.
+
+Serves `xmlrpc/2/common` (`authenticate`), `xmlrpc/2/object` (`execute_kw` with
+`search`, `read`, `search_read`, `search_count` and non-lazy `read_group` on
+`account.move`, and `search_read` on `res.company`, derived from the invoices;
+the same on `res.currency.rate` and `account.move.line` when their stores are
+given) and `/jsonrpc` (gzip-compressed when asked), over in-memory stores filled
+by invoice_generator. Domains are evaluated with the same semantics as
+domain.matches; filtered and sorted id lists are cached per (domain, order), so
+paging through 1M invoices does not rescan the store for every page (keyset
+pages, with leading `id` bounds, are cut from the list of the rest of the domain;
+line reads led by `("move_id", "in", ids)` go through a per-invoice index).
+`latency` seconds are added to every call to mimic a remote Odoo.
+
+Usage: python etl_jobs/fake_odoo.py [--invoices 100000] [--seed 1] [--port 8069] [--latency 0.02] [--no-rates]
+"""
+import argparse
+import bisect
+import gzip
+import json
+import threading
+import time
+import xmlrpc.client
+from collections import OrderedDict
+from datetime import date
+from socketserver import ThreadingMixIn
+from typing import Iterable
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+from domain import compile_domain
+from invoice_generator import generate_invoices, generate_move_lines, generate_rates
+
+MODEL = "account.move"
+RATE_MODEL = "res.currency.rate"
+LINE_MODEL = "account.move.line"
+COMPANY_CURRENCY = [1, "TND"]
+UID = 2
+
+
+class _Row:
+    """Read-only dict-like view over a stored tuple (enough for domain predicates)."""
+
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: dict[str, int], values: tuple):
+        self._index = index
+        self._values = values
+
+    def get(self, field: str, default=None):
+        position = self._index.get(field)
+        return default if position is None else self._values[position]
+
+
+class InvoiceStore:
+    """account.move (or rate, line) records stored as tuples (1M generated invoices fit in about 0.9 GB)."""
+
+    def __init__(self, records: Iterable[dict], cache_size: int = 32):
+        self.fields: tuple[str, ...] | None = None
+        self._index: dict[str, int] = {}
+        self._rows: dict[int, tuple] = {}
+        self._cache: OrderedDict = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+        self.companies: dict[int, str] = {}
+        self._by_move: dict[int, list[int]] = {}  # account.move.line ids per move_id
+        for record in records:
+            self.put(record)
+
+    def put(self, record: dict) -> None:
+        if self.fields is None:
+            self.fields = tuple(record)
+            self._index = {f: i for i, f in enumerate(self.fields)}
+        with self._lock:
+            self._rows[record["id"]] = tuple(record.get(f, False) for f in self.fields)
+            if record.get("company_id"):
+                self.companies.setdefault(*record["company_id"])
+            if record.get("move_id"):
+                self._by_move.setdefault(record["move_id"][0], []).append(record["id"])
+            self._cache.clear()
+
+    def delete(self, odoo_id: int) -> None:
+        with self._lock:
+            self._rows.pop(odoo_id, None)
+            self._cache.clear()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, odoo_id) -> bool:
+        return odoo_id in self._rows
+
+    def record(self, odoo_id: int, fields: list[str] | None = None) -> dict:
+        values = self._rows[odoo_id]
+        wanted = fields or self.fields
+        out = {f: values[self._index[f]] for f in wanted if f in self._index}
+        out["id"] = odoo_id
+        return out
+
+    def _sort_key(self, field: str):
+        position = self._index[field]
+
+        def key(item):
+            value = item[1][position]
+            if isinstance(value, list):
+                value = value[0]
+            empty = value is None or value is False
+            return empty, 0 if empty else value
+        return key
+
+    def search(self, domain: list, order: str | None = None) -> list[int]:
+        if self._by_move and domain and tuple(domain[0][:2]) == ("move_id", "in") and (order or "id") == "id":
+            predicate = compile_domain(domain[1:])
+            with self._lock:
+                candidates = sorted(i for move_id in domain[0][2] for i in self._by_move.get(move_id, ()))
+                return [i for i in candidates if i in self._rows and predicate(_Row(self._index, self._rows[i]))]
+        lower, upper, rest = _id_bounds(domain)
+        if (lower, upper) != (None, None) and (order or "id").lower() in ("id", "id asc"):
+            ids = self.search(rest, order)
+            start = 0 if lower is None else bisect.bisect_right(ids, lower)
+            return ids[start:] if upper is None else ids[start:bisect.bisect_right(ids, upper)]
+        cache_key = (json.dumps(domain, default=str), order or "id")
+        with self._lock:
+            if cache_key in self._cache:
+                self._cache.move_to_end(cache_key)
+                return self._cache[cache_key]
+            rows = list(self._rows.items())
+        predicate = compile_domain(domain)
+        matched = [item for item in rows if predicate(_Row(self._index, item[1]))]
+        # Stable sorts from the last key to the first; NULLs last ASC, first DESC (PostgreSQL)
+        for part in reversed([p.strip() for p in (order or "id").split(",") if p.strip()]):
+            field, _, direction = part.partition(" ")
+            descending = direction.strip().lower() == "desc"
+            if field == "id":
+                matched.sort(key=lambda item: item[0], reverse=descending)
+            else:
+                matched.sort(key=self._sort_key(field), reverse=descending)
+        ids = [odoo_id for odoo_id, _ in matched]
+        with self._lock:
+            self._cache[cache_key] = ids
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return ids
+
+
+def _id_bounds(domain: list) -> tuple[int | None, int | None, list]:
+    """Leading ("id", ">", n) / ("id", "<=", n) terms of a domain, and the rest of it."""
+    lower = upper = None
+    position = 0
+    for term in domain:
+        if not (isinstance(term, (list, tuple)) and len(term) == 3 and term[0] == "id" and term[1] in (">", "<=")):
+            break
+        if term[1] == ">":
+            lower = term[2] if lower is None else max(lower, term[2])
+        else:
+            upper = term[2] if upper is None else min(upper, term[2])
+        position += 1
+    return lower, upper, list(domain[position:])
+
+
+class FakeOdoo:
+    """RPC semantics of the fake server, independent of the wire protocol."""
+
+    def __init__(self, store: InvoiceStore, latency: float = 0.0, rates: InvoiceStore | None = None,
+                 lines: InvoiceStore | None = None):
+        self.store = store
+        self.latency = latency
+        self.stores = {MODEL: store}
+        for model, extra in ((RATE_MODEL, rates), (LINE_MODEL, lines)):
+            if extra is not None:
+                self.stores[model] = extra
+        self.calls: list[str] = []
+
+    def authenticate(self, db, login, password, user_agent_env=None):
+        self.calls.append("authenticate")
+        time.sleep(self.latency)
+        return UID
+
+    def execute_kw(self, db, uid, password, model, method, args, kwargs=None):
+        self.calls.append(method)
+        time.sleep(self.latency)
+        if uid != UID:
+            raise xmlrpc.client.Fault(3, "odoo.exceptions.AccessDenied: Access Denied")
+        if model == "res.company" and method == "search_read":
+            return [{"id": company_id, "name": name, "currency_id": COMPANY_CURRENCY}
+                    for company_id, name in sorted(self.store.companies.items())]
+        store = self.stores.get(model)
+        if store is None:
+            raise xmlrpc.client.Fault(2, f"Model not served by the fake: {model}")
+        kwargs = kwargs or {}
+        if method == "read":
+            ids = args[0] if args else kwargs.get("ids", [])
+            return [store.record(i, kwargs.get("fields")) for i in ids if i in store]
+        domain = args[0] if args else kwargs.get("domain", [])
+        if method == "read_group":
+            return self._read_group(store, domain, *args[1:3])
+        ids = store.search(domain, kwargs.get("order"))
+        if method == "search_count":
+            return len(ids)
+        offset = kwargs.get("offset", 0) or 0
+        limit = kwargs.get("limit")
+        ids = ids[offset:offset + limit] if limit else ids[offset:]
+        if method == "search":
+            return ids
+        if method == "search_read":
+            return [store.record(i, kwargs.get("fields")) for i in ids]
+        raise xmlrpc.client.Fault(2, f"Method not served by the fake: {method}")
+
+    @staticmethod
+    def _read_group(store: InvoiceStore, domain: list, fields: list[str], groupby: list[str]) -> list[dict]:
+        """Counts and sums per combination of `groupby` values ("field:month" on dates), like lazy=False."""
+        summed = [spec.partition(":")[0] for spec in fields]
+        groups: dict[tuple, dict] = {}
+        for odoo_id in store.search(domain):
+            record = store.record(odoo_id)
+            key = []
+            for spec in groupby:
+                name, _, interval = spec.partition(":")
+                value = record.get(name, False)
+                if interval == "month" and value:
+                    value = value[:7]
+                key.append(tuple(value) if isinstance(value, list) else value)
+            group = groups.setdefault(tuple(key), {"__count": 0, **{name: 0.0 for name in summed}})
+            group["__count"] += 1
+            for name in summed:
+                group[name] += record.get(name) or 0.0
+        result = []
+        for key, group in groups.items():
+            group["__range"] = {}
+            for spec, value in zip(groupby, key):
+                if spec.endswith(":month") and value:
+                    start = date.fromisoformat(f"{value}-01")
+                    end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+                    group[spec] = start.strftime("%B %Y")
+                    group["__range"][spec] = {"from": start.isoformat(), "to": end.isoformat()}
+                else:
+                    group[spec] = list(value) if isinstance(value, tuple) else value
+                    if spec.endswith(":month"):
+                        group["__range"][spec] = False
+            result.append(group)
+        return result
+
+    def jsonrpc(self, request: dict) -> dict:
+        params = request.get("params", {})
+        reply = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            handler = self.authenticate if params.get("method") == "authenticate" else self.execute_kw
+            reply["result"] = handler(*params.get("args", []))
+        except xmlrpc.client.Fault as fault:
+            name, _, message = fault.faultString.partition(": ")
+            reply["error"] = {"code": 200, "message": "Odoo Server Error",
+                              "data": {"name": name, "message": message or fault.faultString}}
+        return reply
+
+
+def serve(fake: FakeOdoo, host: str = "127.0.0.1", port: int = 0) -> SimpleXMLRPCServer:
+    """Start the server in a daemon thread; `port=0` picks a free port (see server.server_address)."""
+
+    class Handler(SimpleXMLRPCRequestHandler):
+        rpc_paths = ("/xmlrpc/2/common", "/xmlrpc/2/object")
+        protocol_version = "HTTP/1.1"  # keep-alive, like Odoo behind a proxy
+
+        def do_POST(self):
+            if self.path != "/jsonrpc":
+                return super().do_POST()
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            body = json.dumps(fake.jsonrpc(request)).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            if "gzip" in self.headers.get("Accept-Encoding", ""):
+                body = gzip.compress(body)
+                self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    class Server(ThreadingMixIn, SimpleXMLRPCServer):
+        daemon_threads = True
+        allow_reuse_address = True
+
+    server = Server((host, port), requestHandler=Handler, logRequests=False, allow_none=True)
+    server.register_function(fake.authenticate, "authenticate")
+    server.register_function(fake.execute_kw, "execute_kw")
+    threading.Thread(target=server.serve_forever, name="fake-odoo", daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local fake Odoo serving synthetic invoices")
+    parser.add_argument("--invoices", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--companies", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8069)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every RPC")
+    parser.add_argument("--no-rates", action="store_true", help="serve no res.currency.rate history")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = InvoiceStore(generate_invoices(args.invoices, args.seed, args.companies))
+    rates = None if args.no_rates else InvoiceStore(generate_rates(args.seed))
+    lines = InvoiceStore(generate_move_lines(generate_invoices(args.invoices, args.seed, args.companies), args.seed))
+    server = serve(FakeOdoo(store, args.latency, rates, lines), args.host, args.port)
+    host, port = server.server_address
+    print(f"Fake Odoo: {len(store)} invoices generated in {time.perf_counter() - started:.1f}s, "
+          f"listening on http://{host}:{port} (any db/login/password)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# file: etl_jobs/invoice_generator.py
+"""
+Seeded generator of synthetic Odoo `account.move` invoices for load tests.
+
+Records have the fields read by the ETL jobs, with distributions close to the
+production data: mostly posted, a third already paid, import purchases carrying
+an "CE…" `invoice_origin` and usually a `custom_rate`, local purchases a PO or no
+origin. The same seed always produces the same invoices, so benchmark runs are
+comparable; records are yielded one by one so 1M invoices can be streamed.
+`generate_rates` yields the matching daily EUR `res.currency.rate` history and
+`generate_move_lines` the receivable / payable installment lines of invoices.
+"""
+import random
+from datetime import date, timedelta
+from typing import Iterable, Iterator
+
+# (value, weight)
+MOVE_TYPES = (("out_invoice", 45), ("in_invoice", 35), ("out_refund", 10), ("in_refund", 10))
+STATES = (("posted", 85), ("draft", 12), ("cancel", 3))
+PAYMENT_STATES = (("not_paid", 40), ("paid", 33), ("partial", 12), ("in_payment", 10), ("reversed", 5))
+PAYMENT_TERMS_DAYS = ((0, 15), (30, 40), (60, 25), (90, 15), (120, 5))
+IMPORT_SHARE = 0.3  # purchases whose origin is a "CE" import file
+IMPORT_RATE_SHARE = 0.85  # imports with a custom_rate set
+INSTALLMENTS = ((1, 70), (2, 20), (3, 10))  # installments per invoice, 30 days apart
+
+
+def _weighted(rnd: random.Random, choices: tuple) -> object:
+    values, weights = zip(*choices)
+    return rnd.choices(values, weights)[0]
+
+
+def generate_invoices(
+    count: int,
+    seed: int = 1,
+    companies: int = 1,
+    today: date | None = None,
+    history_days: int = 365,
+) -> Iterator[dict]:
+    """Yield `count` invoices with ids 1..count."""
+    rnd = random.Random(seed)
+    today = today or date.today()
+    company_ids = list(range(1, companies + 1))
+    for odoo_id in range(1, count + 1):
+        move_type = _weighted(rnd, MOVE_TYPES)
+        state = _weighted(rnd, STATES)
+        payment_state = "not_paid" if state != "posted" else _weighted(rnd, PAYMENT_STATES)
+        invoice_date = today - timedelta(days=rnd.randint(0, history_days))
+        due_date = invoice_date + timedelta(days=_weighted(rnd, PAYMENT_TERMS_DAYS))
+        total = round(rnd.lognormvariate(8, 1.2), 2)
+        residual = {
+            "paid": 0.0,
+            "reversed": 0.0,
+            "partial": round(total * rnd.uniform(0.1, 0.9), 2),
+        }.get(payment_state, total)
+
+        purchase = move_type.startswith("in_")
+        origin, custom_rate = False, False
+        if purchase and rnd.random() < IMPORT_SHARE:
+            origin = f"CE{rnd.randint(1, 9999):04d}"
+            if rnd.random() < IMPORT_RATE_SHARE:
+                custom_rate = round(rnd.uniform(3.2, 3.5), 4)
+        elif purchase:
+            origin = rnd.choice([False, f"PO{rnd.randint(1, 99999):05d}"])
+        else:
+            origin = rnd.choice([False, False, f"SO{rnd.randint(1, 99999):05d}"])
+
+        company_id = rnd.choice(company_ids)
+        written = invoice_date + timedelta(days=rnd.randint(0, 30))
+        prefix = {"out_invoice": "INV", "out_refund": "RINV", "in_invoice": "BILL", "in_refund": "RBILL"}[move_type]
+        yield {
+            "id": odoo_id,
+            "name": f"{prefix}/{invoice_date.year}/{odoo_id:07d}" if state != "draft" else "/",
+            "write_date": f"{min(written, today).isoformat()} {rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:00",
+            "ref": rnd.choice([False, f"REF{odoo_id}"]) if purchase else False,
+            "move_type": move_type,
+            "state": state,
+            "payment_state": payment_state,
+            "invoice_date": invoice_date.isoformat(),
+            "invoice_date_due": due_date.isoformat(),
+            "amount_total": total,
+            "amount_residual": residual,
+            "invoice_origin": origin,
+            "company_id": [company_id, f"Company {company_id}"],
+            "partner_id": [rnd.randint(1, 2000), "Partner"],
+            "currency_id": [2, "EUR"] if origin and origin.startswith("CE") else [1, "TND"],
+            "custom_rate": custom_rate,
+        }
+
+
+def generate_rates(seed: int = 1, today: date | None = None, history_days: int = 365) -> Iterator[dict]:
+    """Yield one EUR rate per day over the invoice history (shared by all companies).
+
+    Odoo rates are currency units per company-currency (TND) unit.
+    """
+    rnd = random.Random(seed)
+    today = today or date.today()
+    start = today - timedelta(days=history_days)
+    for offset in range(history_days + 1):
+        day = start + timedelta(days=offset)
+        yield {
+            "id": offset + 1,
+            "name": day.isoformat(),
+            "rate": round(1 / rnd.uniform(3.2, 3.5), 6),
+            "currency_id": [2, "EUR"],
+            "company_id": False,
+            "write_date": f"{day.isoformat()} 08:00:00",
+        }
+
+
+def generate_move_lines(invoices: Iterable[dict], seed: int = 1) -> Iterator[dict]:
+    """Yield the receivable / payable `account.move.line` rows of `invoices`.
+
+    Each invoice is split into installments ending on its due date; what has
+    been paid settles the earliest ones first (fully paid lines are reconciled).
+    """
+    rnd = random.Random(f"lines-{seed}")
+    line_id = 0
+    for invoice in invoices:
+        count = _weighted(rnd, INSTALLMENTS)
+        total, residual = invoice["amount_total"], invoice["amount_residual"]
+        shares = [round(total / count, 2)] * (count - 1)
+        shares.append(round(total - sum(shares), 2))
+        paid = round(total - residual, 2)
+        due = date.fromisoformat(invoice["invoice_date_due"])
+        out = invoice["move_type"].startswith("out_")
+        # Receivables are debits, payables credits; refunds the other way round
+        sign = 1 if out == invoice["move_type"].endswith("_invoice") else -1
+        rate = invoice["custom_rate"] or 1.0
+        for index, share in enumerate(shares):
+            settled = min(share, paid)
+            paid = round(paid - settled, 2)
+            open_amount = round(share - settled, 2)
+            line_id += 1
+            yield {
+                "id": line_id,
+                "move_id": [invoice["id"], invoice["name"]],
+                "account_type": "asset_receivable" if out else "liability_payable",
+                "date_maturity": (due - timedelta(days=30 * (count - 1 - index))).isoformat(),
+                "amount_residual_currency": sign * open_amount,
+                "amount_residual": round(sign * open_amount * rate, 2),
+                "reconciled": open_amount == 0,
+                "company_id": invoice["company_id"],
+            }
@@ -0,0 +1,505 @@
+# file: etl_jobs/loader.py
+"""
+Shared load stage for the ETL jobs.
+
+Transformed rows are buffered and written with `COPY ... FROM STDIN` in batches,
+so load time depends on data volume rather than on one round trip per row.
+Companies are resolved once per run through an in-memory set.
+
+Rows are first COPY-ed, outside any transaction on the live tables, into
+per-source UNLOGGED staging tables (`etl_stage_movement_<key>`,
+`etl_stage_exception_<key>`, suffixed `_c<company_id>` for a company shard and
+`_w<scope>` for a window run).
+`publish()` then applies them in one short set-based transaction: readers never
+see a half-loaded refresh, row locks on movement / "Exception" are held for the
+publish only, and a job that fails before publishing leaves the previous
+snapshot untouched. The staging tables are keyed like the live rows, so a
+reference read twice in one run is staged once (the first occurrence wins)
+without keeping every key in memory.
+
+Two publish modes (ETL_LOAD_MODE):
+
+- "merge" (default): movements are merged on their Odoo identity, `ux_movement_odoo`
+  (company_id, reference_type, odoo_id, installment, archive_version), with
+  `INSERT ... ON CONFLICT DO UPDATE` restricted to rows whose payload differs;
+  exceptions on (company_id, type, reference_type, odoo_id). The reference (the
+  invoice name) is payload: a draft "/" posted as "BILL/..." keeps its row. Only
+  rows that vanished upstream are deleted, so `movement_id`,
+  `exclude_from_analytics`, status and disable reason survive refreshes.
+- "replace": the historical delete of the whole scope followed by plain inserts.
+
+The raw Odoo records a source was built from are staged alongside its rows
+(`add_raw`) and, in the same publish transaction and scope, mirrored into the
+`etl_raw_move` landing table (JSONB payloads, one per source and Odoo id), from
+which a retransform rebuilds the rows without calling Odoo (treasury_etl).
+"""
+import csv
+import io
+import json
+import os
+import time
+from typing import Iterator
+
+from metrics import RunMetrics
+
+BATCH_SIZE = int(os.getenv("ETL_LOAD_BATCH_SIZE", "5000"))
+LOAD_MODE = os.getenv("ETL_LOAD_MODE", "merge")  # merge | replace
+
+MOVEMENT_COLUMNS = (
+    "company_id", "manual_entry_id", "category", "type", "amount", "sign", "movement_date",
+    "reference_type", "reference", "reference_status", "source", "note", "status",
+    "created_at", "created_by", "odoo_link", "updated_at", "updated_by", "archive_version",
+    "exchange_rate", "currency", "amount_currency", "odoo_id", "installment",
+)
+
+EXCEPTION_COLUMNS = (
+    "company_id", "category", "type", "exception_type", "criticity", "description", "amount",
+    "sign", "reference_type", "reference", "reference_status", "odoo_link", "status", "created_at",
+    "odoo_id",
+)
+
+# Columns refreshed from Odoo; anything else on the row belongs to the users
+MOVEMENT_PAYLOAD = (
+    "category", "type", "amount", "sign", "movement_date", "reference", "reference_status", "odoo_link",
+    "exchange_rate", "currency", "amount_currency",
+)
+EXCEPTION_PAYLOAD = ("category", "description", "amount", "sign", "reference", "reference_status", "odoo_link")
+
+# Odoo identity of a row: `ux_movement_odoo` (partial: manual entries have no odoo_id)
+MOVEMENT_KEY = ("company_id", "reference_type", "odoo_id", "installment", "archive_version")
+EXCEPTION_KEY = ("company_id", "type", "reference_type", "odoo_id")
+
+RAW_COLUMNS = ("company_id", "odoo_id", "write_date", "payload")
+
+_NULL = r"\N"
+
+
+def _copy_rows(cur, table: str, columns: tuple[str, ...], rows: list[tuple]) -> int:
+    """COPY `rows` into `table`; returns the CSV payload size in characters (~bytes)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    for row in rows:
+        writer.writerow([_NULL if v is None else v for v in row])
+    size = buf.tell()
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{_NULL}')",
+        buf,
+    )
+    return size
+
+
+def _tuple(alias: str, columns: tuple[str, ...]) -> str:
+    return "(" + ", ".join(f"{alias}.{c}" for c in columns) + ")"
+
+
+def _key_match(left: str, right: str, key: tuple[str, ...]) -> str:
+    return " AND ".join(f"{left}.{c} = {right}.{c}" for c in key)
+
+
+def landing_count(cur, etl_type: str, company_id: int | None) -> int:
+    cur.execute(
+        "SELECT count(*) FROM etl_raw_move WHERE etl_type = %s AND company_id IS NOT DISTINCT FROM %s",
+        (etl_type, company_id),
+    )
+    return cur.fetchone()[0]
+
+
+def landing_companies(cur, etl_types: list[str]) -> list[int]:
+    cur.execute(
+        "SELECT DISTINCT company_id FROM etl_raw_move WHERE etl_type = ANY(%s) AND company_id IS NOT NULL"
+        " ORDER BY company_id",
+        (etl_types,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def read_landing(conn, etl_type: str, company_id: int | None, batch_size: int = BATCH_SIZE) -> Iterator[dict]:
+    """Landed records of one source (and company) in Odoo id order, `batch_size` rows per query."""
+    last_id = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(
+                "SELECT odoo_id, payload FROM etl_raw_move WHERE etl_type = %s"
+                " AND company_id IS NOT DISTINCT FROM %s AND odoo_id > %s ORDER BY odoo_id LIMIT %s",
+                (etl_type, company_id, last_id, batch_size),
+            )
+            rows = cur.fetchall()
+            for _, payload in rows:
+                yield payload
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+
+class BulkLoader:
+    """Stages movements and exceptions of one ETL source, then publishes them atomically.
+
+    Call `begin()` before adding rows and `publish(scope_ids)` at the end.
+    `scope_ids` is the set of Odoo ids this run is authoritative for
+    (None = every row of the ETL type, i.e. a full sync); it is only needed at
+    publish time, so it can be collected while rows stream in. With `company_id`
+    the loader is one company shard: its staging tables, lock and publish scope
+    (deletes included) are restricted to that company's rows. `scope` (a window run's
+    digest) gives the run its own staging tables and lock, so it never touches what an
+    interrupted full scan of the same source staged. With `raw=False`
+    (a retransform, built from the landing table itself, or a window run) `etl_raw_move`
+    is left as is.
+    The connection must be in autocommit mode; `publish()` opens its own transaction.
+    """
+
+    def __init__(self, conn, etl_key: str, etl_type: str, category: str, created_by: int,
+                 now_iso: str, batch_size: int = BATCH_SIZE, mode: str = LOAD_MODE,
+                 metrics: RunMetrics | None = None, company_id: int | None = None, raw: bool = True,
+                 scope: str | None = None):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.etl_key = etl_key
+        self.etl_type = etl_type
+        self.category = category
+        self.created_by = created_by
+        self.now_iso = now_iso
+        self.batch_size = batch_size
+        self.mode = mode
+        self.metrics = metrics
+        self.company_id = company_id
+        self.raw = raw
+        self.scope = scope
+        self.scope_ids: set[int] | None = None
+        self._movements: list[tuple] = []
+        self._exceptions: list[tuple] = []
+        self._raw: list[tuple] = []
+        self._companies: set[int] | None = None
+        self._pending_companies: dict[int, str] = {}
+        self.movements_written = 0
+        self.exceptions_written = 0
+        self.raw_written = 0
+        self.bytes_staged = 0
+        self.stats = {"inserted": 0, "updated": 0, "deleted": 0}
+        # Wall seconds spent COPY-ing into staging and publishing
+        self.timings = {"stage": 0.0, "publish": 0.0}
+
+    @property
+    def _stage_key(self) -> str:
+        key = self.etl_key if self.company_id is None else f"{self.etl_key}_c{self.company_id}"
+        return key if self.scope is None else f"{key}_w{self.scope}"
+
+    @property
+    def _movement_table(self) -> str:
+        return f"etl_stage_movement_{self._stage_key}"
+
+    @property
+    def _exception_table(self) -> str:
+        return f"etl_stage_exception_{self._stage_key}"
+
+    @property
+    def _raw_table(self) -> str:
+        return f"etl_stage_raw_{self._stage_key}"
+
+    @staticmethod
+    def _batch_table(stage_table: str) -> str:
+        return stage_table.replace("etl_stage_", "etl_batch_", 1)
+
+    @property
+    def _lock_key(self) -> str:
+        return f"etl_stage:{self._stage_key}"
+
+    def _scope_sql(self, alias: str) -> tuple[str, tuple]:
+        where, params = f"{alias}.type = %s", (self.etl_type,)
+        if self.company_id is not None:
+            where, params = f"{where} AND {alias}.company_id = %s", params + (self.company_id,)
+        if self.scope_ids is None:
+            return where, params
+        return f"{where} AND {alias}.odoo_id = ANY(%s)", params + (sorted(self.scope_ids),)
+
+    # --- Lifecycle ---
+
+    def begin(self, resume_ranges: list[list] | None = None) -> None:
+        """Lock and prepare the staging tables, emptied unless resuming.
+
+        `resume_ranges` (the `[after, upto]` Odoo id ranges an interrupted scan still
+        has to read) keeps the rows that scan staged, except those in these ranges:
+        they are staged again when the scan re-reads them.
+        """
+        # Two runs of the same source would clobber each other's staging tables
+        self.cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (self._lock_key,))
+        if not self.cur.fetchone()[0]:
+            raise RuntimeError(f"Another run of {self.etl_type} is already loading")
+        self._create_stage(self._movement_table, MOVEMENT_COLUMNS, "movement", MOVEMENT_KEY)
+        self._create_stage(self._exception_table, EXCEPTION_COLUMNS, '"Exception"', EXCEPTION_KEY)
+        self._create_stage(self._raw_table, RAW_COLUMNS, "etl_raw_move")
+        if resume_ranges is None:
+            self.reset()
+        else:
+            self._restore(resume_ranges)
+
+    def _create_stage(self, table: str, columns: tuple[str, ...], source: str,
+                      key: tuple[str, ...] | None = None) -> None:
+        """Create `table` with `columns` typed as in `source`, recreated if those changed.
+
+        With `key`, the table has it as primary key and rows are staged through a
+        session TEMP batch table (see `flush`): the first occurrence of a key wins.
+        """
+        self.cur.execute(
+            "SELECT array_agg(column_name::text ORDER BY ordinal_position),"
+            " bool_or(EXISTS (SELECT 1 FROM pg_index i WHERE i.indrelid = to_regclass(%s) AND i.indisprimary))"
+            " FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = %s",
+            (table, table),
+        )
+        existing, has_key = self.cur.fetchone()
+        if existing is not None and (tuple(existing) != columns or bool(has_key) != (key is not None)):
+            # Left by a version with other columns: its rows cannot be resumed anyway
+            self.cur.execute(f"DROP TABLE {table}")
+            existing = None
+        if existing is None:
+            self.cur.execute(f"CREATE UNLOGGED TABLE {table} AS SELECT {', '.join(columns)} FROM {source} WITH NO DATA")
+            if key is not None:
+                self.cur.execute(f"ALTER TABLE {table} ADD PRIMARY KEY ({', '.join(key)})")
+        if key is not None:
+            batch = self._batch_table(table)
+            self.cur.execute(f"DROP TABLE IF EXISTS pg_temp.{batch}")
+            self.cur.execute(f"CREATE TEMP TABLE {batch} (LIKE {table})")
+
+    def reset(self) -> None:
+        """Drop everything staged so far (e.g. a resumed scan whose rows were lost)."""
+        self.cur.execute(f"TRUNCATE {self._movement_table}, {self._exception_table}, {self._raw_table}")
+        self.movements_written = self.exceptions_written = self.raw_written = 0
+
+    def _restore(self, ranges: list[list]) -> None:
+        for after, upto in ranges:
+            for table in (self._movement_table, self._exception_table, self._raw_table):
+                if upto is None:
+                    self.cur.execute(f"DELETE FROM {table} WHERE odoo_id > %s", (after,))
+                else:
+                    self.cur.execute(f"DELETE FROM {table} WHERE odoo_id > %s AND odoo_id <= %s", (after, upto))
+        self.cur.execute(f"SELECT count(*) FROM {self._movement_table}")
+        self.movements_written = self.cur.fetchone()[0]
+        self.cur.execute(f"SELECT count(*) FROM {self._exception_table}")
+        self.exceptions_written = self.cur.fetchone()[0]
+        self.cur.execute(f"SELECT count(*) FROM {self._raw_table}")
+        self.raw_written = self.cur.fetchone()[0]
+
+    @property
+    def staged_rows(self) -> int:
+        """Movement and exception rows in the staging tables (buffered rows excluded;
+        the raw records are counted apart, in `raw_written`)."""
+        return self.movements_written + self.exceptions_written
+
+    def publish(self, scope_ids: set[int] | None = None, on_publish=None) -> dict:
+        """Apply the staged rows to `scope_ids` in one short transaction.
+
+        `on_publish(cur)` runs inside the same transaction (e.g. to advance the sync
+        watermark), so the data and its bookkeeping commit or roll back together.
+        """
+        self.scope_ids = scope_ids
+        self.flush()
+        started = time.perf_counter()
+        # Staging tables are refilled every run; fresh statistics keep the merge plans sane
+        self.cur.execute(f"ANALYZE {self._movement_table}, {self._exception_table}, {self._raw_table}")
+        self.conn.autocommit = False
+        try:
+            self._flush_companies()
+            if self.mode == "merge":
+                self._merge_movements()
+                self._merge_exceptions()
+            else:
+                self._replace()
+            if self.raw:
+                self._publish_raw()
+            if on_publish is not None:
+                on_publish(self.cur)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        else:
+            if self.scope is not None:
+                # A window's tables are not reused by later runs: drop them rather than pile them up
+                tables = (self._movement_table, self._exception_table, self._raw_table)
+                batches = (f"pg_temp.{self._batch_table(table)}" for table in tables[:2])
+                self.cur.execute(f"DROP TABLE {', '.join(tables)}, {', '.join(batches)}")
+                self.conn.commit()
+        finally:
+            self.conn.autocommit = True
+            self.cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (self._lock_key,))
+            self.timings["publish"] += time.perf_counter() - started
+        return self.stats
+
+    # --- Companies (FK target, same id as Odoo) ---
+
+    def ensure_company(self, company_id: int | None, company_name: str | None = None) -> None:
+        if company_id is None:
+            return
+        if self._companies is None:
+            self.cur.execute("SELECT company_id FROM company")
+            self._companies = {int(r[0]) for r in self.cur.fetchall()}
+        if company_id not in self._companies:
+            self._pending_companies[company_id] = company_name or f"Company {company_id}"
+            self._companies.add(company_id)
+
+    def _flush_companies(self) -> None:
+        if not self._pending_companies:
+            return
+        for company_id, name in self._pending_companies.items():
+            self.cur.execute(
+                'INSERT INTO company(company_id, name) VALUES (%s, %s) ON CONFLICT (company_id) DO NOTHING',
+                (company_id, name),
+            )
+        self._pending_companies.clear()
+
+    # --- Rows ---
+
+    def add_movement(self, company_id: int, amount: float, sign: str, movement_date: str,
+                     reference_type: str, reference: str, reference_status: str, odoo_link: str,
+                     odoo_id: int, installment: int = 1, exchange_rate: float | None = None,
+                     currency: str | None = None, amount_currency: float | None = None) -> None:
+        """Stage a movement of Odoo record `odoo_id` (its `installment`-th open installment)."""
+        self._movements.append((
+            company_id, None, self.category, self.etl_type, amount, sign, movement_date,
+            reference_type, reference, reference_status, "Odoo", "", "Actif",
+            self.now_iso, self.created_by, odoo_link, self.now_iso, self.created_by, 1,
+            exchange_rate, currency, amount_currency, odoo_id, installment,
+        ))
+        if len(self._movements) >= self.batch_size:
+            self.flush()
+
+    def add_exception(self, company_id: int, description: str, amount: float, sign: str,
+                      reference_type: str, reference: str, reference_status: str,
+                      odoo_link: str, odoo_id: int) -> None:
+        self._exceptions.append((
+            company_id, self.category, self.etl_type, "Auto", "Warning", description, amount,
+            sign, reference_type, reference, reference_status, odoo_link, "Actif", self.now_iso, odoo_id,
+        ))
+        if len(self._exceptions) >= self.batch_size:
+            self.flush()
+
+    def add_raw(self, record: dict) -> None:
+        """Keep the Odoo record this source read, for the landing table."""
+        if not self.raw:
+            return
+        company = record.get("company_id")
+        self._raw.append((
+            company[0] if company else None, record["id"], record.get("write_date") or None,
+            json.dumps(record, separators=(",", ":"), ensure_ascii=False),
+        ))
+        if len(self._raw) >= self.batch_size:
+            self.flush()
+
+    def _stage_keyed(self, table: str, columns: tuple[str, ...], rows: list[tuple]) -> int:
+        """COPY `rows` into `table` through its batch table, keeping the first row of each key.
+
+        Returns the number of rows actually staged.
+        """
+        batch = self._batch_table(table)
+        self.bytes_staged += _copy_rows(self.cur, batch, columns, rows)
+        cols = ", ".join(columns)
+        self.cur.execute(f"INSERT INTO {table} ({cols}) SELECT {cols} FROM {batch} ON CONFLICT DO NOTHING")
+        staged = self.cur.rowcount
+        self.cur.execute(f"TRUNCATE {batch}")
+        return staged
+
+    def flush(self) -> None:
+        """COPY buffered rows into the staging tables (one "stage_batch" step in `metrics`)."""
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        rows, staged = len(self._movements) + len(self._exceptions) + len(self._raw), self.bytes_staged
+        if self._movements:
+            self.movements_written += self._stage_keyed(self._movement_table, MOVEMENT_COLUMNS, self._movements)
+            self._movements.clear()
+        if self._exceptions:
+            self.exceptions_written += self._stage_keyed(self._exception_table, EXCEPTION_COLUMNS, self._exceptions)
+            self._exceptions.clear()
+        if self._raw:
+            self.bytes_staged += _copy_rows(self.cur, self._raw_table, RAW_COLUMNS, self._raw)
+            self.raw_written += len(self._raw)
+            self._raw.clear()
+        elapsed = time.perf_counter() - started
+        self.timings["stage"] += elapsed
+        if self.metrics is not None and rows:
+            self.metrics.add(
+                "stage_batch", elapsed, time.thread_time() - cpu_started,
+                rows=rows, bytes=self.bytes_staged - staged,
+            )
+
+    # --- Publish (set-based, from the staging tables) ---
+
+    def _replace(self) -> None:
+        cur = self.cur
+        if self.scope_ids is None or self.scope_ids:
+            where, params = self._scope_sql("m")
+            cur.execute(f"DELETE FROM movement m WHERE {where}", params)
+            self.stats["deleted"] += cur.rowcount
+            where, params = self._scope_sql("e")
+            cur.execute(f'DELETE FROM "Exception" e WHERE {where}', params)
+            self.stats["deleted"] += cur.rowcount
+        cols = ", ".join(MOVEMENT_COLUMNS)
+        cur.execute(f"INSERT INTO movement ({cols}) SELECT {cols} FROM {self._movement_table}")
+        self.stats["inserted"] += cur.rowcount
+        cols = ", ".join(EXCEPTION_COLUMNS)
+        cur.execute(f'INSERT INTO "Exception" ({cols}) SELECT {cols} FROM {self._exception_table}')
+        self.stats["inserted"] += cur.rowcount
+
+    def _publish_raw(self) -> None:
+        """Mirror the staged Odoo records into `etl_raw_move`, within the publish scope."""
+        cur = self.cur
+        where, params = "r.etl_type = %s", (self.etl_type,)
+        if self.company_id is not None:
+            where, params = f"{where} AND r.company_id = %s", params + (self.company_id,)
+        if self.scope_ids is not None:
+            where, params = f"{where} AND r.odoo_id = ANY(%s)", params + (sorted(self.scope_ids),)
+        cur.execute(f"DELETE FROM etl_raw_move r WHERE {where}", params)
+        cols = ", ".join(RAW_COLUMNS)
+        cur.execute(
+            f"INSERT INTO etl_raw_move AS r (etl_type, {cols}) SELECT %s, {cols} FROM {self._raw_table}"
+            f" ON CONFLICT (etl_type, odoo_id) DO UPDATE SET"
+            f" {', '.join(f'{c} = EXCLUDED.{c}' for c in RAW_COLUMNS[:1] + RAW_COLUMNS[2:])}, fetched_at = now()",
+            (self.etl_type,),
+        )
+
+    def _merge_movements(self) -> None:
+        cur = self.cur
+        # Vanished rows go first: the live table's statistics still describe it before
+        # the inserts, which keeps the anti-join a hash join on a first (empty) load
+        where, params = self._scope_sql("m")
+        cur.execute(
+            f"DELETE FROM movement m WHERE {where} AND NOT EXISTS ("
+            f"SELECT 1 FROM {self._movement_table} s WHERE {_key_match('s', 'm', MOVEMENT_KEY)})",
+            params,
+        )
+        self.stats["deleted"] += cur.rowcount
+        cols = ", ".join(MOVEMENT_COLUMNS)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in MOVEMENT_PAYLOAD + ("updated_at", "updated_by"))
+        cur.execute(
+            f"WITH upserted AS ("
+            f" INSERT INTO movement AS m ({cols}) SELECT {cols} FROM {self._movement_table}"
+            f" ON CONFLICT ({', '.join(MOVEMENT_KEY)}) WHERE odoo_id IS NOT NULL DO UPDATE SET {updates}"
+            f" WHERE m.source = 'Odoo'"
+            f" AND {_tuple('m', MOVEMENT_PAYLOAD)} IS DISTINCT FROM {_tuple('EXCLUDED', MOVEMENT_PAYLOAD)}"
+            f" RETURNING (xmax = 0) AS inserted"
+            f") SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted"
+        )
+        inserted, updated = cur.fetchone()
+        self.stats["inserted"] += inserted
+        self.stats["updated"] += updated
+
+    def _merge_exceptions(self) -> None:
+        cur = self.cur
+        where, params = self._scope_sql("e")
+        cur.execute(
+            f'DELETE FROM "Exception" e WHERE {where} AND NOT EXISTS ('
+            f"SELECT 1 FROM {self._exception_table} s WHERE {_key_match('s', 'e', EXCEPTION_KEY)})",
+            params,
+        )
+        self.stats["deleted"] += cur.rowcount
+        cols = ", ".join(EXCEPTION_COLUMNS)
+        sets = ", ".join(f"{c} = s.{c}" for c in EXCEPTION_PAYLOAD)
+        cur.execute(
+            f'UPDATE "Exception" e SET {sets} FROM {self._exception_table} s'
+            f" WHERE {_key_match('e', 's', EXCEPTION_KEY)}"
+            f" AND {_tuple('e', EXCEPTION_PAYLOAD)} IS DISTINCT FROM {_tuple('s', EXCEPTION_PAYLOAD)}"
+        )
+        self.stats["updated"] += cur.rowcount
+        cur.execute(
+            f'INSERT INTO "Exception" ({cols}) SELECT {cols} FROM {self._exception_table} s'
+            f' WHERE NOT EXISTS (SELECT 1 FROM "Exception" e WHERE {_key_match("e", "s", EXCEPTION_KEY)})'
+        )
+        self.stats["inserted"] += cur.rowcount
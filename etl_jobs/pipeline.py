@@ -0,0 +1,73 @@
+# file: etl_jobs/pipeline.py
+"""
+Streaming stages for the ETL jobs: page fetch -> transform -> batched write.
+
+Pages are pulled from Odoo by a background thread into a bounded queue while the
+job transforms the previous page and the loader COPYs its batches, so fetching
+overlaps with writing and at most ETL_PIPELINE_DEPTH pages are held in memory,
+whatever the number of invoices.
+"""
+import os
+import queue
+import threading
+from typing import Iterable, Iterator, TypeVar
+
+PIPELINE_DEPTH = int(os.getenv("ETL_PIPELINE_DEPTH", "4"))
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def prefetch(items: Iterable[T], depth: int = PIPELINE_DEPTH) -> Iterator[T]:
+    """Consume `items` in a background thread, `depth` items ahead of the caller.
+
+    Errors raised by the producer are re-raised in the caller; if the caller stops
+    early, the producer is told to stop at its next item.
+    """
+    buffer: queue.Queue = queue.Queue(maxsize=max(depth, 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce() -> None:
+        try:
+            for item in items:
+                if not put(item):
+                    return
+        except BaseException as exc:  # surfaced in the consumer
+            put(_Failure(exc))
+        else:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="etl-prefetch", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        producer.join()
+
+
+def stream_records(pages: Iterable[list[dict]], depth: int = PIPELINE_DEPTH) -> Iterator[dict]:
+    """Flatten prefetched pages into a record stream."""
+    for page in prefetch(pages, depth):
+        yield from page
@@ -0,0 +1,102 @@
+# file: etl_jobs/raw_snapshot.py
+"""
+Offline copies of the raw landing zone (`etl_raw_move`, see loader.py).
+
+`export` writes the landed Odoo records to a gzip-compressed JSON-lines file
+(one line per source and record, in id order), e.g. after each refresh;
+`diff` compares two such files without a database or Odoo: records added,
+removed and changed per ETL type, and which fields changed.
+
+Usage: python etl_jobs/raw_snapshot.py export FILE.jsonl.gz [--type "Ventes locales"] [--company 1]
+       python etl_jobs/raw_snapshot.py diff OLD.jsonl.gz NEW.jsonl.gz [--show 10]
+"""
+import argparse
+import gzip
+import json
+from collections import Counter, defaultdict
+
+from dotenv import load_dotenv
+
+BATCH_SIZE = 5000
+
+
+def export(path: str, etl_type: str | None = None, company_id: int | None = None) -> int:
+    from treasury_etl import connect
+
+    conn = connect()
+    written, last = 0, ("", 0)
+    try:
+        with conn.cursor() as cur, gzip.open(path, "wt", encoding="utf-8") as out:
+            while True:
+                cur.execute(
+                    "SELECT etl_type, company_id, odoo_id, payload FROM etl_raw_move"
+                    " WHERE (etl_type, odoo_id) > (%s, %s)"
+                    " AND (%s::text IS NULL OR etl_type = %s) AND (%s::int IS NULL OR company_id = %s)"
+                    " ORDER BY etl_type, odoo_id LIMIT %s",
+                    (*last, etl_type, etl_type, company_id, company_id, BATCH_SIZE),
+                )
+                rows = cur.fetchall()
+                for row_type, row_company, odoo_id, payload in rows:
+                    record = {"etl_type": row_type, "company_id": row_company, "odoo_id": odoo_id, "payload": payload}
+                    out.write(json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n")
+                written += len(rows)
+                if len(rows) < BATCH_SIZE:
+                    return written
+                last = (rows[-1][0], rows[-1][2])
+    finally:
+        conn.close()
+
+
+def load(path: str) -> dict[str, dict[int, dict]]:
+    """{etl_type: {odoo_id: payload}} of an export."""
+    records: dict[str, dict[int, dict]] = defaultdict(dict)
+    with gzip.open(path, "rt", encoding="utf-8") as lines:
+        for line in lines:
+            record = json.loads(line)
+            records[record["etl_type"]][record["odoo_id"]] = record["payload"]
+    return records
+
+
+def diff(old_path: str, new_path: str, show: int = 10) -> None:
+    old, new = load(old_path), load(new_path)
+    for etl_type in sorted(set(old) | set(new)):
+        before, after = old.get(etl_type, {}), new.get(etl_type, {})
+        added = sorted(after.keys() - before.keys())
+        removed = sorted(before.keys() - after.keys())
+        changed = sorted(i for i in before.keys() & after.keys() if before[i] != after[i])
+        fields = Counter(
+            field for i in changed for field in before[i].keys() | after[i].keys()
+            if before[i].get(field) != after[i].get(field)
+        )
+        print(f"{etl_type}: {len(added)} added, {len(removed)} removed, {len(changed)} changed "
+              f"({len(before)} -> {len(after)} records)")
+        for label, ids in (("added", added), ("removed", removed), ("changed", changed)):
+            if ids:
+                more = f" (+{len(ids) - show})" if len(ids) > show else ""
+                print(f"  {label}: {', '.join(map(str, ids[:show]))}{more}")
+        if fields:
+            print("  fields: " + ", ".join(f"{field} {count}" for field, count in fields.most_common()))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export or diff snapshots of the raw Odoo landing zone")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export")
+    export_parser.add_argument("path")
+    export_parser.add_argument("--type", dest="etl_type")
+    export_parser.add_argument("--company", type=int)
+    diff_parser = commands.add_parser("diff")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--show", type=int, default=10, help="ids listed per category")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        load_dotenv()
+        print(f"{export(args.path, args.etl_type, args.company)} records written to {args.path}")
+    else:
+        diff(args.old, args.new, args.show)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# file: etl_jobs/reconcile.py
+"""
+Reconciliation of the published rows of each source against Odoo, without
+fetching records.
+
+The local side is what the refresh published: per company and reference type
+(Facture / Avoir), the invoices with rows in `movement` and the sum of their
+amounts, and the same for "Exception". The Odoo side is one `read_group` on
+`account.move` per kind of row, over the source's domain and grouped by company
+and move type: the invoices the source booked as exceptions (their Odoo ids, from
+"Exception") and all the others, which should be movements. Each side sums the
+Odoo amount the rows book (`Source.booked`, the residual unless the source books
+totals; exceptions book totals). Groups whose invoice count or amount differ are
+discrepancies: invoices missing locally or left behind after leaving the domain,
+amounts that changed in Odoo without the refresh seeing them, and rows the
+transform or the merge got wrong.
+
+Converted amounts are compared in the invoice currency (`movement.amount_currency`);
+exceptions of a source with `uses_rates` only store the converted total, so only
+their count is compared. Changes made in Odoo while the refresh ran also show
+up, until the next one.
+"""
+import os
+from datetime import date
+
+from odoo_client import OdooClient
+
+MODEL = "account.move"
+GROUPBY = ["company_id", "move_type"]
+# Set to false to skip the check after each refresh
+RECONCILE = os.getenv("ETL_RECONCILE", "true").lower() != "false"
+# Amount difference tolerated per group (float sums on either side)
+TOLERANCE = 0.01
+# Discrepancies listed per source (all are counted)
+MAX_DISCREPANCIES = 50
+
+Totals = dict[tuple, tuple[int, float | None]]
+
+
+def reference_type(move_type: str | None) -> str:
+    """`reference_type` the sources give the rows of an Odoo move type."""
+    return "Facture" if move_type in ("out_invoice", "in_invoice") else "Avoir"
+
+
+def odoo_totals(odoo: OdooClient, domain: list, measure: str | None) -> Totals:
+    """{(company_id, reference_type): (invoices, sum of `measure`)} in Odoo (None: not summed)."""
+    totals: Totals = {}
+    aggregates = [f"{measure}:sum"] if measure else ["amount_total:sum"]
+    for group in odoo.read_group(MODEL, domain, aggregates, GROUPBY):
+        company = group.get("company_id")
+        key = (company[0] if company else None, reference_type(group.get("move_type")))
+        count, amount = totals.get(key, (0, 0.0))
+        count += int(group.get("__count", 0))
+        totals[key] = (count, amount + abs(float(group.get(measure) or 0.0)) if measure else None)
+    return totals
+
+
+def local_totals(cur, table: str, amount: str | None, etl_type: str, company_ids: list[int]) -> Totals:
+    """The same totals over the rows of `table` published for the source."""
+    cur.execute(
+        f"""
+        SELECT company_id, reference_type, count(DISTINCT odoo_id), coalesce(sum({amount or "0"}), 0)
+        FROM {table}
+        WHERE type = %s AND company_id = ANY(%s) AND odoo_id IS NOT NULL
+        GROUP BY 1, 2
+        """,
+        (etl_type, list(company_ids)),
+    )
+    return {(company_id, ref_type): (int(count), float(total) if amount else None)
+            for company_id, ref_type, count, total in cur.fetchall()}
+
+
+def exception_ids(cur, etl_type: str, company_ids: list[int]) -> list[int]:
+    """Odoo ids of the invoices the source published as exceptions."""
+    cur.execute(
+        'SELECT DISTINCT odoo_id FROM "Exception" WHERE type = %s AND company_id = ANY(%s)'
+        " AND odoo_id IS NOT NULL ORDER BY odoo_id",
+        (etl_type, list(company_ids)),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def _sum(totals: Totals) -> dict:
+    return {
+        "count": sum(count for count, _ in totals.values()),
+        "amount": round(sum(amount or 0.0 for _, amount in totals.values()), 2),
+    }
+
+
+def compare(odoo: dict[str, Totals], local: dict[str, Totals]) -> dict:
+    """Totals on both sides, per kind of row, and the groups whose count or amount differ."""
+    discrepancies = []
+    keys = set()
+    for kind in ("movement", "exception"):
+        groups = odoo[kind].keys() | local[kind].keys()
+        keys |= groups
+        for key in sorted(groups, key=lambda k: tuple("" if v is None else str(v) for v in k)):
+            odoo_count, odoo_amount = odoo[kind].get(key, (0, 0.0))
+            local_count, local_amount = local[kind].get(key, (0, 0.0))
+            if odoo_count != local_count or (
+                odoo_amount is not None and local_amount is not None and abs(odoo_amount - local_amount) > TOLERANCE
+            ):
+                company_id, ref_type = key
+                discrepancies.append({
+                    "company_id": company_id, "reference_type": ref_type, "kind": kind,
+                    "odoo_count": odoo_count, "local_count": local_count,
+                    "odoo_amount": None if odoo_amount is None else round(odoo_amount, 2),
+                    "local_amount": None if local_amount is None else round(local_amount, 2),
+                })
+    return {
+        "groups": len(keys),
+        "odoo": {kind: _sum(totals) for kind, totals in odoo.items()},
+        "local": {kind: _sum(totals) for kind, totals in local.items()},
+        "discrepancy_count": len(discrepancies),
+        "discrepancies": discrepancies[:MAX_DISCREPANCIES],
+    }
+
+
+def reconcile_source(odoo: OdooClient, cur, source, company_ids: list[int], today: date,
+                     booked: str = "amount_residual") -> dict:
+    """Compare the rows one source (a treasury_etl.Source) published for `company_ids` with Odoo.
+
+    `booked` is the Odoo amount its movements add up to. One RPC, two when the
+    source published exceptions.
+    """
+    domain = list(source.build_domain(today)) + [("company_id", "in", list(company_ids))]
+    excepted = exception_ids(cur, source.etl_type, company_ids)
+    exception_amount = None if source.uses_rates else "amount_total"
+    remote = {
+        "movement": odoo_totals(odoo, domain + [("id", "not in", excepted)] if excepted else domain, booked),
+        "exception": odoo_totals(odoo, domain + [("id", "in", excepted)], exception_amount) if excepted else {},
+    }
+    local = {
+        "movement": local_totals(cur, "movement", "coalesce(amount_currency, amount)", source.etl_type, company_ids),
+        "exception": local_totals(cur, '"Exception"', exception_amount and "amount", source.etl_type, company_ids),
+    }
+    return compare(remote, local)
@@ -0,0 +1,243 @@
+# file: etl_jobs/sync_state.py
+"""
+Incremental sync support for the ETL jobs.
+
+Each source keeps a high-water mark (`write_date`, id) in `etl_sync_state`, one
+per company shard (see `state_key`). A run is planned as:
+
+- "skip":        nothing changed upstream (two `search_count` probes);
+- "incremental": only `account.move` records written since the mark are fetched,
+                 and local rows whose Odoo id left the source domain
+                 (paid, cancelled, deleted...) are removed;
+- "full":        every record of the domain is fetched and the whole source is
+                 reconciled (see loader.py), used on first run, when forced with
+                 ETL_SYNC_MODE=full, and as a periodic safety net.
+
+A run can also be scoped to a window (extra domain terms, e.g. an invoice date
+range picked by an admin, see `plan_window`): it fetches every record of the
+source in the window and leaves the watermark as it is.
+
+Exceptions depend on today's date ("Échéance passée"), so a full resync is also
+forced on the first run of each day.
+
+While a scan runs, its keyset position and the watermarks seen so far are
+checkpointed in `etl_scan_cursor` (one row per job, see treasury_etl), so a run
+that times out or crashes before publishing resumes where it stopped.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, Iterator
+
+SYNC_MODE = os.getenv("ETL_SYNC_MODE", "incremental")  # incremental | full
+FULL_RESYNC_HOURS = int(os.getenv("ETL_FULL_RESYNC_HOURS", "24"))
+
+
+def state_key(etl_type: str, company_id: int | None = None) -> str:
+    """`etl_sync_state.source` of an ETL type, or of one company shard of it."""
+    return etl_type if company_id is None else f"{etl_type} / company {company_id}"
+
+
+def state_company(source: str) -> int | None:
+    """Company of an `etl_sync_state.source` (None for an unsharded one)."""
+    _, shard, company_id = source.rpartition(" / company ")
+    return int(company_id) if shard else None
+
+
+@dataclass
+class SyncState:
+    source: str
+    last_write_date: str | None = None
+    last_id: int = 0
+    record_count: int = 0
+    last_full_sync_at: datetime | None = None
+
+
+@dataclass
+class SyncPlan:
+    mode: str  # full | incremental | skip | window
+    fetch_domain: list
+    record_count: int = 0
+    stale_ids: set[int] = field(default_factory=set)
+    reason: str = ""
+    # Records the fetch should return, for progress reporting (None: unknown)
+    expected: int | None = None
+
+    def progress(self) -> "SyncProgress":
+        """What a run of this plan tracks: the Odoo ids seen only if it publishes just those."""
+        return SyncProgress(ids=None if self.mode in ("full", "retransform") else set())
+
+
+@dataclass
+class SyncProgress:
+    """Watermark seen so far while records stream through a run, and the Odoo ids
+    seen when the run publishes only those (`ids` is None otherwise, so a full
+    scan keeps no per-record state)."""
+    last_write_date: str = ""
+    last_id: int = 0
+    count: int = 0
+    ids: set[int] | None = None
+
+    def observe(self, record: dict) -> None:
+        key = (record.get("write_date") or "", record.get("id") or 0)
+        if key > (self.last_write_date, self.last_id):
+            self.last_write_date, self.last_id = key
+        self.count += 1
+        if self.ids is not None and record.get("id"):
+            self.ids.add(record["id"])
+
+    def track(self, records: Iterable[dict]) -> Iterator[dict]:
+        for record in records:
+            self.observe(record)
+            yield record
+
+    def snapshot(self) -> dict:
+        """JSON-ready copy for a checkpoint."""
+        return {
+            "last_write_date": self.last_write_date, "last_id": self.last_id, "count": self.count,
+            "ids": None if self.ids is None else sorted(self.ids),
+        }
+
+    @classmethod
+    def from_snapshot(cls, data: dict) -> "SyncProgress":
+        ids = data["ids"]
+        return cls(data["last_write_date"], data["last_id"], data["count"], None if ids is None else set(ids))
+
+
+def load_state(cur, source: str) -> SyncState | None:
+    cur.execute(
+        'SELECT last_write_date, last_id, record_count, last_full_sync_at FROM etl_sync_state WHERE source = %s',
+        (source,),
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    last_write_date = row[0].strftime("%Y-%m-%d %H:%M:%S") if row[0] else None
+    return SyncState(source, last_write_date, int(row[1] or 0), int(row[2] or 0), row[3])
+
+
+def changed_since_domain(state: SyncState) -> list:
+    """Records strictly after the (write_date, id) mark."""
+    return [
+        "|",
+        ("write_date", ">", state.last_write_date),
+        "&",
+        ("write_date", "=", state.last_write_date),
+        ("id", ">", state.last_id),
+    ]
+
+
+def local_odoo_ids(cur, etl_type: str, company_id: int | None = None) -> set[int]:
+    """Odoo ids with local rows or landed records (loader.py) for this ETL type."""
+    ids: set[int] = set()
+    company_sql, params = ("", (etl_type,)) if company_id is None else (" AND company_id = %s", (etl_type, company_id))
+    for table in ("movement", '"Exception"'):
+        cur.execute(f"SELECT DISTINCT odoo_id FROM {table} WHERE type = %s{company_sql} AND odoo_id IS NOT NULL", params)
+        ids.update(int(r[0]) for r in cur.fetchall())
+    cur.execute(f"SELECT odoo_id FROM etl_raw_move WHERE etl_type = %s{company_sql}", params)
+    ids.update(int(r[0]) for r in cur.fetchall())
+    return ids
+
+
+def needs_full_resync(state: SyncState | None, today: date) -> str:
+    """Why a full copy is due ("" if an incremental one is enough)."""
+    if SYNC_MODE == "full":
+        return "ETL_SYNC_MODE=full"
+    if state is None or not state.last_write_date or state.last_full_sync_at is None:
+        return "no watermark yet"
+    last_full = state.last_full_sync_at
+    if last_full.tzinfo is None:
+        last_full = last_full.replace(tzinfo=timezone.utc)
+    if last_full.date() < today:
+        return "first run of the day"
+    if datetime.now(timezone.utc) - last_full > timedelta(hours=FULL_RESYNC_HOURS):
+        return f"last full resync older than {FULL_RESYNC_HOURS}h"
+    return ""
+
+
+def plan_sync(odoo, cur, etl_type: str, domain: list, today: date, company_id: int | None = None) -> SyncPlan:
+    state = load_state(cur, state_key(etl_type, company_id))
+    reason = needs_full_resync(state, today)
+    if reason:
+        # The previous run's count is a close enough estimate of a full scan
+        return SyncPlan("full", list(domain), reason=reason, expected=state.record_count if state else None)
+
+    model = "account.move"
+    changed_domain = list(domain) + changed_since_domain(state)
+    changed_count = odoo.search_count(model, changed_domain)
+    live_count = odoo.search_count(model, domain)
+    if changed_count == 0 and live_count == state.record_count:
+        return SyncPlan("skip", [], record_count=live_count, reason="no upstream change", expected=0)
+
+    # Rows that left the domain: only ids are transferred, not payloads
+    live_ids = set(odoo.execute(model, "search", [domain]))
+    stale_ids = local_odoo_ids(cur, etl_type, company_id) - live_ids
+    return SyncPlan(
+        "incremental", changed_domain, record_count=len(live_ids), stale_ids=stale_ids,
+        reason=f"{changed_count} changed, {len(stale_ids)} removed upstream", expected=changed_count,
+    )
+
+
+def plan_window(odoo, cur, etl_type: str, domain: list, window: list, company_id: int | None = None) -> SyncPlan:
+    """Fetch every record of `domain` within `window`; remove the local rows of the
+    window's invoices that left the source. Invoices deleted from Odoo are left to
+    the next full resync."""
+    model = "account.move"
+    fetch_domain = list(domain) + list(window)
+    live_ids = set(odoo.execute(model, "search", [fetch_domain]))
+    company_domain = [] if company_id is None else [("company_id", "=", company_id)]
+    in_window = set(odoo.execute(model, "search", [company_domain + list(window)]))
+    stale_ids = (local_odoo_ids(cur, etl_type, company_id) & in_window) - live_ids
+    return SyncPlan(
+        "window", fetch_domain, record_count=len(live_ids), stale_ids=stale_ids,
+        reason=f"{len(live_ids)} in window, {len(stale_ids)} left the source", expected=len(live_ids),
+    )
+
+
+def save_state(cur, etl_type: str, plan: SyncPlan, seen: SyncProgress, company_id: int | None = None) -> None:
+    """Advance the watermark to the newest (write_date, id) seen in this run (not for a window)."""
+    if plan.mode == "window":
+        return
+    source = state_key(etl_type, company_id)
+    state = load_state(cur, source) or SyncState(source)
+    last_write_date, last_id = state.last_write_date, state.last_id
+    if plan.mode == "full":
+        last_write_date, last_id = None, 0
+    if (seen.last_write_date, seen.last_id) > (last_write_date or "", last_id):
+        last_write_date, last_id = seen.last_write_date, seen.last_id
+    record_count = plan.record_count if plan.mode != "full" else seen.count
+    cur.execute(
+        'INSERT INTO etl_sync_state(source, last_write_date, last_id, record_count, last_full_sync_at, last_sync_at) '
+        'VALUES (%s, %s, %s, %s, CASE WHEN %s THEN now() END, now()) '
+        'ON CONFLICT (source) DO UPDATE SET '
+        'last_write_date = EXCLUDED.last_write_date, last_id = EXCLUDED.last_id, '
+        'record_count = EXCLUDED.record_count, '
+        'last_full_sync_at = COALESCE(EXCLUDED.last_full_sync_at, etl_sync_state.last_full_sync_at), '
+        'last_sync_at = EXCLUDED.last_sync_at',
+        (source, last_write_date or None, last_id, record_count, plan.mode == "full"),
+    )
+
+
+# --- Scan checkpoints ---
+
+def load_cursor(cur, job: str, fingerprint: str) -> dict | None:
+    """Checkpoint of an interrupted scan of `job`, if it was planned the same way (`fingerprint`)."""
+    cur.execute('SELECT fingerprint, position FROM etl_scan_cursor WHERE job = %s', (job,))
+    row = cur.fetchone()
+    if not row or row[0] != fingerprint:
+        return None
+    return row[1]
+
+
+def save_cursor(cur, job: str, fingerprint: str, position: dict) -> None:
+    cur.execute(
+        'INSERT INTO etl_scan_cursor(job, fingerprint, position, updated_at) VALUES (%s, %s, %s, now()) '
+        'ON CONFLICT (job) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, '
+        'position = EXCLUDED.position, updated_at = EXCLUDED.updated_at',
+        (job, fingerprint, json.dumps(position)),
+    )
+
+
+def clear_cursor(cur, job: str) -> None:
+    cur.execute('DELETE FROM etl_scan_cursor WHERE job = %s', (job,))
@@ -0,0 +1,43 @@
+# file: etl_jobs/tests/conftest.py
+"""
+Fixtures for the ETL tests: the local fake Odoo (fake_odoo.py) serving generated
+invoices, and clients for it.
+
+Run from the repository root: python -m pytest etl_jobs/tests
+"""
+import os
+import sys
+
+import pytest
+
+# The ETL modules import each other as top-level modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_odoo import FakeOdoo, InvoiceStore, serve  # noqa: E402
+from invoice_generator import generate_invoices  # noqa: E402
+from odoo_client import RPC_PROTOCOLS, OdooClient  # noqa: E402
+
+INVOICES = 1200
+
+
+@pytest.fixture(autouse=True)
+def session_cache(tmp_path, monkeypatch):
+    """Keep the authenticated uid cache out of the user's cache directory."""
+    monkeypatch.setenv("ODOO_SESSION_CACHE_DIR", str(tmp_path / "odoo_sessions"))
+
+
+@pytest.fixture
+def fake_odoo():
+    """A fake Odoo over INVOICES generated invoices (two companies), fresh for each test."""
+    fake = FakeOdoo(InvoiceStore(generate_invoices(INVOICES, seed=7, companies=2)))
+    server = serve(fake)
+    yield fake, f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=RPC_PROTOCOLS)
+def odoo(fake_odoo, request) -> OdooClient:
+    """Client of `fake_odoo`, over each transport."""
+    _, url = fake_odoo
+    return OdooClient(url, "test", "test", "test", request.param)
@@ -0,0 +1,110 @@
+# file: etl_jobs/tests/test_domain.py
+"""Odoo domain evaluation (domain.py) and the shared extraction's union and routing of source domains."""
+from datetime import date
+
+import pytest
+
+from account_move_upsert import SOURCES
+from domain import compile_domain, domain_fields, domain_or, matches, normalize
+
+MODEL = "account.move"
+
+INVOICE = {
+    "id": 7,
+    "move_type": "in_invoice",
+    "state": "posted",
+    "invoice_origin": "CE0042",
+    "ref": False,
+    "partner_id": [12, "Partner"],
+    "amount_total": 150.0,
+    "invoice_date": "2026-03-01",
+}
+
+
+@pytest.mark.parametrize("domain, expected", [
+    ([], True),
+    ([("state", "=", "posted")], True),
+    ([("state", "=", "draft")], False),
+    ([("state", "!=", "draft")], True),
+    ([("move_type", "in", ["in_invoice", "in_refund"])], True),
+    ([("move_type", "not in", ["in_invoice", "in_refund"])], False),
+    # Many2one values compare on their id
+    ([("partner_id", "=", 12)], True),
+    ([("partner_id", "in", [1, 2])], False),
+    # Unset values: "= False" matches them, negative operators too, ordering never
+    ([("ref", "=", False)], True),
+    ([("ref", "!=", False)], False),
+    ([("ref", "!=", "REF7")], True),
+    ([("ref", "not in", ["REF7"])], True),
+    ([("ref", "in", [False, "REF7"])], True),
+    ([("ref", ">", "A")], False),
+    ([("ref", "not ilike", "CE%")], True),
+    ([("ref", "ilike", "%")], False),
+    # like wraps the pattern in %...%, keeping its SQL wildcards
+    ([("invoice_origin", "ilike", "ce%")], True),
+    ([("invoice_origin", "like", "ce%")], False),
+    ([("invoice_origin", "like", "E00_2")], True),
+    ([("invoice_origin", "not ilike", "CE%")], False),
+    ([("amount_total", ">", 100)], True),
+    ([("amount_total", "<=", 100)], False),
+    ([("invoice_date", ">=", "2026-03-01"), ("invoice_date", "<", "2026-04-01")], True),
+])
+def test_leaf_operators(domain, expected):
+    assert matches(INVOICE, domain) is expected
+
+
+@pytest.mark.parametrize("domain, expected", [
+    # Implicit "&" between top-level terms
+    ([("state", "=", "posted"), ("ref", "!=", False)], False),
+    (["|", ("state", "=", "draft"), ("partner_id", "=", 12)], True),
+    (["|", ("state", "=", "draft"), ("partner_id", "=", 13)], False),
+    (["!", ("state", "=", "draft")], True),
+    (["&", "|", ("state", "=", "draft"), ("ref", "=", False), ("amount_total", ">", 100)], True),
+    ([("amount_total", ">", 100), "|", ("state", "=", "draft"), ("ref", "!=", False)], False),
+    (["|", "!", ("state", "=", "posted"), "&", ("ref", "=", False), ("partner_id", "=", 12)], True),
+])
+def test_operators_and_nesting(domain, expected):
+    assert compile_domain(domain)(INVOICE) is expected
+
+
+def test_unsupported_operator():
+    with pytest.raises(ValueError, match="Unsupported domain operator"):
+        compile_domain([("state", "=?", "posted")])
+
+
+def test_normalize_makes_the_implicit_and_explicit():
+    domain = [("a", "=", 1), "|", ("b", "=", 2), ("c", "=", 3), ("d", "=", 4)]
+    assert normalize(domain) == ["&", "&", ("a", "=", 1), "|", ("b", "=", 2), ("c", "=", 3), ("d", "=", 4)]
+    assert normalize([]) == []
+
+
+def test_domain_or():
+    first, second = [("state", "=", "draft")], [("ref", "=", False), ("amount_total", ">", 100)]
+    union = domain_or(first, second)
+    assert union == ["|", ("state", "=", "draft"), "&", ("ref", "=", False), ("amount_total", ">", 100)]
+    assert matches(INVOICE, union)
+    assert not matches(INVOICE, domain_or(first, [("ref", "!=", False)]))
+    # An empty domain matches everything, and so does the union
+    assert domain_or(first, []) == []
+
+
+def test_domain_fields():
+    assert domain_fields(["|", ("state", "=", "draft"), ("ref", "=", False)]) == {"state", "ref"}
+
+
+def test_shared_extraction_routes_each_source_its_own_invoices(fake_odoo, odoo):
+    """One fetch of the union of the source domains, routed per source, gives each
+    source exactly the invoices its own domain selects in Odoo."""
+    today = date.today()
+    domains = {key: source.build_domain(today) for key, source in SOURCES.items()}
+    fields = sorted({"write_date"} | set().union(*(domain_fields(d) for d in domains.values())))
+
+    fetched = odoo.search_read_all(MODEL, domain_or(*domains.values()), fields, order="id", workers=1)
+    routes = {key: compile_domain(domain) for key, domain in domains.items()}
+    routed = {key: [r["id"] for r in fetched if in_source(r)] for key, in_source in routes.items()}
+
+    for key, domain in domains.items():
+        assert routed[key] == odoo.execute(MODEL, "search", [domain], {"order": "id"}), key
+        assert routed[key], key
+    # Invoices outside every source are not fetched
+    assert len(fetched) == len({i for ids in routed.values() for i in ids})
@@ -0,0 +1,121 @@
+# file: etl_jobs/tests/test_keyset.py
+"""Keyset scans of account.move (odoo_client.KeysetCursor / search_read_keyset) compared with offset paging."""
+import pytest
+
+from odoo_client import KeysetCursor
+
+MODEL = "account.move"
+DOMAIN = [("state", "in", ["draft", "posted"])]
+FIELDS = ["id", "write_date", "company_id"]
+PAGE_SIZE = 100
+
+
+def keyset_ids(odoo, cursor: KeysetCursor, domain: list = DOMAIN) -> list[int]:
+    """Ids of a keyset scan, in the order they arrive; checks each range is read in ascending order."""
+    ids, last = [], {}
+    bounds = [upto for _, upto in cursor.ranges[:-1]]
+    for page in odoo.search_read_keyset(MODEL, domain, FIELDS, cursor, PAGE_SIZE):
+        for record in page:
+            index = sum(record["id"] > upto for upto in bounds)
+            assert record["id"] > last.get(index, 0)
+            last[index] = record["id"]
+            ids.append(record["id"])
+    return ids
+
+
+def offset_ids(odoo, domain: list = DOMAIN) -> list[int]:
+    return [r["id"] for page in odoo.search_read_pages(MODEL, domain, FIELDS, page_size=PAGE_SIZE, workers=1)
+            for r in page]
+
+
+def test_advance_moves_the_range_of_the_id():
+    cursor = KeysetCursor([[0, 100], [100, 200], [200, None]])
+    cursor.advance(40)
+    cursor.advance(100)
+    cursor.advance(150)
+    cursor.advance(5000)
+    assert cursor.ranges == [[100, 100], [150, 200], [5000, None]]
+
+
+def test_keyset_cursor_splits_the_id_span(odoo):
+    ids = odoo.execute(MODEL, "search", [DOMAIN], {"order": "id"})
+    cursor = odoo.keyset_cursor(MODEL, DOMAIN, 4)
+    assert len(cursor.ranges) == 4
+    assert cursor.ranges[0][0] == ids[0] - 1
+    assert cursor.ranges[-1][1] is None
+    # Contiguous: each range starts where the previous one ends
+    assert all(previous[1] == current[0] for previous, current in zip(cursor.ranges, cursor.ranges[1:]))
+    assert odoo.keyset_cursor(MODEL, DOMAIN, 1).ranges == [[0, None]]
+    assert odoo.keyset_cursor(MODEL, [("id", "<", 0)], 4).ranges == [[0, None]]
+
+
+@pytest.mark.parametrize("parts", [1, 3, 4])
+def test_keyset_reads_what_offset_paging_reads(odoo, parts):
+    """On data that does not change, both scans read every record once."""
+    expected = offset_ids(odoo)
+    assert len(expected) > 5 * PAGE_SIZE
+    assert expected == sorted(set(expected))
+
+    ids = keyset_ids(odoo, odoo.keyset_cursor(MODEL, DOMAIN, parts))
+
+    assert len(ids) == len(set(ids))
+    assert sorted(ids) == expected
+
+
+def test_keyset_does_not_skip_records_deleted_behind_it(fake_odoo, odoo):
+    """Records deleted from an already read page shift the offsets (offset paging
+    skips live records), not the id bounds of a keyset scan."""
+    fake, _ = fake_odoo
+    expected = odoo.execute(MODEL, "search", [DOMAIN], {"order": "id"})
+    deleted = expected[:PAGE_SIZE // 2]
+    live = expected[PAGE_SIZE // 2:]
+
+    def scan(pages) -> list[int]:
+        ids = []
+        for number, page in enumerate(pages):
+            ids.extend(r["id"] for r in page)
+            if number == 0:
+                for odoo_id in deleted:
+                    fake.store.delete(odoo_id)
+        for odoo_id in deleted:
+            fake.store.put({**fake.store.record(expected[-1]), "id": odoo_id})
+        return ids
+
+    by_offset = scan(odoo.search_read_pages(MODEL, DOMAIN, FIELDS, page_size=PAGE_SIZE, workers=1))
+    by_keyset = scan(odoo.search_read_keyset(MODEL, DOMAIN, FIELDS, KeysetCursor([[0, None]]), PAGE_SIZE))
+
+    assert set(live) - set(by_offset)
+    assert set(live) <= set(by_keyset)
+    assert len(by_keyset) == len(set(by_keyset))
+
+
+def test_keyset_reads_records_created_during_the_scan(fake_odoo, odoo):
+    """The last range is open-ended: records created while the scan runs are read too."""
+    fake, _ = fake_odoo
+    expected = odoo.execute(MODEL, "search", [DOMAIN], {"order": "id"})
+    created = expected[-1] + 1000
+    ids = []
+    for number, page in enumerate(odoo.search_read_keyset(MODEL, DOMAIN, FIELDS, KeysetCursor([[0, None]]), PAGE_SIZE)):
+        ids.extend(r["id"] for r in page)
+        if number == 0:
+            fake.store.put({**fake.store.record(expected[-1]), "id": created})
+    assert ids == expected + [created]
+
+
+def test_interrupted_scan_resumes_from_its_cursor(odoo):
+    """A scan resumed from the saved ranges reads exactly the records not consumed yet."""
+    expected = offset_ids(odoo)
+    cursor = odoo.keyset_cursor(MODEL, DOMAIN, 4)
+    consumed = []
+    for number, page in enumerate(odoo.search_read_keyset(MODEL, DOMAIN, FIELDS, cursor, PAGE_SIZE)):
+        for record in page:
+            consumed.append(record["id"])
+            cursor.advance(record["id"])
+        if number == 2:
+            break
+
+    resumed = keyset_ids(odoo, KeysetCursor([list(r) for r in cursor.ranges]))
+
+    assert consumed and resumed
+    assert not set(consumed) & set(resumed)
+    assert sorted(consumed + resumed) == expected
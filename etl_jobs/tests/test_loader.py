@@ -0,0 +1,141 @@
+# file: etl_jobs/tests/test_loader.py
+"""
+Publishing staged rows (loader.BulkLoader, merge mode) into the live tables.
+
+Needs PostgreSQL: set ETL_TEST_DATABASE_URL to a scratch database initialised
+with init/postgres (the tests write rows of their own ETL type and company, and
+remove them afterwards); skipped otherwise.
+"""
+import json
+import os
+from datetime import datetime, UTC
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+from loader import BulkLoader  # noqa: E402
+from treasury_etl import get_or_create_system_user  # noqa: E402
+
+DSN = os.getenv("ETL_TEST_DATABASE_URL")
+ETL_KEY = "test_loader"
+ETL_TYPE = "Test loader"
+COMPANY_ID = 990001
+SCOPE = "0123456789abcdef"
+
+pytestmark = pytest.mark.skipif(not DSN, reason="ETL_TEST_DATABASE_URL is not set")
+
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DSN)
+    conn.autocommit = True
+    yield conn
+    with conn.cursor() as cur:
+        for table in ("movement", '"Exception"'):
+            cur.execute(f"DELETE FROM {table} WHERE type = %s", (ETL_TYPE,))
+        cur.execute("DELETE FROM etl_raw_move WHERE etl_type = %s", (ETL_TYPE,))
+        cur.execute("DELETE FROM company WHERE company_id = %s", (COMPANY_ID,))
+        for kind in ("movement", "exception", "raw"):
+            for prefix in ("etl_stage", "etl_batch"):
+                for suffix in ("", f"_w{SCOPE}"):
+                    cur.execute(f"DROP TABLE IF EXISTS {prefix}_{kind}_{ETL_KEY}_c{COMPANY_ID}{suffix}")
+    conn.close()
+
+
+def loader_for(conn, **options) -> BulkLoader:
+    with conn.cursor() as cur:
+        created_by = get_or_create_system_user(cur)
+    return BulkLoader(conn, ETL_KEY, ETL_TYPE, "Autre", created_by,
+                      datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ"), company_id=COMPANY_ID, **options)
+
+
+def load(conn, movements: dict[int, float], exceptions: dict[int, float] = {},
+         scope_ids: set[int] | None = None, **options) -> dict:
+    """Stage `movements` / `exceptions` ({odoo_id: amount}) and their raw records, then publish them."""
+    loader = loader_for(conn, **options)
+    loader.begin()
+    loader.ensure_company(COMPANY_ID)
+    for odoo_id, amount in movements.items():
+        loader.add_movement(COMPANY_ID, amount, "Entrée", "2026-11-01", "Facture", f"INV/{odoo_id}", "Ouvert",
+                            f"odoo/{odoo_id}", odoo_id)
+        loader.add_raw({"id": odoo_id, "company_id": [COMPANY_ID, "Test"], "amount_residual": amount})
+    for odoo_id, amount in exceptions.items():
+        loader.add_exception(COMPANY_ID, "Échéance passée", amount, "Entrée", "Facture", f"INV/{odoo_id}", "Ouvert",
+                             f"odoo/{odoo_id}", odoo_id)
+        loader.add_raw({"id": odoo_id, "company_id": [COMPANY_ID, "Test"], "amount_residual": amount})
+    return loader.publish(scope_ids)
+
+
+def movements(conn) -> dict[int, tuple]:
+    """{odoo_id: (movement_id, amount, exclude_from_analytics)} of the published movements."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT odoo_id, movement_id, amount, exclude_from_analytics FROM movement WHERE type = %s",
+                    (ETL_TYPE,))
+        return {row[0]: (row[1], float(row[2]), row[3]) for row in cur.fetchall()}
+
+
+def landed(conn) -> dict[int, float]:
+    with conn.cursor() as cur:
+        cur.execute("SELECT odoo_id, payload FROM etl_raw_move WHERE etl_type = %s", (ETL_TYPE,))
+        return {odoo_id: (payload if isinstance(payload, dict) else json.loads(payload))["amount_residual"]
+                for odoo_id, payload in cur.fetchall()}
+
+
+def test_full_publish_merges_on_the_odoo_identity(conn):
+    """A second full publish updates changed rows in place, keeps unchanged ones and
+    the users' columns, inserts new rows and deletes vanished ones."""
+    assert load(conn, {1: 10.0, 2: 20.0, 3: 30.0}, {4: 40.0}) == {"inserted": 4, "updated": 0, "deleted": 0}
+    first = movements(conn)
+    with conn.cursor() as cur:
+        cur.execute("UPDATE movement SET exclude_from_analytics = true WHERE type = %s AND odoo_id = 2", (ETL_TYPE,))
+
+    stats = load(conn, {1: 10.0, 2: 25.0, 5: 50.0}, {4: 40.0})
+
+    assert stats == {"inserted": 1, "updated": 1, "deleted": 1}
+    after = movements(conn)
+    assert sorted(after) == [1, 2, 5]
+    assert after[1][0] == first[1][0]
+    assert after[2] == (first[2][0], 25.0, True)
+    assert landed(conn) == {1: 10.0, 2: 25.0, 4: 40.0, 5: 50.0}
+
+
+def test_scoped_publish_only_touches_its_ids(conn):
+    """An incremental publish rewrites the ids in scope and leaves the others alone;
+    ids in scope without staged rows are removed."""
+    load(conn, {1: 10.0, 2: 20.0, 3: 30.0})
+
+    stats = load(conn, {2: 22.0}, scope_ids={2, 3})
+
+    assert stats == {"inserted": 0, "updated": 1, "deleted": 1}
+    assert {odoo_id: amount for odoo_id, (_, amount, _) in movements(conn).items()} == {1: 10.0, 2: 22.0}
+    assert landed(conn) == {1: 10.0, 2: 22.0}
+
+
+def test_publish_without_change_writes_nothing(conn):
+    load(conn, {1: 10.0, 2: 20.0})
+    assert load(conn, {1: 10.0, 2: 20.0}) == {"inserted": 0, "updated": 0, "deleted": 0}
+
+
+def test_window_run_stages_apart_from_an_interrupted_scan(conn):
+    """A window run leaves the staging tables of an interrupted full scan alone, and
+    drops its own once published."""
+    interrupted = psycopg2.connect(DSN)
+    interrupted.autocommit = True
+    try:
+        full = loader_for(interrupted)
+        full.begin()
+        full.add_movement(COMPANY_ID, 10.0, "Entrée", "2026-11-01", "Facture", "INV/1", "Ouvert", "odoo/1", 1)
+        full.flush()
+    finally:
+        interrupted.close()
+
+    assert load(conn, {2: 20.0}, scope_ids={2}, raw=False, scope=SCOPE)["inserted"] == 1
+
+    resumed = loader_for(conn)
+    resumed.begin([])
+    assert resumed.staged_rows == 1
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_unlock_all()")
+        cur.execute("SELECT count(*) FROM pg_tables WHERE tablename LIKE %s", (f"%_w{SCOPE}",))
+        assert cur.fetchone()[0] == 0
@@ -0,0 +1,202 @@
+# file: etl_jobs/tests/test_sync_plan.py
+"""Sync planning (sync_state.plan_sync / plan_window) against the fake Odoo, local state in sqlite."""
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import sync_state
+from sync_state import plan_sync, plan_window, state_key
+
+MODEL = "account.move"
+ETL_TYPE = "Ventes locales"
+COMPANY_ID = 1
+# A source domain, restricted to one company shard as treasury_etl.run_shard does
+DOMAIN = [
+    ("move_type", "in", ["out_invoice", "out_refund"]),
+    ("state", "in", ["draft", "posted"]),
+    ("company_id", "=", COMPANY_ID),
+]
+
+SCHEMA = """
+CREATE TABLE etl_sync_state (source TEXT PRIMARY KEY, last_write_date TIMESTAMP, last_id INTEGER,
+                             record_count INTEGER, last_full_sync_at TIMESTAMP, last_sync_at TIMESTAMP);
+CREATE TABLE movement (type TEXT, company_id INTEGER, odoo_id INTEGER);
+CREATE TABLE "Exception" (type TEXT, company_id INTEGER, odoo_id INTEGER);
+CREATE TABLE etl_raw_move (etl_type TEXT, company_id INTEGER, odoo_id INTEGER);
+"""
+
+sqlite3.register_converter("TIMESTAMP", lambda value: datetime.fromisoformat(value.decode()))
+
+
+class SqliteCursor:
+    """The part of a psycopg2 cursor sync_state reads with, over sqlite3."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self._cur = conn.cursor()
+
+    def execute(self, sql: str, params: tuple = ()) -> None:
+        self._cur.execute(sql.replace("%s", "?"), params)
+
+    def fetchone(self):
+        return self._cur.fetchone()
+
+    def fetchall(self):
+        return self._cur.fetchall()
+
+
+@pytest.fixture
+def cur():
+    conn = sqlite3.connect(":memory:", detect_types=sqlite3.PARSE_DECLTYPES)
+    conn.executescript(SCHEMA)
+    yield SqliteCursor(conn)
+    conn.close()
+
+
+def now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def set_state(cur, last_write_date: str, last_id: int, record_count: int, last_full_sync_at: datetime,
+              company_id: int = COMPANY_ID) -> None:
+    cur.execute(
+        "INSERT INTO etl_sync_state(source, last_write_date, last_id, record_count, last_full_sync_at) "
+        "VALUES (%s, %s, %s, %s, %s)",
+        (state_key(ETL_TYPE, company_id), last_write_date, last_id, record_count, last_full_sync_at.isoformat()),
+    )
+
+
+def full_sync(odoo, cur, synced_at: datetime | None = None) -> list[dict]:
+    """Local state as a full sync of DOMAIN leaves it: rows, landed records and watermark."""
+    records = odoo.search_read_all(MODEL, DOMAIN, ["write_date"], order="id", workers=1)
+    for record in records:
+        cur.execute("INSERT INTO movement VALUES (%s, %s, %s)", (ETL_TYPE, COMPANY_ID, record["id"]))
+        cur.execute("INSERT INTO etl_raw_move VALUES (%s, %s, %s)", (ETL_TYPE, COMPANY_ID, record["id"]))
+    last = max(records, key=lambda r: (r["write_date"], r["id"]))
+    set_state(cur, last["write_date"], last["id"], len(records), synced_at or now())
+    return records
+
+
+def rewrite(fake, odoo_id: int, **values) -> None:
+    fake.store.put({**fake.store.record(odoo_id), **values})
+
+
+def test_full_without_watermark(odoo, cur):
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+    assert plan.mode == "full"
+    assert plan.reason == "no watermark yet"
+    assert plan.fetch_domain == DOMAIN
+    assert plan.expected is None
+
+
+def test_skip_when_nothing_changed(odoo, cur):
+    records = full_sync(odoo, cur)
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+    assert plan.mode == "skip"
+    assert plan.record_count == len(records)
+    assert plan.expected == 0
+
+
+def test_incremental_fetches_records_written_after_the_watermark(fake_odoo, odoo, cur):
+    """Changed records are those after the (write_date, id) mark, ties on write_date broken by id."""
+    fake, _ = fake_odoo
+    records = sorted(full_sync(odoo, cur), key=lambda r: (r["write_date"], r["id"]))
+    # Move the mark into the middle of the records, with records written at the same time on both sides
+    mark = records[len(records) // 2]
+    tied_before = next(r["id"] for r in records if r["id"] < mark["id"])
+    tied_after = next(r["id"] for r in records if r["id"] > mark["id"])
+    for odoo_id in (tied_before, tied_after):
+        rewrite(fake, odoo_id, write_date=mark["write_date"])
+    cur.execute("UPDATE etl_sync_state SET last_write_date = %s, last_id = %s",
+                (mark["write_date"], mark["id"]))
+    records = odoo.search_read_all(MODEL, DOMAIN, ["write_date"], order="id", workers=1)
+    expected = {r["id"] for r in records if (r["write_date"], r["id"]) > (mark["write_date"], mark["id"])}
+    assert tied_after in expected and tied_before not in expected
+
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+
+    assert plan.mode == "incremental"
+    assert plan.expected == len(expected)
+    assert set(odoo.execute(MODEL, "search", [plan.fetch_domain])) == expected
+    assert plan.stale_ids == set()
+
+
+def test_incremental_removes_records_that_left_the_source(fake_odoo, odoo, cur):
+    """Local rows (or landed records) of invoices cancelled or deleted in Odoo are stale."""
+    fake, _ = fake_odoo
+    records = full_sync(odoo, cur)
+    cancelled, deleted, landed_only = records[0]["id"], records[1]["id"], records[2]["id"]
+    rewrite(fake, cancelled, state="cancel", write_date="2099-01-01 00:00:00")
+    fake.store.delete(deleted)
+    fake.store.delete(landed_only)
+    cur.execute("DELETE FROM movement WHERE odoo_id = %s", (landed_only,))
+
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+
+    assert plan.mode == "incremental"
+    assert plan.stale_ids == {cancelled, deleted, landed_only}
+    assert plan.record_count == len(records) - 3
+    # The cancelled invoice is not fetched: it left the domain
+    assert odoo.execute(MODEL, "search", [plan.fetch_domain]) == []
+
+
+def test_deleted_record_alone_is_not_skipped(fake_odoo, odoo, cur):
+    """A deletion leaves no newer write_date: the live count tells the plan apart from a skip."""
+    fake, _ = fake_odoo
+    records = full_sync(odoo, cur)
+    fake.store.delete(records[-1]["id"])
+
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+
+    assert plan.mode == "incremental"
+    assert plan.expected == 0
+    assert plan.stale_ids == {records[-1]["id"]}
+
+
+def test_full_on_the_first_run_of_the_day(odoo, cur):
+    records = full_sync(odoo, cur, synced_at=now() - timedelta(days=1))
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID)
+    assert plan.mode == "full"
+    assert plan.reason == "first run of the day"
+    assert plan.expected == len(records)
+
+
+def test_full_when_the_last_full_sync_is_too_old(odoo, cur, monkeypatch):
+    synced_at = now() - timedelta(hours=2)
+    full_sync(odoo, cur, synced_at=synced_at)
+    monkeypatch.setattr(sync_state, "FULL_RESYNC_HOURS", 1)
+    plan = plan_sync(odoo, cur, ETL_TYPE, DOMAIN, synced_at.date(), COMPANY_ID)
+    assert plan.mode == "full"
+    assert plan.reason == "last full resync older than 1h"
+
+
+def test_full_when_forced(odoo, cur, monkeypatch):
+    full_sync(odoo, cur)
+    monkeypatch.setattr(sync_state, "SYNC_MODE", "full")
+    assert plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID).mode == "full"
+
+
+def test_company_shards_are_planned_apart(odoo, cur):
+    """The watermark of one company says nothing of another."""
+    full_sync(odoo, cur)
+    other = [term for term in DOMAIN if term[0] != "company_id"] + [("company_id", "=", 2)]
+    assert plan_sync(odoo, cur, ETL_TYPE, DOMAIN, now().date(), COMPANY_ID).mode == "skip"
+    assert plan_sync(odoo, cur, ETL_TYPE, other, now().date(), 2).mode == "full"
+
+
+def test_window_fetches_the_window_and_only_its_stale_rows(fake_odoo, odoo, cur):
+    fake, _ = fake_odoo
+    records = full_sync(odoo, cur)
+    dates = sorted(fake.store.record(r["id"])["invoice_date"] for r in records)
+    window = [("invoice_date", ">=", dates[len(dates) // 3]), ("invoice_date", "<=", dates[len(dates) // 2])]
+    in_window = set(odoo.execute(MODEL, "search", [DOMAIN + window]))
+    inside = min(in_window)
+    outside = next(r["id"] for r in records if r["id"] not in in_window)
+    rewrite(fake, inside, state="cancel")
+    rewrite(fake, outside, state="cancel")
+
+    plan = plan_window(odoo, cur, ETL_TYPE, DOMAIN, window, COMPANY_ID)
+
+    assert plan.mode == "window"
+    assert set(odoo.execute(MODEL, "search", [plan.fetch_domain])) == in_window - {inside}
+    assert plan.stale_ids == {inside}
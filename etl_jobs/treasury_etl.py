@@ -0,0 +1,768 @@
+# file: etl_jobs/treasury_etl.py
+"""
+Shared runner for the treasury sources fed by Odoo `account.move`.
+
+Each source module (achat_importation_upsert, ventes_locales_upsert,
+achats_locaux_echeance_upsert) declares a `Source`: its domain, the fields it
+reads and a per-record classifier. `run_sources()` plans every source, fetches
+the union of their domains once with the union of their fields, and routes each
+record in-process to the sources whose domain it matches, so a refresh of the
+three sources costs one Odoo scan instead of three.
+
+Runs are sharded per company: the companies are discovered from Odoo
+`res.company` (optionally restricted by ODOO_COMPANY_IDS) and each one is
+planned, extracted and published on its own, in parallel threads (up to
+ETL_SHARD_WORKERS), with its own sync watermark, staging tables and publish
+scope. Extraction is mostly waiting on Odoo, so another subsidiary adds a
+parallel scan rather than a sequential one.
+
+The scan pages by id (`OdooClient.search_read_keyset`) and is checkpointed every
+ETL_CHECKPOINT_ROWS records: buffered rows are COPY-ed to staging and the
+cursor is saved in `etl_scan_cursor`. A shard whose previous scan was
+interrupted before publishing (timeout, crash) keeps its staging tables and
+resumes from the checkpoint, provided it is planned identically.
+
+Every record a source reads is also landed, raw, in `etl_raw_move` (see
+loader.py). `run_sources(..., retransform=True)` rebuilds the sources from that
+snapshot alone, without any Odoo call: after a classification rule changes
+(exception reasons, rate conversion), movements and exceptions are recomputed
+in seconds. The watermarks and the landing table are left as they are.
+
+With ETL_DUE_DATES=installments, the sources that support it book one movement
+per open installment instead of the whole residual on `invoice_date_due`: the
+receivable / payable `account.move.line` rows of the scanned invoices are read
+alongside the scan, in one `search_read` per ETL_INSTALLMENT_BATCH invoices,
+and attached to the records (and so to their raw payloads) as `installments`.
+
+Sources with `uses_rates` convert amounts with the Odoo rate history, copied
+once per run before the shards start (currency_rates.py; the local copy only,
+for a retransform).
+
+After a refresh, the rows each source published are reconciled with Odoo
+through `read_group` (see reconcile.py); the outcome is returned under
+"reconciliation".
+
+`run_sources(..., window=...)` refreshes only the records matching extra domain
+terms, e.g. an invoice date range: see sync_state.plan_window. It leaves the sync
+state, the landing table and the checkpoint of an interrupted full scan as they
+are (a retransform still rebuilds from the last full or incremental snapshot).
+
+`on_progress(event)` receives structured progress while a run is in flight (see
+`ProgressReporter`); the refresh worker forwards these events to the API.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import date, datetime, UTC
+from typing import Callable, Iterable, Iterator
+
+import psycopg2
+
+import currency_rates
+import reconcile
+from domain import compile_domain, domain_fields, domain_or
+from loader import BulkLoader, landing_companies, landing_count, read_landing
+from metrics import RunMetrics
+from odoo_client import DEFAULT_FETCH_WORKERS, KeysetCursor, OdooClient, get_client
+from pipeline import stream_records
+from sync_state import (
+    SyncPlan, SyncProgress, clear_cursor, load_cursor, load_state, plan_sync, plan_window, save_cursor,
+    save_state, state_key,
+)
+
+MODEL = "account.move"
+LINE_MODEL = "account.move.line"
+# Open installments: the unreconciled receivable / payable lines of an invoice
+LINE_DOMAIN = [("account_type", "in", ["asset_receivable", "liability_payable"]), ("reconciled", "=", False)]
+LINE_FIELDS = ["move_id", "date_maturity", "amount_residual_currency"]
+# Movement due dates: invoice (residual on invoice_date_due) | installments
+DUE_DATES = os.getenv("ETL_DUE_DATES", "invoice")
+# Invoices whose installment lines are read in one account.move.line search_read
+INSTALLMENT_BATCH = int(os.getenv("ETL_INSTALLMENT_BATCH", "1000"))
+# Records between two checkpoints of a scan (0 disables checkpoints and resuming)
+CHECKPOINT_ROWS = int(os.getenv("ETL_CHECKPOINT_ROWS", "10000"))
+# Minimum seconds between two extract progress events
+PROGRESS_INTERVAL = float(os.getenv("ETL_PROGRESS_INTERVAL", "1"))
+# Company shards refreshed at the same time
+SHARD_WORKERS = int(os.getenv("ETL_SHARD_WORKERS", "4"))
+# Optional comma-separated company ids (default: every company of res.company);
+# ODOO_COMPANY_ID is the former single-company setting
+COMPANY_IDS = os.getenv("ODOO_COMPANY_IDS") or os.getenv("ODOO_COMPANY_ID", "")
+
+
+@dataclass
+class Source:
+    key: str
+    etl_type: str
+    category: str
+    fields: list[str]
+    build_domain: Callable[[date], list]
+    load_record: Callable[[dict, BulkLoader, OdooClient, date], None]
+    # Converts amounts with currency_rates.current(), synced once per run
+    uses_rates: bool = False
+    # Books open installments (see split_installments) when ETL_DUE_DATES=installments
+    installments: bool = False
+    # Odoo amount a movement books for a whole invoice, as summed by reconcile.py
+    booked: str = "amount_residual"
+
+
+@dataclass
+class SourceRun:
+    source: Source
+    plan: SyncPlan
+    loader: BulkLoader
+    company_id: int | None = None
+    seen: SyncProgress = field(default_factory=SyncProgress)
+    # Wall seconds: planning, and classification (load_record minus staging COPYs)
+    timings: dict = field(default_factory=lambda: {"plan": 0.0, "transform": 0.0})
+
+    @property
+    def shard_key(self) -> str:
+        return self.source.key if self.company_id is None else f"{self.source.key}:{self.company_id}"
+
+    def result(self, extract_seconds: float) -> dict:
+        loader = self.loader
+        return dict(
+            loader.stats,
+            records=loader.movements_written,
+            fetched=self.seen.count,
+            timings=dict(self.timings, extract=extract_seconds, **loader.timings),
+        )
+
+
+class ProgressReporter:
+    """Builds progress events for `on_progress` (no-op without a callback).
+
+    Event: {"phase": "plan" | "extract" | "publish", "elapsed": seconds,
+    "sources": {"<key>:<company_id>": {source, company_id, phase, mode, expected,
+    fetched, written, exceptions, bytes, inserted, updated, deleted}}}. Every
+    event lists all the shard sources seen so far, each with its own phase
+    ("publish" once published). `written` / `exceptions` / `bytes` count rows
+    COPY-ed to staging so far; extract events are throttled to one per
+    `interval` seconds. Shards share one reporter, so it is thread-safe.
+    """
+
+    def __init__(self, on_progress: Callable[[dict], None] | None, interval: float = PROGRESS_INTERVAL):
+        self.on_progress = on_progress
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._last = 0.0
+        self._lock = threading.Lock()
+        self._runs: dict[str, tuple[SourceRun, str]] = {}
+
+    @staticmethod
+    def _source(run: SourceRun, phase: str) -> dict:
+        loader = run.loader
+        return dict(
+            source=run.source.key,
+            company_id=run.company_id,
+            phase=phase,
+            mode=run.plan.mode,
+            expected=run.plan.expected,
+            fetched=run.seen.count,
+            written=loader.movements_written,
+            exceptions=loader.exceptions_written,
+            bytes=loader.bytes_staged,
+            **loader.stats,
+        )
+
+    def emit(self, phase: str, runs: list[SourceRun]) -> None:
+        if self.on_progress is None:
+            return
+        with self._lock:
+            for run in runs:
+                if self._runs.get(run.shard_key, (None, ""))[1] != "publish":
+                    self._runs[run.shard_key] = (run, phase)
+            self._last = time.perf_counter()
+            self.on_progress({
+                "phase": phase,
+                "elapsed": round(self._last - self.started, 3),
+                "sources": {key: self._source(run, run_phase) for key, (run, run_phase) in self._runs.items()},
+            })
+
+    def tick(self, runs: list[SourceRun]) -> None:
+        """Extract event, unless one was sent less than `interval` seconds ago."""
+        if self.on_progress is not None and time.perf_counter() - self._last >= self.interval:
+            self.emit("extract", runs)
+
+
+# --- PostgreSQL ---
+
+def connect():
+    """New connection from the PG* / DB_NAME / POSTGRES_* variables."""
+    password = os.getenv("POSTGRES_PASSWORD", "")
+    if not password:
+        raise RuntimeError("Missing PostgreSQL POSTGRES_PASSWORD. Check .env")
+    conn = psycopg2.connect(
+        host=os.getenv("PGHOST", "127.0.0.1"),
+        port=int(os.getenv("PGPORT", "5432")),
+        dbname=os.getenv("DB_NAME", "appdb"),
+        user=os.getenv("POSTGRES_USER", "postgres"),
+        password=password,
+    )
+    # Staging writes run in autocommit; each loader opens one transaction to publish
+    conn.autocommit = True
+    return conn
+
+
+_idle: list = []
+_idle_lock = threading.Lock()
+
+
+def get_connection():
+    """Connection kept open between runs of a long-lived worker (checked, reopened if broken).
+
+    Give it back with `release_connection()`; concurrent shards each take their own.
+    """
+    while True:
+        with _idle_lock:
+            conn = _idle.pop() if _idle else None
+        if conn is None:
+            return connect()
+        if conn.closed:
+            continue
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return conn
+        except psycopg2.Error:
+            conn.close()
+
+
+def release_connection(conn) -> None:
+    if not conn.closed:
+        with _idle_lock:
+            _idle.append(conn)
+
+
+def discard_connection(conn) -> None:
+    """Drop a connection, e.g. after a failed run (releases its advisory locks)."""
+    conn.close()
+
+
+def get_or_create_system_user(cur) -> int:
+    """System user movements are attributed to (created if missing)."""
+    email = os.getenv("SYSTEM_USER_EMAIL", "system@local")
+    cur.execute('SELECT user_id FROM "User" WHERE email = %s', (email,))
+    row = cur.fetchone()
+    if row and row[0]:
+        return int(row[0])
+    # Refreshes of different sources may start together: the first insert wins
+    cur.execute(
+        'INSERT INTO "User"(display_name, email, role) VALUES (%s,%s,%s) '
+        'ON CONFLICT (email) DO NOTHING RETURNING user_id',
+        (os.getenv("SYSTEM_USER_NAME", "System"), email, os.getenv("SYSTEM_USER_ROLE", "Admin")),
+    )
+    new_id_row = cur.fetchone()
+    if not new_id_row or new_id_row[0] is None:
+        cur.execute('SELECT user_id FROM "User" WHERE email = %s', (email,))
+        new_id_row = cur.fetchone()
+    return int(new_id_row[0])
+
+
+# --- Extraction ---
+
+def fetch_fields(runs: list[SourceRun]) -> list[str]:
+    """Union of the fields read by the sources and the fields their domains filter on."""
+    wanted: list[str] = []
+    for run in runs:
+        wanted.extend(run.source.fields)
+        wanted.extend(sorted(domain_fields(run.plan.fetch_domain)))
+    wanted.append("write_date")
+    return [f for f in dict.fromkeys(wanted) if f != "id"]
+
+
+def extract(odoo: OdooClient, runs: list[SourceRun], today: date,
+            progress: ProgressReporter | None = None, metrics: RunMetrics | None = None,
+            cursor: KeysetCursor | None = None,
+            checkpoint: Callable[[KeysetCursor], None] | None = None) -> float:
+    """One keyset scan of `account.move` for every source that has something to fetch.
+
+    The scan starts from `cursor` (a resumed scan) or from the lowest id, and
+    `checkpoint(cursor)` is called every CHECKPOINT_ROWS records, once they have
+    all been routed. Returns the seconds spent waiting for Odoo pages (fetching
+    overlaps the rest). With `metrics`, records a "page" step per Odoo page, an
+    "installments" step per account.move.line page and one "transform" entry.
+    """
+    progress = progress or ProgressReporter(None)
+    active = [run for run in runs if run.plan.mode != "skip"]
+    if not active:
+        return 0.0
+    fetch_domain = domain_or(*(run.plan.fetch_domain for run in active))
+    routes = [(compile_domain(run.plan.fetch_domain), run) for run in active]
+    on_page = None if metrics is None else (lambda wall, cpu, rows: metrics.add("page", wall, cpu, rows=rows))
+    cursor = cursor or odoo.keyset_cursor(MODEL, fetch_domain)
+    pages = odoo.search_read_keyset(MODEL, fetch_domain, fetch_fields(active), cursor, on_page=on_page)
+    by_installment = [route for route, run in routes if run.source.installments and DUE_DATES == "installments"]
+    if by_installment:
+        on_lines = None if metrics is None else (
+            lambda wall, cpu, rows: metrics.add("installments", wall, cpu, rows=rows)
+        )
+        pages = with_installments(odoo, pages, lambda record: any(route(record) for route in by_installment), on_lines)
+    records = stream_records(pages)
+    waited = 0.0
+    routed = 0
+    # This loop minus page waits and staging COPYs is the transform (routing + classification)
+    loop_started, cpu_started = time.perf_counter(), time.thread_time()
+    stage_wall, stage_cpu = _staged(metrics, "wall"), _staged(metrics, "cpu")
+    while True:
+        started = time.perf_counter()
+        record = next(records, None)
+        waited += time.perf_counter() - started
+        if record is None:
+            progress.emit("extract", runs)
+            if metrics is not None:
+                metrics.add(
+                    "transform",
+                    time.perf_counter() - loop_started - waited - (_staged(metrics, "wall") - stage_wall),
+                    time.thread_time() - cpu_started - (_staged(metrics, "cpu") - stage_cpu),
+                    count=sum(run.seen.count for run in active),
+                )
+            return waited
+        for in_source, run in routes:
+            if in_source(record):
+                run.seen.observe(record)
+                started, staged = time.perf_counter(), run.loader.timings["stage"]
+                run.loader.add_raw(record)
+                run.source.load_record(record, run.loader, odoo, today)
+                run.timings["transform"] += (
+                    time.perf_counter() - started - (run.loader.timings["stage"] - staged)
+                )
+        cursor.advance(record["id"])
+        routed += 1
+        if checkpoint is not None and routed % CHECKPOINT_ROWS == 0:
+            checkpoint(cursor)
+        progress.tick(runs)
+
+
+def fetch_installments(odoo: OdooClient, move_ids: list[int],
+                       on_page: Callable[[float, float, int], None] | None = None) -> dict[int, list[list]]:
+    """Open installments of `move_ids`: {move id: [[date_maturity, amount_residual_currency], ...]} by maturity."""
+    installments: dict[int, list[list]] = defaultdict(list)
+    domain = [("move_id", "in", move_ids)] + LINE_DOMAIN
+    # Pages sized for the batch: usually a single round trip
+    pages = odoo.search_read_pages(LINE_MODEL, domain, LINE_FIELDS, order="id",
+                                   page_size=4 * INSTALLMENT_BATCH, workers=1, on_page=on_page)
+    for page in pages:
+        for line in page:
+            installments[line["move_id"][0]].append(
+                [line.get("date_maturity") or False, float(line.get("amount_residual_currency") or 0.0)]
+            )
+    for lines in installments.values():
+        lines.sort(key=lambda line: line[0] or "")
+    return installments
+
+
+def with_installments(odoo: OdooClient, pages: Iterable[list[dict]], wanted: Callable[[dict], bool],
+                      on_page: Callable[[float, float, int], None] | None = None) -> Iterator[list[dict]]:
+    """Yield `pages` with `record["installments"]` set on the records `wanted` selects.
+
+    Pages are grouped until they hold INSTALLMENT_BATCH wanted invoices, whose
+    lines are then read in one batch; up to DEFAULT_FETCH_WORKERS batches are in
+    flight while the scan goes on, and pages keep their order.
+    """
+    def batches() -> Iterator[tuple[list[list[dict]], list[int]]]:
+        batch: list[list[dict]] = []
+        ids: list[int] = []
+        for page in pages:
+            batch.append(page)
+            ids.extend(record["id"] for record in page if wanted(record))
+            if len(ids) >= INSTALLMENT_BATCH:
+                yield batch, ids
+                batch, ids = [], []
+        if batch:
+            yield batch, ids
+
+    def attach(batch: list[list[dict]], ids: list[int], future) -> Iterator[list[dict]]:
+        installments, wanted_ids = future.result(), set(ids)
+        for page in batch:
+            for record in page:
+                if record["id"] in wanted_ids:
+                    record["installments"] = installments.get(record["id"], [])
+            yield page
+
+    workers = max(1, DEFAULT_FETCH_WORKERS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="odoo-lines") as pool:
+        pending: deque = deque()
+        for batch, ids in batches():
+            future = pool.submit(fetch_installments, odoo, ids, on_page) if ids else pool.submit(dict)
+            pending.append((batch, ids, future))
+            if len(pending) > workers:
+                yield from attach(*pending.popleft())
+        while pending:
+            yield from attach(*pending.popleft())
+
+
+def split_installments(record: dict, reference: str) -> list[tuple[str, str | None, float]] | None:
+    """(reference, maturity, open amount in the invoice currency) per open installment.
+
+    None when the record carries no installments (ETL_DUE_DATES=invoice, or no
+    open line): the caller books the residual on `invoice_date_due`. Invoices with
+    several installments get one reference each, "<name> 2/3 (ID:<id>)"; callers
+    number the movements in this order (their `installment`, part of the merge key).
+    """
+    lines = [line for line in record.get("installments") or () if line[1]]
+    if not lines:
+        return None
+    if len(lines) == 1:
+        return [(reference, lines[0][0] or None, abs(lines[0][1]))]
+    name, marker, odoo_id = reference.rpartition(" (ID:")
+    if not marker:
+        name, odoo_id = reference, ""
+    return [
+        (f"{name} {index}/{len(lines)}{marker}{odoo_id}", maturity or None, abs(amount))
+        for index, (maturity, amount) in enumerate(lines, start=1)
+    ]
+
+
+def booked_amount(source: Source) -> str:
+    """Odoo amount the movements of `source` add up to per invoice (installments book the residual)."""
+    return "amount_residual" if source.installments and DUE_DATES == "installments" else source.booked
+
+
+def _staged(metrics: RunMetrics | None, key: str) -> float:
+    """Seconds ("wall" or "cpu") spent in staging COPYs so far."""
+    return metrics.steps.get("stage_batch", {}).get(key, 0.0) if metrics is not None else 0.0
+
+
+# --- Companies ---
+
+def configured_companies() -> list[int] | None:
+    """ODOO_COMPANY_IDS, if set."""
+    if not COMPANY_IDS.strip():
+        return None
+    return [int(c) for c in COMPANY_IDS.split(",") if c.strip()]
+
+
+def discover_companies(odoo: OdooClient) -> list[int]:
+    """Company ids to refresh: ODOO_COMPANY_IDS if set, else every `res.company` in Odoo."""
+    configured = configured_companies()
+    if configured is not None:
+        return configured
+    companies = odoo.search_read_all("res.company", [], ["id"], order="id", workers=1)
+    return [company["id"] for company in companies]
+
+
+# --- Checkpoints ---
+
+def window_scope(window: list | None) -> str | None:
+    """Short digest of a window, naming its scan checkpoint and staging tables."""
+    if not window:
+        return None
+    return hashlib.sha256(json.dumps(window, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def scan_job(sources: list[Source], company_id: int | None, window: list | None = None) -> str:
+    """`etl_scan_cursor.job` of a shard's scan (a window scan has its own, not to drop a full scan's)."""
+    job = "+".join(source.key for source in sources)
+    if company_id is not None:
+        job = f"{job} / company {company_id}"
+    if window:
+        job = f"{job} / window {window_scope(window)}"
+    return job
+
+
+def scan_fingerprint(runs: list[SourceRun]) -> str:
+    """Identifies how a scan was planned: a checkpoint only resumes an identical scan."""
+    plans = [(run.source.key, run.plan.mode, run.plan.fetch_domain) for run in runs]
+    return hashlib.sha256(
+        json.dumps([plans, fetch_fields(runs), DUE_DATES], default=str).encode("utf-8")
+    ).hexdigest()
+
+
+def save_checkpoint(conn, job: str, fingerprint: str, runs: list[SourceRun], cursor: KeysetCursor) -> None:
+    """Stage every buffered row, then record the scan position and what it staged."""
+    for run in runs:
+        run.loader.flush()
+    position = {
+        "ranges": cursor.ranges,
+        "runs": {
+            run.source.key: dict(
+                seen=run.seen.snapshot(), staged=run.loader.staged_rows, raw=run.loader.raw_written,
+            )
+            for run in runs
+        },
+    }
+    with conn.cursor() as cur:
+        save_cursor(cur, job, fingerprint, position)
+
+
+def resume_scan(cur, job: str, fingerprint: str, runs: list[SourceRun]) -> KeysetCursor | None:
+    """Open the runs' loaders and, if the shard's previous scan was interrupted, resume it.
+
+    Resuming keeps the rows staged up to the checkpoint and restores what the scan
+    had seen; it is dropped if the staging tables, raw records included, do not hold
+    exactly those rows (e.g. UNLOGGED tables emptied by a PostgreSQL crash recovery).
+    """
+    position = load_cursor(cur, job, fingerprint) if CHECKPOINT_ROWS > 0 else None
+    for run in runs:
+        run.loader.begin(None if position is None else position["ranges"])
+    if position is None:
+        return None
+    saved = position["runs"]
+    if any(
+        (run.loader.staged_rows, run.loader.raw_written)
+        != (saved[run.source.key]["staged"], saved[run.source.key].get("raw"))
+        for run in runs
+    ):
+        for run in runs:
+            run.loader.reset()
+        return None
+    for run in runs:
+        run.seen = SyncProgress.from_snapshot(saved[run.source.key]["seen"])
+    return KeysetCursor(position["ranges"])
+
+
+# --- Run ---
+
+def run_shard(odoo: OdooClient, sources: list[Source], company_id: int | None, today: date,
+              created_by_id: int, progress: ProgressReporter, metrics: RunMetrics,
+              window: list | None = None) -> dict[str, dict]:
+    """Plan, extract and publish `sources` for one company (None: unsharded), within `window` if given."""
+    now_iso = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    label = "" if company_id is None else f" [company {company_id}]"
+    company_domain = [] if company_id is None else [("company_id", "=", company_id)]
+    results: dict[str, dict] = {}
+
+    conn = get_connection()
+    try:
+        with metrics.phase("plan"), conn.cursor() as cur:
+            runs = []
+            for source in sources:
+                started = time.perf_counter()
+                domain = source.build_domain(today) + company_domain
+                plan = (
+                    plan_window(odoo, cur, source.etl_type, domain, window, company_id) if window
+                    else plan_sync(odoo, cur, source.etl_type, domain, today, company_id)
+                )
+                print(f"Sync mode for {source.etl_type}{label}: {plan.mode} ({plan.reason})")
+                # Rows are COPY-ed into staging tables, then merged (or replaced) within the scope on publish.
+                # A window leaves the landing table as the snapshot its sync state counts,
+                # and stages apart from an interrupted full scan of the same source
+                loader = BulkLoader(
+                    conn, source.key, source.etl_type, source.category, created_by_id, now_iso,
+                    metrics=metrics, company_id=company_id, raw=not window, scope=window_scope(window),
+                )
+                runs.append(SourceRun(source, plan, loader, company_id, plan.progress()))
+                runs[-1].timings["plan"] = time.perf_counter() - started
+            job, fingerprint = scan_job(sources, company_id, window), scan_fingerprint(runs)
+            cursor = resume_scan(cur, job, fingerprint, runs)
+            if cursor is not None:
+                print(f"Resuming the {MODEL} scan{label} from its checkpoint "
+                      f"({sum(run.seen.count for run in runs)} records already read)")
+        progress.emit("plan", runs)
+
+        def checkpoint(position: KeysetCursor) -> None:
+            save_checkpoint(conn, job, fingerprint, runs, position)
+
+        with metrics.phase("extract"):
+            extract_seconds = extract(
+                odoo, runs, today, progress, metrics, cursor, checkpoint if CHECKPOINT_ROWS > 0 else None,
+            )
+        # From here on the staged rows are published: a failure restarts the scan from scratch
+        with conn.cursor() as cur:
+            clear_cursor(cur, job)
+
+        for run in runs:
+            etl_type = run.source.etl_type
+            # Full sync owns every row of this ETL type (and company); incremental only the touched Odoo ids
+            scope_ids = None if run.plan.mode == "full" else run.plan.stale_ids | run.seen.ids
+            # Data and watermark become visible together, in one short transaction
+            with metrics.phase("publish"):
+                stats = run.loader.publish(
+                    scope_ids,
+                    lambda publish_cur, run=run: save_state(publish_cur, etl_type, run.plan, run.seen, company_id),
+                )
+            print(f"{etl_type}{label}: {stats['inserted']} inserted, {stats['updated']} updated, "
+                  f"{stats['deleted']} deleted")
+            results[run.source.key] = run.result(extract_seconds)
+            progress.emit("publish", [run])
+    except BaseException:
+        discard_connection(conn)
+        raise
+    release_connection(conn)
+    return results
+
+
+def retransform_shard(odoo: OdooClient, sources: list[Source], company_id: int | None, today: date,
+                      created_by_id: int, progress: ProgressReporter, metrics: RunMetrics) -> dict[str, dict]:
+    """Rebuild `sources` for one company from their landed records (no Odoo call).
+
+    Each source is published as a full reconciliation of its rows; its landed
+    records are filtered with its current domain first, as date conditions move.
+    """
+    now_iso = datetime.now(UTC).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    label = "" if company_id is None else f" [company {company_id}]"
+    results: dict[str, dict] = {}
+
+    conn = get_connection()
+    try:
+        with metrics.phase("plan"), conn.cursor() as cur:
+            runs = []
+            for source in sources:
+                landed = landing_count(cur, source.etl_type, company_id)
+                state = load_state(cur, state_key(source.etl_type, company_id))
+                synced = state.record_count if state else 0
+                # Sources synced before the landing table existed have no complete snapshot yet
+                if state is None or landed != synced:
+                    raise RuntimeError(
+                        f"No complete raw snapshot of {source.etl_type}{label} ({landed} records landed, "
+                        f"{synced} synced): run a full sync first"
+                    )
+                plan = SyncPlan("retransform", source.build_domain(today), record_count=landed,
+                                reason="raw snapshot", expected=landed)
+                print(f"Retransform of {source.etl_type}{label}: {landed} landed records")
+                loader = BulkLoader(
+                    conn, source.key, source.etl_type, source.category, created_by_id, now_iso,
+                    metrics=metrics, company_id=company_id, raw=False,
+                )
+                loader.begin()
+                runs.append(SourceRun(source, plan, loader, company_id))
+        progress.emit("plan", runs)
+
+        started = time.perf_counter()
+        with metrics.phase("transform"):
+            for run in runs:
+                in_source = compile_domain(run.plan.fetch_domain)
+                for record in read_landing(conn, run.source.etl_type, company_id):
+                    if in_source(record):
+                        run.seen.observe(record)
+                        run.source.load_record(record, run.loader, odoo, today)
+                    progress.tick(runs)
+        progress.emit("extract", runs)
+        replay_seconds = time.perf_counter() - started
+
+        for run in runs:
+            with metrics.phase("publish"):
+                stats = run.loader.publish(None)
+            print(f"{run.source.etl_type}{label}: {stats['inserted']} inserted, {stats['updated']} updated, "
+                  f"{stats['deleted']} deleted")
+            results[run.source.key] = run.result(replay_seconds)
+            progress.emit("publish", [run])
+    except BaseException:
+        discard_connection(conn)
+        raise
+    release_connection(conn)
+    return results
+
+
+def _merge_results(shards: dict[int, dict[str, dict]], keys: list[str]) -> dict[str, dict]:
+    """Per-source totals over the company shards (timings are summed shard-seconds)."""
+    merged: dict[str, dict] = {}
+    for key in keys:
+        per_company = {company_id: results[key] for company_id, results in shards.items() if key in results}
+        total = {"inserted": 0, "updated": 0, "deleted": 0, "records": 0, "fetched": 0, "timings": {}}
+        for result in per_company.values():
+            for name in ("inserted", "updated", "deleted", "records", "fetched"):
+                total[name] += result[name]
+            for phase, seconds in result["timings"].items():
+                total["timings"][phase] = total["timings"].get(phase, 0.0) + seconds
+        total["companies"] = per_company
+        merged[key] = total
+    return merged
+
+
+def run_sources(sources: list[Source], today: date | None = None,
+                on_progress: Callable[[dict], None] | None = None,
+                metrics: RunMetrics | None = None,
+                company_ids: list[int] | None = None, retransform: bool = False,
+                window: list | None = None) -> dict[str, dict]:
+    """Refresh `sources` for every company, one Odoo extraction per company shard.
+
+    Returns stats and phase timings per source key, with a per-company breakdown
+    under "companies". `company_ids` overrides the discovery from res.company;
+    `window` (extra domain terms) restricts the refresh to the matching records.
+    `retransform` rebuilds the sources from the landing table instead, for the
+    companies found there (see `retransform_shard`).
+    `metrics` (optional) collects wall / CPU / memory for auth, discovery, rates,
+    reconciliation and, per shard, plan, extract (per page), transform, stage (per
+    COPY batch) and publish. A failed shard does not stop the others; the first
+    error is re-raised once every shard has finished. A failed reconciliation is
+    reported, not raised.
+    """
+    if retransform and window:
+        raise ValueError("A retransform rebuilds whole sources: it cannot be scoped to a window")
+    progress = ProgressReporter(on_progress)
+    metrics = metrics or RunMetrics(trace_memory=False)
+    odoo = get_client()
+    today = today or date.today()
+
+    if not retransform:
+        with metrics.phase("auth"):
+            odoo.uid
+    with metrics.phase("discover"):
+        conn = get_connection()
+        try:
+            with conn.cursor() as cur:
+                companies = company_ids if company_ids is not None else configured_companies()
+                if companies is None:
+                    companies = (
+                        landing_companies(cur, [source.etl_type for source in sources]) if retransform
+                        else discover_companies(odoo)
+                    )
+                # Resolved before the shards start, so they do not race to create it
+                created_by_id = get_or_create_system_user(cur)
+        finally:
+            release_connection(conn)
+    print(f"Companies: {', '.join(map(str, companies)) or 'none'}")
+    if any(source.uses_rates for source in sources):
+        with metrics.phase("rates"):
+            conn = get_connection()
+            try:
+                if retransform:
+                    with conn.cursor() as cur:
+                        rates = currency_rates.load_rates(cur)
+                else:
+                    rates = currency_rates.sync_rates(odoo, conn, today)
+            finally:
+                release_connection(conn)
+        print(f"Currency rates: {len(rates)}")
+
+    def shard(company_id: int) -> dict[str, dict]:
+        shard_metrics = metrics.child(f"company {company_id}")
+        if retransform:
+            return retransform_shard(odoo, sources, company_id, today, created_by_id, progress, shard_metrics)
+        return run_shard(odoo, sources, company_id, today, created_by_id, progress, shard_metrics, window)
+
+    shards: dict[int, dict[str, dict]] = {}
+    errors: list[BaseException] = []
+    if len(companies) == 1:
+        shards[companies[0]] = shard(companies[0])
+    elif companies:
+        with ThreadPoolExecutor(max_workers=max(1, min(SHARD_WORKERS, len(companies))),
+                                thread_name_prefix="etl-shard") as pool:
+            futures = {company_id: pool.submit(shard, company_id) for company_id in companies}
+            for company_id, future in futures.items():
+                try:
+                    shards[company_id] = future.result()
+                except Exception as exc:
+                    errors.append(exc)
+    if errors:
+        raise errors[0]
+
+    results = _merge_results(shards, [source.key for source in sources])
+    if reconcile.RECONCILE and not retransform and companies:
+        with metrics.phase("reconcile"):
+            conn = get_connection()
+            try:
+                for source in sources:
+                    try:
+                        with conn.cursor() as cur:
+                            outcome = reconcile.reconcile_source(odoo, cur, source, companies, today, booked_amount(source))
+                    except Exception as exc:
+                        outcome = {"error": str(exc)[-500:]}
+                    results[source.key]["reconciliation"] = outcome
+                    print(f"Reconciliation of {source.etl_type}: "
+                          + (f"failed ({outcome['error']})" if "error" in outcome
+                             else f"{outcome['discrepancy_count']} of {outcome['groups']} groups differ"))
+            finally:
+                release_connection(conn)
+    for source in sources:
+        print(f"{'Retransform' if retransform else 'Insert'} completed: {source.etl_type}")
+        print(f"Successfully inserted {results[source.key]['records']} records ({source.key})")
+    return results
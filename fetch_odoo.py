@@ -1,30 +1,16 @@
 # file: fetch_invoices_xmlrpc.py
-import os
 from dotenv import load_dotenv
-import xmlrpc.client
-import ssl
+
+from etl_jobs.odoo_client import get_client
 
 load_dotenv()
 
-URL = os.getenv("ODOO_URL", "")
-DB = os.getenv("ODOO_DB", "")
-USER = os.getenv("ODOO_USERNAME", "")
-PASSWORD = os.getenv("ODOO_PASSWORD", "")
 COMPANY_ID = 1
 if COMPANY_ID:
     COMPANY_ID = int(COMPANY_ID)
 
-if not all([URL, DB, USER, PASSWORD]):
-    raise RuntimeError("Missing Odoo env vars. Check .env")
-context = ssl._create_unverified_context()
-
-# --- Authenticate ---
-common = xmlrpc.client.ServerProxy(f"{URL}/xmlrpc/2/common", context=context)
-uid = common.authenticate(DB, USER, PASSWORD, {})
-if not uid:
-    raise RuntimeError("Auth failed. Check creds")
-
-models = xmlrpc.client.ServerProxy(f"{URL}/xmlrpc/2/object")
+# --- Authenticate (cached uid, keep-alive transport) ---
+odoo = get_client()
 
 # --- Build a search domain ---
 domain = [
@@ -43,32 +29,10 @@ fields = [
    
 ]
 
-# --- Query IDs (with pagination) ---
-limit = 50
-offset = 0
-all_invoices = []
-
-while True:
-    ids = models.execute_kw(
-        DB, uid, PASSWORD,
-        "account.move", "search",
-        [domain],
-        {"limit": limit, "offset": offset, "order": "invoice_date desc, id desc"}
-    )
-    if not ids:
-        break
-
-    # Read records
-    records = models.execute_kw(
-        DB, uid, PASSWORD,
-        "account.move", "read",
-        [ids],
-        {"fields": fields}
-    )
-    all_invoices.extend(records)
-    if len(ids) < limit:
-        break
-    offset += limit
+# --- Query records (one search_read per page) ---
+all_invoices = odoo.search_read_all(
+    "account.move", domain, fields, order="invoice_date desc, id desc", page_size=50
+)
 
 # --- Minimal printout ---
 for inv in all_invoices:
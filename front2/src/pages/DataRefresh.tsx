@@ -1,7 +1,14 @@
 import { useState, useEffect, useRef } from 'react'
-import { Card, Title, Text, Button, ProgressBar, Badge, Flex, Icon } from '@tremor/react'
+import { Card, Title, Text, Button, ProgressBar, Badge, Flex, Icon, MultiSelect, MultiSelectItem } from '@tremor/react'
 import { RefreshCw, CheckCircle2, XCircle, Clock, AlertTriangle, Database } from 'lucide-react'
-import { dataRefreshApi, type DataRefreshExecution, type DataRefreshStatus } from '@/services/api'
+import {
+  dataRefreshApi,
+  companiesApi,
+  type DataRefreshExecution,
+  type DataRefreshSource,
+  type DataRefreshStatus,
+} from '@/services/api'
+import type { Company } from '@/types'
 import { useAuthStore } from '@/store/authStore'
 
 export default function DataRefresh() {
@@ -9,7 +16,15 @@ export default function DataRefresh() {
   const [status, setStatus] = useState<DataRefreshStatus | null>(null)
   const [history, setHistory] = useState<DataRefreshExecution[]>([])
   const [isStarting, setIsStarting] = useState(false)
+  const [cancellingId, setCancellingId] = useState<number | null>(null)
   const [error, setError] = useState<string | null>(null)
+  // Scope of the next refresh (empty: everything)
+  const [sources, setSources] = useState<DataRefreshSource[]>([])
+  const [companies, setCompanies] = useState<Company[]>([])
+  const [selectedSources, setSelectedSources] = useState<string[]>([])
+  const [selectedCompanies, setSelectedCompanies] = useState<string[]>([])
+  const [dateFrom, setDateFrom] = useState('')
+  const [dateTo, setDateTo] = useState('')
   const wsRef = useRef<WebSocket | null>(null)
 
   const isAdmin = user?.role === 'Admin'
@@ -20,6 +35,17 @@ export default function DataRefresh() {
     fetchHistory()
   }, [])
 
+  // Fetch what a refresh can be restricted to
+  useEffect(() => {
+    if (!isAdmin) return
+    Promise.all([dataRefreshApi.getSources(), companiesApi.getAll()])
+      .then(([sourcesResponse, companiesResponse]) => {
+        setSources(sourcesResponse.data)
+        setCompanies(companiesResponse.data)
+      })
+      .catch((err) => console.error('Failed to fetch refresh scope options:', err))
+  }, [isAdmin])
+
   // Setup WebSocket connection for real-time updates
   useEffect(() => {
     const wsUrl = import.meta.env.VITE_WS_URL || 'ws://localhost:8000/api/data-refresh/ws'
@@ -36,7 +62,7 @@ export default function DataRefresh() {
       if (message.type === 'progress' || message.type === 'started') {
         // Update current execution status
         fetchStatus()
-      } else if (message.type === 'complete' || message.type === 'error') {
+      } else if (message.type === 'complete' || message.type === 'error' || message.type === 'cancelled') {
         // Refresh both status and history
         fetchStatus()
         fetchHistory()
@@ -89,7 +115,12 @@ export default function DataRefresh() {
     setError(null)
     
     try {
-      await dataRefreshApi.start()
+      await dataRefreshApi.start({
+        sources: selectedSources.length ? selectedSources : undefined,
+        companyIds: selectedCompanies.length ? selectedCompanies.map(Number) : undefined,
+        dateFrom: dateFrom || undefined,
+        dateTo: dateTo || undefined,
+      })
       // Status will be updated via WebSocket
       await fetchStatus()
     } catch (err: any) {
@@ -100,6 +131,22 @@ export default function DataRefresh() {
     }
   }
 
+  const handleCancelRefresh = async (executionId: number) => {
+    setCancellingId(executionId)
+    setError(null)
+
+    try {
+      await dataRefreshApi.cancel(executionId)
+      await fetchStatus()
+      await fetchHistory()
+    } catch (err: any) {
+      const errorMessage = err.response?.data?.detail || 'Failed to cancel data refresh'
+      setError(errorMessage)
+    } finally {
+      setCancellingId(null)
+    }
+  }
+
   const formatDuration = (seconds?: number) => {
     if (!seconds) return 'N/A'
     if (seconds < 60) return `${seconds}s`
@@ -134,7 +181,24 @@ export default function DataRefresh() {
     }
   }
 
-  const currentExecution = status?.currentExecution
+  const runningExecutions = status?.runningExecutions ?? []
+
+  const describeScope = (execution: DataRefreshExecution) => {
+    const parts = [
+      execution.sources
+        ? execution.sources.map((key) => sources.find((source) => source.key === key)?.name ?? key).join(', ')
+        : 'Toutes les sources',
+    ]
+    if (execution.scope?.companies) {
+      parts.push(execution.scope.companies
+        .map((id) => companies.find((company) => Number(company.id) === id)?.name ?? `Société ${id}`)
+        .join(', '))
+    }
+    if (execution.scope?.dateFrom || execution.scope?.dateTo) {
+      parts.push(`Factures du ${execution.scope.dateFrom ?? '…'} au ${execution.scope.dateTo ?? '…'}`)
+    }
+    return parts.join(' • ')
+  }
 
   return (
     <div className="space-y-6 p-6">
@@ -170,17 +234,69 @@ export default function DataRefresh() {
             {isAdmin && (
               <Button
                 onClick={handleStartRefresh}
-                disabled={isStarting || status?.isRunning}
+                disabled={isStarting}
                 loading={isStarting}
                 icon={RefreshCw}
                 variant="primary"
                 className="bg-blue-600 hover:bg-blue-700 text-white"
               >
-                {status?.isRunning ? 'Actualisation en cours...' : 'Actualiser les Données'}
+                Actualiser les Données
               </Button>
             )}
           </div>
 
+          {/* Scope of the next refresh: sources already being refreshed are refused by the API */}
+          {isAdmin && (
+            <div className="grid grid-cols-1 md:grid-cols-4 gap-4">
+              <div>
+                <Text className="mb-1">Sources</Text>
+                <MultiSelect
+                  value={selectedSources}
+                  onValueChange={setSelectedSources}
+                  placeholder="Toutes les sources"
+                >
+                  {sources.map((source) => (
+                    <MultiSelectItem key={source.key} value={source.key}>
+                      {source.name}
+                    </MultiSelectItem>
+                  ))}
+                </MultiSelect>
+              </div>
+              <div>
+                <Text className="mb-1">Sociétés</Text>
+                <MultiSelect
+                  value={selectedCompanies}
+                  onValueChange={setSelectedCompanies}
+                  placeholder="Toutes les sociétés"
+                >
+                  {companies.map((company) => (
+                    <MultiSelectItem key={company.id} value={String(company.id)}>
+                      {company.name}
+                    </MultiSelectItem>
+                  ))}
+                </MultiSelect>
+              </div>
+              <div>
+                <Text className="mb-1">Factures du</Text>
+                <input
+                  type="date"
+                  value={dateFrom}
+                  onChange={(e) => setDateFrom(e.target.value)}
+                  className="w-full px-3 py-2 border border-gray-300 rounded-md"
+                />
+              </div>
+              <div>
+                <Text className="mb-1">Au</Text>
+                <input
+                  type="date"
+                  value={dateTo}
+                  onChange={(e) => setDateTo(e.target.value)}
+                  className="w-full px-3 py-2 border border-gray-300 rounded-md"
+                />
+              </div>
+            </div>
+          )}
+
           {error && (
             <div className="bg-red-50 border border-red-300 rounded-lg p-4">
               <Flex className="items-start gap-3">
@@ -198,88 +314,105 @@ export default function DataRefresh() {
             </div>
           )}
 
-          {currentExecution ? (
-            <div className="space-y-4">
-              <Flex>
-                <div>
-                  {getStatusBadge(currentExecution.status)}
-                </div>
-                <Text className="text-gray-600">
-                  Démarré par {currentExecution.startedBy} le {formatDate(currentExecution.startedAt)}
-                </Text>
-              </Flex>
-
-              {currentExecution.status === 'running' && (
-                <>
-                  <div>
-                    <Flex>
-                      <Text className="font-medium">{currentExecution.currentStep || 'Traitement en cours...'}</Text>
-                      <Text className="text-gray-600">{currentExecution.progressPercentage}%</Text>
-                    </Flex>
-                    <ProgressBar value={currentExecution.progressPercentage} color="blue" className="mt-2" />
-                  </div>
-                </>
-              )}
-
-              {currentExecution.status === 'completed' && (
-                <div className="bg-green-50 border border-green-300 rounded-lg p-4">
-                  <Flex className="items-start gap-3">
-                    <CheckCircle2 className="h-6 w-6 text-green-600 flex-shrink-0" />
-                    <div className="flex-1">
-                      <Text className="font-semibold text-green-900 text-base">Actualisation Terminée avec Succès</Text>
-                      <Text className="text-green-800 font-medium mt-1">
-                        {currentExecution.totalRecordsProcessed.toLocaleString()} enregistrements traités en {formatDuration(currentExecution.durationSeconds)}
-                      </Text>
+          {runningExecutions.length > 0 ? (
+            <div className="space-y-4 divide-y divide-gray-200">
+              {runningExecutions.map((execution) => (
+                <div key={execution.executionId} className="space-y-4 pt-4 first:pt-0">
+                  <Flex>
+                    <div>
+                      {getStatusBadge(execution.status)}
                     </div>
+                    <Text className="text-gray-600">
+                      Démarré par {execution.startedBy} le {formatDate(execution.startedAt)}
+                    </Text>
                   </Flex>
-                </div>
-              )}
+                  <Text className="text-gray-600 text-sm">{describeScope(execution)}</Text>
 
-              {currentExecution.status === 'failed' && (
-                <div className="bg-red-50 border border-red-300 rounded-lg p-4">
-                  <Flex className="items-start gap-3">
-                    <XCircle className="h-6 w-6 text-red-600 flex-shrink-0" />
-                    <div className="flex-1">
-                      <Text className="font-semibold text-red-900 text-base">Échec de l'Actualisation</Text>
-                      {currentExecution.errorMessage && (
-                        <Text className="text-red-800 font-medium mt-1">{currentExecution.errorMessage}</Text>
+                  {execution.status === 'running' && (
+                    <>
+                      <div>
+                        <Flex>
+                          <Text className="font-medium">{execution.currentStep || 'Traitement en cours...'}</Text>
+                          <Text className="text-gray-600">{execution.progressPercentage}%</Text>
+                        </Flex>
+                        <ProgressBar value={execution.progressPercentage} color="blue" className="mt-2" />
+                      </div>
+                      {isAdmin && (
+                        <Button
+                          onClick={() => handleCancelRefresh(execution.executionId)}
+                          disabled={cancellingId !== null}
+                          loading={cancellingId === execution.executionId}
+                          icon={XCircle}
+                          variant="secondary"
+                          color="red"
+                        >
+                          Annuler l'actualisation
+                        </Button>
                       )}
+                    </>
+                  )}
+
+                  {execution.status === 'completed' && (
+                    <div className="bg-green-50 border border-green-300 rounded-lg p-4">
+                      <Flex className="items-start gap-3">
+                        <CheckCircle2 className="h-6 w-6 text-green-600 flex-shrink-0" />
+                        <div className="flex-1">
+                          <Text className="font-semibold text-green-900 text-base">Actualisation Terminée avec Succès</Text>
+                          <Text className="text-green-800 font-medium mt-1">
+                            {execution.totalRecordsProcessed.toLocaleString()} enregistrements traités en {formatDuration(execution.durationSeconds)}
+                          </Text>
+                        </div>
+                      </Flex>
                     </div>
-                  </Flex>
-                </div>
-              )}
+                  )}
 
-              {/* Job Details */}
-              {currentExecution.details?.jobs && (
-                <div className="mt-4">
-                  <Text className="font-semibold mb-2">Sources de Données</Text>
-                  <div className="space-y-2">
-                    {currentExecution.details.jobs.map((job: any, index: number) => (
-                      <div key={index} className="flex items-center justify-between p-3 bg-gray-50 rounded-lg">
-                        <div className="flex items-center gap-3">
-                          <Icon icon={Database} size="sm" />
-                          <div>
-                            <Text className="font-medium">{job.name}</Text>
-                            {job.success && (
-                              <Text className="text-gray-600 text-sm">
-                                {job.records.toLocaleString()} enregistrements • {formatDuration(Math.round(job.duration))}
-                              </Text>
-                            )}
-                            {!job.success && job.error && (
-                              <Text className="text-red-600 text-sm">{job.error.substring(0, 100)}...</Text>
+                  {execution.status === 'failed' && (
+                    <div className="bg-red-50 border border-red-300 rounded-lg p-4">
+                      <Flex className="items-start gap-3">
+                        <XCircle className="h-6 w-6 text-red-600 flex-shrink-0" />
+                        <div className="flex-1">
+                          <Text className="font-semibold text-red-900 text-base">Échec de l'Actualisation</Text>
+                          {execution.errorMessage && (
+                            <Text className="text-red-800 font-medium mt-1">{execution.errorMessage}</Text>
+                          )}
+                        </div>
+                      </Flex>
+                    </div>
+                  )}
+
+                  {/* Job Details */}
+                  {execution.details?.jobs && (
+                    <div className="mt-4">
+                      <Text className="font-semibold mb-2">Sources de Données</Text>
+                      <div className="space-y-2">
+                        {execution.details.jobs.map((job: any, index: number) => (
+                          <div key={index} className="flex items-center justify-between p-3 bg-gray-50 rounded-lg">
+                            <div className="flex items-center gap-3">
+                              <Icon icon={Database} size="sm" />
+                              <div>
+                                <Text className="font-medium">{job.name}</Text>
+                                {job.success && (
+                                  <Text className="text-gray-600 text-sm">
+                                    {job.records.toLocaleString()} enregistrements • {formatDuration(Math.round(job.duration))}
+                                  </Text>
+                                )}
+                                {!job.success && job.error && (
+                                  <Text className="text-red-600 text-sm">{job.error.substring(0, 100)}...</Text>
+                                )}
+                              </div>
+                            </div>
+                            {job.success ? (
+                              <Icon icon={CheckCircle2} color="green" />
+                            ) : (
+                              <Icon icon={XCircle} color="red" />
                             )}
                           </div>
-                        </div>
-                        {job.success ? (
-                          <Icon icon={CheckCircle2} color="green" />
-                        ) : (
-                          <Icon icon={XCircle} color="red" />
-                        )}
+                        ))}
                       </div>
-                    ))}
-                  </div>
+                    </div>
+                  )}
                 </div>
-              )}
+              ))}
             </div>
           ) : (
             <div className="text-center py-8">
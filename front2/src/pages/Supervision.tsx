@@ -94,6 +94,8 @@ export function Supervision() {
         return 'Suppression'
       case 'refresh':
         return 'Actualisation'
+      case 'cancel':
+        return 'Annulation'
       default:
         return actionType
     }
@@ -172,17 +172,39 @@ export interface DataRefreshExecution {
   progressPercentage: number
   currentStep?: string
   details?: any
+  metrics?: any
+  trigger: 'manual' | 'schedule' | 'probe'
+  sources?: string[]  // undefined: all sources
+  scope?: { companies?: number[]; dateFrom?: string; dateTo?: string }
 }
 
 export interface DataRefreshStatus {
   isRunning: boolean
-  currentExecution?: DataRefreshExecution
+  currentExecution?: DataRefreshExecution  // Latest started of runningExecutions
+  runningExecutions: DataRefreshExecution[]
+}
+
+export interface DataRefreshSource {
+  key: string
+  name: string
+  description: string
+}
+
+export interface DataRefreshStartRequest {
+  sources?: string[]  // Source keys, undefined: all
+  companyIds?: number[]  // undefined: every company
+  dateFrom?: string  // Invoice date window (YYYY-MM-DD, inclusive)
+  dateTo?: string
 }
 
 export const dataRefreshApi = {
-  start: () => api.post<{ message: string; executionId: number; status: string }>('/data-refresh/start'),
+  start: (request: DataRefreshStartRequest = {}) =>
+    api.post<{ message: string; executionId: number; status: string }>('/data-refresh/start', request),
   getStatus: () => api.get<DataRefreshStatus>('/data-refresh/status'),
+  getSources: () => api.get<DataRefreshSource[]>('/data-refresh/sources'),
   getHistory: (limit = 20) => api.get<DataRefreshExecution[]>('/data-refresh/history', { params: { limit } }),
+  cancel: (executionId: number) =>
+    api.post<{ message: string; executionId: number; status: string }>(`/data-refresh/${executionId}/cancel`),
 }
 
 // Supervision
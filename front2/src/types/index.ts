@@ -47,6 +47,9 @@ export interface FinancialMovement {
   deactivatedAt?: string
   deactivationReason?: string
   excludeFromAnalytics: boolean
+  exchangeRate?: number
+  currency?: string
+  amountCurrency?: number
 }
 
 export interface ManualEntry {
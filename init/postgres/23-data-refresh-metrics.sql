@@ -0,0 +1,4 @@
+-- Per-phase ETL metrics of each data refresh (wall / CPU seconds, memory), per job
+-- and for the whole execution; written by backend/app/routers/data_refresh.py
+
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS metrics jsonb;
@@ -0,0 +1,9 @@
+-- Resumable extraction: last checkpoint of each ETL scan still in progress,
+-- written and read by etl_jobs/treasury_etl.py (see etl_jobs/sync_state.py)
+
+CREATE TABLE IF NOT EXISTS etl_scan_cursor (
+    job VARCHAR(200) PRIMARY KEY,                 -- Sources and company of the scan, e.g. 'achat_importation+ventes_locales / company 1'
+    fingerprint VARCHAR(64) NOT NULL,             -- Hash of the scan's plan: a checkpoint only resumes an identical scan
+    position JSONB NOT NULL,                      -- Keyset ranges still to read, per-source watermarks and staged row counts
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
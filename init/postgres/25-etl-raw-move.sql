@@ -0,0 +1,15 @@
+-- Raw landing zone: the Odoo account.move records each ETL source was last built
+-- from (JSONB payloads as fetched), kept by etl_jobs/loader.py so movements and
+-- exceptions can be rebuilt without Odoo (retransform, see etl_jobs/treasury_etl.py)
+
+CREATE TABLE IF NOT EXISTS etl_raw_move (
+    etl_type VARCHAR(100) NOT NULL,               -- ETL type of the source, e.g. 'Ventes locales'
+    company_id INTEGER,                           -- Odoo company of the record
+    odoo_id INTEGER NOT NULL,                     -- Odoo account.move id
+    write_date TIMESTAMP,                         -- Odoo write_date of the payload
+    payload JSONB NOT NULL,                       -- Fields read by the scan, as returned by Odoo
+    fetched_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (etl_type, odoo_id)
+);
+
+CREATE INDEX IF NOT EXISTS ix_etl_raw_move_company ON etl_raw_move (etl_type, company_id);
@@ -0,0 +1,23 @@
+-- Local copy of the Odoo res.currency.rate history (etl_jobs/currency_rates.py),
+-- looked up as of each record's date instead of calling Odoo per record, and the
+-- currency each company keeps its books in
+
+CREATE TABLE IF NOT EXISTS currency_rate (
+    odoo_id INTEGER PRIMARY KEY,                  -- Odoo res.currency.rate id
+    currency VARCHAR(3) NOT NULL,                 -- ISO code, e.g. 'USD'
+    company_id INTEGER,                           -- Odoo company, NULL for a rate shared by all companies
+    rate_date DATE NOT NULL,                      -- First day the rate applies
+    rate NUMERIC(24,12) NOT NULL,                 -- Odoo rate: currency units per company-currency unit
+    write_date TIMESTAMP                          -- Odoo write_date, for the incremental fetch
+);
+
+CREATE INDEX IF NOT EXISTS ix_currency_rate_lookup ON currency_rate (currency, company_id, rate_date);
+
+ALTER TABLE company ADD COLUMN IF NOT EXISTS currency VARCHAR(3);
+
+ALTER TABLE movement
+    ADD COLUMN IF NOT EXISTS currency VARCHAR(3),
+    ADD COLUMN IF NOT EXISTS amount_currency NUMERIC(18,2);
+
+COMMENT ON COLUMN movement.currency IS 'Devise d''origine de la pièce Odoo (achats d''importation)';
+COMMENT ON COLUMN movement.amount_currency IS 'Reste à payer dans la devise d''origine, avant conversion par exchange_rate';
@@ -0,0 +1,11 @@
+-- Data refreshes started by the scheduler (backend/app/refresh_scheduler.py): no
+-- user, the trigger that started them and the sources they refreshed
+
+ALTER TABLE data_refresh_execution ALTER COLUMN started_by DROP NOT NULL;
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS trigger VARCHAR(20) NOT NULL DEFAULT 'manual';
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS sources jsonb;  -- Source keys, NULL: all
+ALTER TABLE data_refresh_execution DROP CONSTRAINT IF EXISTS ck_data_refresh_trigger;
+ALTER TABLE data_refresh_execution ADD CONSTRAINT ck_data_refresh_trigger
+    CHECK (trigger IN ('manual', 'schedule', 'probe'));
+
+COMMENT ON COLUMN data_refresh_execution.trigger IS 'manual (an admin), schedule (source cadence) or probe (upstream change)';
@@ -0,0 +1,11 @@
+-- Selective data refreshes (backend/app/routers/data_refresh.py): the companies and
+-- invoice date window an execution was scoped to, and one lock per source so that
+-- refreshes of different sources may run concurrently
+
+ALTER TABLE data_refresh_execution ADD COLUMN IF NOT EXISTS scope jsonb;  -- {companies, dateFrom, dateTo}, NULL: everything
+
+CREATE TABLE IF NOT EXISTS data_refresh_source_lock (
+    source VARCHAR(50) PRIMARY KEY,               -- ETL job key, e.g. 'achat_importation'
+    execution_id INTEGER NOT NULL REFERENCES data_refresh_execution(execution_id) ON DELETE CASCADE,
+    locked_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
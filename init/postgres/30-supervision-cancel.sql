@@ -0,0 +1,7 @@
+-- Cancelled data refreshes are logged with action 'cancel'
+-- (POST /data-refresh/{id}/cancel, backend/app/routers/data_refresh.py)
+
+ALTER TABLE supervision_log DROP CONSTRAINT IF EXISTS ck_supervision_action;
+ALTER TABLE supervision_log ADD CONSTRAINT ck_supervision_action CHECK (
+    action IN ('include', 'exclude', 'insert', 'update', 'delete', 'refresh', 'create', 'modify', 'cancel')
+);
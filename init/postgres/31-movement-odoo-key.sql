@@ -0,0 +1,33 @@
+-- Odoo identity of the ETL rows (etl_jobs/loader.py). The merge matches movements
+-- on (company_id, reference_type, odoo_id, installment, archive_version) and
+-- exceptions on (company_id, type, reference_type, odoo_id): an invoice renamed in
+-- Odoo (a draft "/" posted as "BILL/...") keeps its rows, only its reference changes
+
+ALTER TABLE movement
+    ADD COLUMN IF NOT EXISTS odoo_id INTEGER,
+    ADD COLUMN IF NOT EXISTS installment SMALLINT NOT NULL DEFAULT 1;
+
+ALTER TABLE "Exception" ADD COLUMN IF NOT EXISTS odoo_id INTEGER;
+
+COMMENT ON COLUMN movement.odoo_id IS 'Id Odoo de la pièce (account.move), NULL pour les saisies manuelles';
+COMMENT ON COLUMN movement.installment IS 'Numéro de l''échéance de la pièce (1 sans échéancier)';
+
+-- Rows loaded before: references end with " (ID:<id>)", installments are "<name> <k>/<n> (ID:<id>)"
+UPDATE movement
+SET odoo_id = substring(reference from '\(ID:(\d+)\)$')::int,
+    installment = coalesce(substring(reference from ' (\d+)/\d+ \(ID:\d+\)$')::int, 1)
+WHERE source = 'Odoo' AND odoo_id IS NULL;
+
+UPDATE "Exception"
+SET odoo_id = substring(reference from '\(ID:(\d+)\)$')::int
+WHERE odoo_id IS NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS ux_movement_odoo
+ON movement (company_id, reference_type, odoo_id, installment, archive_version)
+WHERE odoo_id IS NOT NULL;
+
+CREATE INDEX IF NOT EXISTS ix_exception_type_odoo
+ON "Exception" (type, company_id, reference_type, odoo_id);
+
+-- Replaces the reference lookup index the merge used before matching on odoo_id
+DROP INDEX IF EXISTS ix_exception_type_reference;
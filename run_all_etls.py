@@ -23,21 +23,13 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ETL configurations - now using DB upsert scripts
+# Achat Importation, Ventes Locales and Achats Locaux avec Échéance share one
+# account.move extraction, routed in-process to each source
 ETL_SCRIPTS = [
     {
-        'name': 'Achat Importation',
-        'script': 'etl_jobs/achat_importation_upsert.py',
-        'description': 'Import purchases (invoices starting with CE)'
-    },
-    {
-        'name': 'Ventes Locales',
-        'script': 'etl_jobs/ventes_locales_upsert.py',
-        'description': 'Local sales'
-    },
-    {
-        'name': 'Achats Locaux avec Échéance',
-        'script': 'etl_jobs/achats_locaux_echeance_upsert.py',
-        'description': 'Local purchases with due dates'
+        'name': 'Treasury sources (Achat Importation, Ventes Locales, Achats Locaux avec Échéance)',
+        'script': 'etl_jobs/account_move_upsert.py',
+        'description': 'Single Odoo invoice extraction feeding import purchases, local sales and local purchases'
     }
 ]
 